@@ -1,14 +1,45 @@
 #!/usr/bin/env python3
-import gi
-gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk, GLib
+try:
+    import gi
+    gi.require_version('Gtk', '3.0')
+    from gi.repository import Gtk, GLib
+except (ImportError, ValueError):
+    # --tui works without GTK
+    Gtk = GLib = None
+import argparse
 import subprocess
-import re
 from datetime import datetime
 import os
+import shlex
+import sys
+import time
+
+from g14 import capture, instrument
+from g14.cadence import AdaptiveInterval
+from g14.debuglog import DebugLog
+from g14.events import EventSource, NOTIFYING
+from g14.helper import HelperClient, HelperError
+from g14.history import History, FIELDS
+from g14.procs import ProcSampler, format_top
+from g14.recorder import PreTriggerRecorder
+from g14.sampler import Sampler, POLICY_VALUES
+from g14.shm import SnapshotReader
+from g14.view import StatusView
+from g14.workers import BackgroundJobs
 
 DEBUG_LOG = os.path.expanduser("~/g14-debug.log")
 
+# A spin-up is a rise of 30+ PWM (roughly 12%) over this many seconds
+SPINUP_WINDOW = 10.0
+
+# Seconds of process, temperature and power history logged with a spin-up
+PRETRIGGER_WINDOW = 30.0
+
+# Milliseconds from an event to the refresh, time for the daemon to react
+# and publish its snapshot
+EVENT_REFRESH_MS = 150
+
+
 class G14Monitor:
     def __init__(self):
         # Use StatusIcon instead of AppIndicator for Cinnamon compatibility
@@ -18,10 +49,32 @@ class G14Monitor:
         self.status_icon.connect("popup-menu", self.on_popup_menu)
         self.status_icon.connect("activate", self.on_activate)
 
-        # Track PWM for spin-up detection
-        self.last_pwm_cpu = None
+        # Recent readings for spin-up detection, sparklines and captures
+        self.history = History(windows=(SPINUP_WINDOW, 60.0, 300.0))
         self.last_logged_time = None
 
+        # Latest readings, shared by every consumer until the next tick
+        self.snapshot = None
+
+        # Slow collectors (ps, sensors, file writes) run off the main loop
+        self.jobs = BackgroundJobs(GLib.idle_add)
+        self.tick_ms = None
+        self.tick_ms_max = 0.0
+
+        # Sysfs paths are probed once, readers and fan curves stay open.
+        # Snapshots come from the daemon's shared memory while it publishes.
+        self.sampler = Sampler(shared=SnapshotReader())
+        self.paths = self.sampler.paths
+        self.curves = self.sampler.curves
+        self.procs = ProcSampler(os.path.join(self.paths.root, 'proc'))
+
+        # Root helper for policy and GPU writes, sudo tee when it isn't running
+        self.helper = HelperClient()
+
+        # Per-process CPU for the window before a spin-up, sampled in the background
+        self.recorder = PreTriggerRecorder(self.procs, window=PRETRIGGER_WINDOW)
+        self.recorder.start()
+
         # Create menu
         self.menu = Gtk.Menu()
 
@@ -43,6 +96,16 @@ class G14Monitor:
         self.menu.append(self.power_item)
         self.menu.append(self.gpu_item)
         self.menu.append(self.policy_item)
+
+        # Labels and tooltip are only handed to GTK when their text changes
+        self.view = StatusView(self.status_icon.set_tooltip_text, {
+            'temp': self.temp_item.set_label,
+            'pwm_cpu': self.pwm_cpu_item.set_label,
+            'pwm_gpu': self.pwm_gpu_item.set_label,
+            'power': self.power_item.set_label,
+            'gpu': self.gpu_item.set_label,
+            'policy': self.policy_item.set_label,
+        })
         
         # Separator
         self.menu.append(Gtk.SeparatorMenuItem())
@@ -67,6 +130,12 @@ class G14Monitor:
         clear_log_item = Gtk.MenuItem(label="🗑️  Clear Debug Log")
         clear_log_item.connect("activate", self.clear_debug_log)
         self.menu.append(clear_log_item)
+
+        # Collector timings and errors, filled in each time the menu opens
+        diagnostics_item = Gtk.MenuItem(label="🩺 Diagnostics")
+        self.diagnostics_menu = Gtk.Menu()
+        diagnostics_item.set_submenu(self.diagnostics_menu)
+        self.menu.append(diagnostics_item)
         
         # Separator
         self.menu.append(Gtk.SeparatorMenuItem())
@@ -93,216 +162,232 @@ class G14Monitor:
         # Initialize debug log
         self.init_debug_log()
         
-        # Update every 2 seconds
-        GLib.timeout_add_seconds(2, self.update_status)
+        # Sample on an adaptive cadence, faster while the menu is open
+        self.menu_open = False
+        self.menu.connect("show", self.on_menu_shown)
+        self.menu.connect("hide", self.on_menu_hidden)
+        self.cadence = AdaptiveInterval()
+        self.timeout_id = None
+        self.scheduled_interval = None
         self.update_status()
+        self.schedule_update(self.cadence.interval)
+
+        # Profile changes, AC plug events and dGPU wakes refresh straight away
+        # instead of on the next tick. The runtime PM status never notifies,
+        # so it is compared on each tick, other polled attributes are left to
+        # the sampler.
+        self.event_refresh_id = None
+        try:
+            self.events = EventSource(self.paths, watch=NOTIFYING + ('gpu_runtime_status',))
+        except OSError:
+            self.events = None
+        else:
+            GLib.io_add_watch(self.events.fileno(), GLib.PRIORITY_DEFAULT, GLib.IO_IN,
+                              self.on_events)
+
+    def schedule_update(self, interval):
+        """(Re)arm the update timeout to fire every interval seconds"""
+        if self.timeout_id is not None:
+            GLib.source_remove(self.timeout_id)
+        if interval >= 1 and interval == int(interval):
+            # Whole seconds let GLib batch our wakeups with other timers
+            self.timeout_id = GLib.timeout_add_seconds(int(interval), self.on_tick)
+        else:
+            self.timeout_id = GLib.timeout_add(int(interval * 1000), self.on_tick)
+        self.scheduled_interval = interval
+
+    def on_tick(self):
+        """Sample, then keep or replace the timeout to match the new interval"""
+        if self.events is not None:
+            self.changed(self.events.poll())
+        self.update_status()
+        snapshot = self.snapshot
+        interval = self.cadence.update(snapshot.temp, snapshot.pwm_cpu,
+                                       time.monotonic(), active=self.menu_open)
+        if interval == self.scheduled_interval:
+            return True
+        # This source is removed by returning False
+        self.timeout_id = None
+        self.schedule_update(interval)
+        return False
+
+    def on_events(self, fd, condition):
+        self.changed(self.events.read())
+        return True
+
+    def changed(self, names):
+        """Invalidate what changed and refresh once the daemon has reacted"""
+        if not names:
+            return
+        for name in names:
+            self.sampler.registry.invalidate(name)
+        if self.event_refresh_id is None:
+            self.event_refresh_id = GLib.timeout_add(EVENT_REFRESH_MS, self.on_event_refresh)
+
+    def on_event_refresh(self):
+        self.event_refresh_id = None
+        self.update_status()
+        self.schedule_update(self.cadence.reset())
+        return False
+
+    def on_menu_shown(self, menu):
+        """Refresh immediately and stop backing off while the menu is open"""
+        self.menu_open = True
+        self.update_status()
+        self.update_diagnostics()
+        self.schedule_update(self.cadence.reset())
+
+    def update_diagnostics(self):
+        """Rebuild the Diagnostics submenu from the instrumentation probes"""
+        for child in self.diagnostics_menu.get_children():
+            self.diagnostics_menu.remove(child)
+        for line in instrument.report():
+            self.diagnostics_menu.append(Gtk.MenuItem(label=line.strip()))
+        if self.tick_ms is not None:
+            self.diagnostics_menu.append(Gtk.MenuItem(
+                label=f"update_status: {self.tick_ms:.2f}ms (max {self.tick_ms_max:.2f}ms)"))
+        self.diagnostics_menu.append(Gtk.MenuItem(
+            label=f"GTK labels: {self.view.updates} set, {self.view.unchanged} unchanged"))
+        if self.events is not None:
+            self.diagnostics_menu.append(Gtk.MenuItem(
+                label=f"Events: {self.events.notifications} notifications, "
+                      f"{self.events.uevent_count} uevents"))
+        self.diagnostics_menu.show_all()
+
+    def on_menu_hidden(self, menu):
+        self.menu_open = False
 
     def on_activate(self, icon):
         """Show menu when status icon is left-clicked"""
+        # Labels aren't kept up to date while the menu is closed
+        self.view.render_menu()
         self.menu.popup(None, None, None, None, 0, Gtk.get_current_event_time())
 
     def on_popup_menu(self, icon, button, time):
         """Show menu when status icon is right-clicked"""
+        self.view.render_menu()
         self.menu.popup(None, None, None, None, button, time)
     
     def init_debug_log(self):
         """Initialize debug log file"""
-        with open(DEBUG_LOG, 'a') as f:
-            f.write(f"\n{'='*80}\n")
-            f.write(f"G14 Monitor Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"{'='*80}\n\n")
+        # Written and rotated by a background thread, never blocks the UI
+        self.debug_log = DebugLog(DEBUG_LOG)
+        self.debug_log.write(
+            f"\n{'='*80}\n"
+            f"G14 Monitor Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"{'='*80}\n\n"
+        )
     
     def log_debug(self, event, details):
         """Log debug information"""
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        with open(DEBUG_LOG, 'a') as f:
-            f.write(f"[{timestamp}] {event}\n")
-            for key, value in details.items():
-                f.write(f"  {key}: {value}\n")
-            f.write("\n")
+        lines = [f"[{timestamp}] {event}\n"]
+        for key, value in details.items():
+            lines.append(f"  {key}: {value}\n")
+        lines.append("\n")
+        self.debug_log.write(''.join(lines))
     
-    def detect_pwm_change(self, current_pwm):
+    def collect_snapshot(self):
+        """Read every sensor once and return a Snapshot"""
+        return self.sampler.sample()
+
+    def detect_pwm_change(self, snapshot):
         """Detect and log significant PWM increases"""
+        current_pwm = snapshot.pwm_cpu
         if current_pwm is None:
             return
 
-        if self.last_pwm_cpu is None:
-            self.last_pwm_cpu = current_pwm
-            return
-
-        # Detect spin-up (increase of 30+ PWM, roughly 12%)
-        if current_pwm - self.last_pwm_cpu >= 30:
+        # Detect spin-up (increase of 30+ PWM, roughly 12%) against the
+        # lowest PWM in the window, so ramps split over ticks are caught
+        lowest = self.history.rolling('pwm_cpu', SPINUP_WINDOW).min
+        if lowest is not None and current_pwm - lowest >= 30:
             # Don't log too frequently (at most every 30 seconds)
-            now = datetime.now()
+            now = snapshot.time
             if self.last_logged_time is None or (now - self.last_logged_time).seconds >= 30:
-                self.log_fan_event("FAN SPIN-UP DETECTED", current_pwm)
+                self.log_fan_event("FAN SPIN-UP DETECTED", snapshot)
                 self.last_logged_time = now
-
-        self.last_pwm_cpu = current_pwm
     
-    def log_fan_event(self, event_type, pwm_value):
+    def log_fan_event(self, event_type, snapshot):
         """Log detailed system state during fan event"""
-        temp = self.get_temp()
-        power = self.get_power_draw()
-        gpu_status = self.get_gpu_status()
-        gpu_control = self.get_gpu_control()
-        policy = self.get_policy()
-        platform = self.get_platform_profile()
-        boost = self.get_cpu_boost()
-        pwm_cpu = self.get_pwm_cpu()
-        pwm_gpu = self.get_pwm_gpu()
+        pwm_cpu = snapshot.pwm_cpu
+        pwm_gpu = snapshot.pwm_gpu
 
-        # Get top CPU processes
-        top_procs = self.get_top_processes()
+        # Trend leading up to the event, from history rather than hardware
+        pwm_before = self.history.rolling('pwm_cpu', SPINUP_WINDOW).min
+        temps = self.history.rolling('temp', 60.0)
 
         details = {
             "Event": event_type,
             "CPU PWM": f"{pwm_cpu}/255 ({pwm_cpu*100//255}%)" if pwm_cpu is not None else "N/A",
             "GPU PWM": f"{pwm_gpu}/255 ({pwm_gpu*100//255}%)" if pwm_gpu is not None else "N/A",
-            "CPU Temp": f"{temp}°C" if temp else "N/A",
-            "Power Draw": f"{power:.1f}W" if power else "N/A",
-            "GPU Status": gpu_status,
-            "GPU Control": gpu_control,
-            "Throttle Policy": policy,
-            "Platform Profile": platform,
-            "CPU Boost": "Enabled" if boost else "Disabled",
-            "Top Processes": top_procs
+            "CPU PWM Before": f"{pwm_before:.0f}/255 (lowest in last {SPINUP_WINDOW:.0f}s)" if pwm_before is not None else "N/A",
+            "CPU Temp": f"{snapshot.temp}°C" if snapshot.temp else "N/A",
+            "CPU Temp Last 60s": f"min {temps.min:.1f}°C, max {temps.max:.1f}°C, mean {temps.mean:.1f}°C" if temps.count else "N/A",
+            "Power Draw": f"{snapshot.power:.1f}W" if snapshot.power else "N/A",
+            "GPU Status": snapshot.gpu_status,
+            "GPU Control": snapshot.gpu_control,
+            "Throttle Policy": snapshot.policy,
+            "Platform Profile": snapshot.platform,
+            "CPU Boost": "Enabled" if snapshot.boost else "Disabled",
         }
 
+        # Freeze what led up to the event before the buffers move on
+        window = self.recorder.freeze(self.history, snapshot.time.timestamp())
+
+        # Formatting and the log write happen on a worker thread
+        self.jobs.submit('fan-event', self.write_fan_event, event_type, details, window)
+
+    def write_fan_event(self, event_type, details, window):
+        """Add process attribution and the pre-trigger window to a fan event and log it (worker thread)"""
+        details["Top Processes"] = self.get_top_processes()
+        suspects = window.attribute()
+        if suspects:
+            details["Likely Cause"] = ', '.join(
+                f"{comm} [{pid}] ({cpu_seconds:.1f} CPU-s)" for comm, pid, cpu_seconds in suspects)
+        else:
+            details["Likely Cause"] = "N/A"
+        timeline = window.timeline()
+        if timeline:
+            details[f"Last {PRETRIGGER_WINDOW:.0f}s"] = "\n    " + "\n    ".join(timeline)
         self.log_debug(event_type, details)
     
     def get_power_draw(self):
         """Get current power draw in watts"""
-        try:
-            # power_now is in microwatts, convert to watts
-            with open('/sys/class/power_supply/BAT0/power_now', 'r') as f:
-                microwatts = int(f.read().strip())
-                return microwatts / 1000000.0
-        except:
-            return None
+        return self.sampler.power()
     
     def get_gpu_control(self):
         """Get GPU power control setting"""
-        try:
-            with open('/sys/bus/pci/devices/0000:01:00.0/power/control', 'r') as f:
-                return f.read().strip()
-        except:
-            return "unknown"
+        return self.sampler.gpu_control()
     
     def get_platform_profile(self):
         """Get platform profile"""
-        try:
-            with open('/sys/firmware/acpi/platform_profile', 'r') as f:
-                return f.read().strip()
-        except:
-            return "unknown"
+        return self.sampler.platform_profile()
     
     def get_cpu_boost(self):
         """Get CPU boost status"""
-        try:
-            with open('/sys/devices/system/cpu/cpu0/cpufreq/boost', 'r') as f:
-                return f.read().strip() == '1'
-        except:
-            return None
+        return self.sampler.cpu_boost()
     
+    def top_processes(self, n=3):
+        """The n busiest processes over the last sampling interval, as [(pid, name, cpu_percent)]"""
+        # The recorder already measures every few seconds, reuse its sample
+        sample = self.recorder.latest(max_age=2 * self.recorder.interval)
+        if sample is not None:
+            return [(pid, comm, percent) for pid, comm, percent in sample.usage[:n]]
+        return self.procs.top(n)
+
     def get_top_processes(self):
-        """Get top 3 CPU-using processes"""
-        try:
-            result = subprocess.run(
-                ['ps', 'aux', '--sort=-%cpu'],
-                capture_output=True,
-                text=True
-            )
-            lines = result.stdout.split('\n')[1:4]  # Skip header, get top 3
-            procs = []
-            for line in lines:
-                if line.strip():
-                    parts = line.split()
-                    if len(parts) >= 11:
-                        procs.append(f"{parts[10]} ({parts[2]}%)")
-            return ', '.join(procs)
-        except:
-            return "N/A"
+        """Get top 3 CPU-using processes over the last sampling interval"""
+        return format_top(self.top_processes())
     
     def open_live_monitor(self, widget):
-        """Open terminal with live system monitoring"""
-        # Create a monitoring script
-        monitor_script = os.path.expanduser("~/g14-live-monitor.sh")
-        with open(monitor_script, 'w') as f:
-            f.write("""#!/bin/bash
-echo "=== G14 LIVE MONITOR ==="
-echo "Press Ctrl+C to close"
-echo ""
-
-while true; do
-    clear
-    echo "=== G14 LIVE SYSTEM MONITOR ==="
-    echo "$(date)"
-    echo ""
-    
-    echo "--- Nuclear Fan Control Service ---"
-    sudo systemctl status aggressive-fan-control.service --no-pager -n 5
-    echo ""
-    
-    echo "--- Current Status ---"
-    TEMP_RAW=$(sensors | grep 'Tctl:' | awk '{print $2}' | sed 's/+//;s/°C//')
-    echo "Temperature: +${TEMP_RAW}°C"
-
-    # Show actual PWM values from fan curves
-    if [ -n "$TEMP_RAW" ]; then
-        # Read reference curve point to show curve is active
-        PWM1_P2=$(cat /sys/class/hwmon/hwmon7/pwm1_auto_point2_pwm 2>/dev/null)
-        PWM2_P2=$(cat /sys/class/hwmon/hwmon7/pwm2_auto_point2_pwm 2>/dev/null)
-        if [ -n "$PWM1_P2" ]; then
-            PWM_CPU_PCT=$((PWM1_P2 * 100 / 255))
-            echo "CPU PWM:     ${PWM1_P2}/255 (${PWM_CPU_PCT}%) [curve point 2]"
-        else
-            echo "CPU PWM:     N/A"
-        fi
-        if [ -n "$PWM2_P2" ]; then
-            PWM_GPU_PCT=$((PWM2_P2 * 100 / 255))
-            echo "GPU PWM:     ${PWM2_P2}/255 (${PWM_GPU_PCT}%) [curve point 2]"
-        else
-            echo "GPU PWM:     N/A"
-        fi
-    else
-        echo "CPU PWM:     N/A"
-        echo "GPU PWM:     N/A"
-    fi
-    POWER_UW=$(cat /sys/class/power_supply/BAT0/power_now 2>/dev/null)
-    if [ -n "$POWER_UW" ]; then
-        POWER_W=$(echo "scale=2; $POWER_UW / 1000000" | bc)
-        echo "Power Draw:  ${POWER_W}W"
-    else
-        echo "Power Draw:  N/A"
-    fi
-    echo "GPU Status:  $(cat /sys/bus/pci/devices/0000:01:00.0/power/runtime_status)"
-    echo "GPU Control: $(cat /sys/bus/pci/devices/0000:01:00.0/power/control)"
-    echo "Policy:      $(cat /sys/devices/platform/asus-nb-wmi/throttle_thermal_policy) (0=balanced, 1=perf, 2=quiet)"
-    echo "Platform:    $(cat /sys/firmware/acpi/platform_profile)"
-    echo "CPU Boost:   $(cat /sys/devices/system/cpu/cpu0/cpufreq/boost) (0=off, 1=on)"
-    echo ""
-    
-    echo "--- Top CPU Processes ---"
-    ps aux --sort=-%cpu | head -6
-    echo ""
-    
-    echo "--- Recent Service Logs ---"
-    sudo journalctl -u aggressive-fan-control.service -n 8 --no-pager
-    echo ""
-    echo "Refreshing in 3 seconds..."
-    
-    sleep 3
-done
-""")
-        os.chmod(monitor_script, 0o755)
-        
-        # Open in terminal
-        subprocess.Popen(['x-terminal-emulator', '-e', monitor_script])
+        """Open a terminal running this script's curses monitor"""
+        subprocess.Popen(['x-terminal-emulator', '-e', sys.executable,
+                          os.path.abspath(__file__), '--tui'])
         self.show_notification("Monitor", "Opening live monitor window...")
-    
+
     def view_debug_log(self, widget):
         """Open debug log in text editor"""
+        self.debug_log.flush()
         if os.path.exists(DEBUG_LOG):
             subprocess.Popen(['xdg-open', DEBUG_LOG])
             self.show_notification("Debug Log", f"Opening {DEBUG_LOG}")
@@ -311,108 +396,94 @@ done
     
     def clear_debug_log(self, widget):
         """Clear the debug log"""
-        with open(DEBUG_LOG, 'w') as f:
-            f.write(f"Debug log cleared: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        self.debug_log.clear(f"Debug log cleared: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
         self.show_notification("Debug Log", "Debug log cleared")
 
     def capture_state(self, widget):
         """Capture complete system state to a file"""
-        timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
-        filename = os.path.expanduser(f"~/g14-state-capture-{timestamp}.txt")
-
-        with open(filename, 'w') as f:
-            f.write("="*80 + "\n")
-            f.write(f"G14 STATE CAPTURE - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write("="*80 + "\n\n")
-
-            # Current readings
-            temp = self.get_temp()
-            pwm_cpu = self.get_pwm_cpu()
-            pwm_gpu = self.get_pwm_gpu()
-            power = self.get_power_draw()
-            gpu_status = self.get_gpu_status()
-            gpu_control = self.get_gpu_control()
-            policy = self.get_policy()
-            platform = self.get_platform_profile()
-            boost = self.get_cpu_boost()
-
-            f.write("CURRENT STATUS:\n")
-            f.write(f"  CPU Temp: {temp:.1f}°C\n" if temp else "  CPU Temp: N/A\n")
-            f.write(f"  CPU PWM: {pwm_cpu}/255 ({pwm_cpu*100//255}%)\n" if pwm_cpu else "  CPU PWM: N/A\n")
-            f.write(f"  GPU PWM: {pwm_gpu}/255 ({pwm_gpu*100//255}%)\n" if pwm_gpu else "  GPU PWM: N/A\n")
-            f.write(f"  Power Draw: {power:.1f}W\n" if power else "  Power Draw: N/A\n")
-            f.write(f"  GPU Status: {gpu_status}\n")
-            f.write(f"  GPU Control: {gpu_control}\n")
-            f.write(f"  Throttle Policy: {policy}\n")
-            f.write(f"  Platform Profile: {platform}\n")
-            f.write(f"  CPU Boost: {'Enabled' if boost else 'Disabled'}\n")
-            f.write("\n")
-
-            # CPU Fan Curve
-            f.write("CPU FAN CURVE (pwm1):\n")
-            try:
-                for i in range(1, 9):
-                    temp_path = f'/sys/class/hwmon/hwmon7/pwm1_auto_point{i}_temp'
-                    pwm_path = f'/sys/class/hwmon/hwmon7/pwm1_auto_point{i}_pwm'
-                    with open(temp_path, 'r') as tf:
-                        curve_temp = int(tf.read().strip())
-                    with open(pwm_path, 'r') as pf:
-                        curve_pwm = int(pf.read().strip())
-                    f.write(f"  Point {i}: {curve_temp}°C = PWM {curve_pwm}\n")
-            except Exception as e:
-                f.write(f"  Error reading curve: {e}\n")
-            f.write("\n")
-
-            # GPU Fan Curve
-            f.write("GPU FAN CURVE (pwm2):\n")
-            try:
-                for i in range(1, 9):
-                    temp_path = f'/sys/class/hwmon/hwmon7/pwm2_auto_point{i}_temp'
-                    pwm_path = f'/sys/class/hwmon/hwmon7/pwm2_auto_point{i}_pwm'
-                    with open(temp_path, 'r') as tf:
-                        curve_temp = int(tf.read().strip())
-                    with open(pwm_path, 'r') as pf:
-                        curve_pwm = int(pf.read().strip())
-                    f.write(f"  Point {i}: {curve_temp}°C = PWM {curve_pwm}\n")
-            except Exception as e:
-                f.write(f"  Error reading curve: {e}\n")
-            f.write("\n")
-
-            # Top processes
-            f.write("TOP CPU PROCESSES:\n")
-            top_procs = self.get_top_processes()
-            f.write(f"  {top_procs}\n")
-            f.write("\n")
-
-            # Full sensors output
-            f.write("FULL SENSORS OUTPUT:\n")
-            try:
-                result = subprocess.run(['sensors'], capture_output=True, text=True)
-                f.write(result.stdout)
-            except Exception as e:
-                f.write(f"  Error: {e}\n")
-            f.write("\n")
-
-            f.write("="*80 + "\n")
-            f.write("State capture complete. Share this file for analysis.\n")
-            f.write("="*80 + "\n")
-
-        self.show_notification("State Captured", f"Saved to:\n{filename}")
-        self.log_debug("USER ACTION", {"Action": f"Captured state to {filename}"})
+        # History and sampler state belong to the main loop, so collect them
+        # here and leave the slow sources to a worker
+        sections = self.capture_sections(self.snapshot or self.collect_snapshot())
+        if not self.jobs.submit('capture', self.write_capture, sections,
+                                callback=self.on_capture_done):
+            self.show_notification("State Capture", "A capture is already in progress")
+
+    def capture_sections(self, snapshot):
+        """The in-memory sections of a state capture"""
+        sections = capture.snapshot_sections(snapshot, self.sampler)
+
+        history = {}
+        for field in FIELDS:
+            for window in self.history.windows:
+                stats = self.history.rolling(field, window)
+                if stats.count:
+                    history.setdefault(field, {})[f"{window:.0f}s"] = {
+                        'min': round(stats.min, 2), 'mean': round(stats.mean, 2),
+                        'max': round(stats.max, 2), 'samples': stats.count}
+        sections['history'] = history
+
+        sections['sampling'] = {
+            'interval': self.cadence.interval,
+            'wakeups': self.cadence.wakeups,
+            'wakeups_saved': self.cadence.wakeups_saved,
+            'tick_ms': None if self.tick_ms is None else round(self.tick_ms, 3),
+            'tick_ms_max': round(self.tick_ms_max, 3),
+            'gtk_labels_set': self.view.updates,
+            'gtk_labels_unchanged': self.view.unchanged,
+            'jobs_completed': self.jobs.completed,
+            'jobs_failed': self.jobs.failed,
+            'jobs_coalesced': self.jobs.coalesced,
+            'debug_log_records': self.debug_log.written,
+            'debug_log_dropped': self.debug_log.dropped,
+            'debug_log_rotations': self.debug_log.rotations,
+        }
+        return sections
+
+    def write_capture(self, sections):
+        """Collect the slow sections and write the capture files (worker thread)"""
+        sections.update(capture.hardware_sections(self.sampler, lambda: self.top_processes(capture.TOP_PROCESSES)))
+        return capture.write(capture.document(sections))
+
+    def on_capture_done(self, paths, error):
+        """Report a finished capture (main loop)"""
+        if error is not None:
+            self.show_notification("State Capture", f"Capture failed: {error}")
+            return
+        json_path, text_path = paths
+        self.show_notification("State Captured", f"Saved to:\n{text_path}\n{json_path}")
+        self.log_debug("USER ACTION", {"Action": f"Captured state to {json_path}"})
     
     def run_command(self, cmd):
         """Run shell command with sudo"""
         try:
             subprocess.run(cmd, shell=True, check=True)
             return True
-        except:
+        except (OSError, subprocess.CalledProcessError) as e:
+            instrument.error('run_command', e)
+            return False
+
+    def write_attr(self, name, value):
+        """Write value to a sysfs attribute from the path index through the root helper"""
+        # Whichever way the write goes, read the attribute again on the next sample
+        self.sampler.registry.invalidate(name)
+        try:
+            self.helper.write(name, value)
+            return True
+        except HelperError as e:
+            self.log_debug("HELPER ERROR", {"Attribute": name, "Value": value, "Error": str(e)})
             return False
+        except OSError:
+            pass
+        path = getattr(self.paths, name)
+        if path is None:
+            return False
+        return self.run_command(f'echo {shlex.quote(value)} | sudo tee {shlex.quote(path)} > /dev/null')
     
     def toggle_gpu(self, widget):
         """Toggle GPU power state"""
         gpu_status = self.get_gpu_status()
         if gpu_status == "active":
-            self.run_command('echo auto | sudo tee /sys/bus/pci/devices/0000:01:00.0/power/control > /dev/null')
+            self.write_attr('gpu_control', 'auto')
             self.show_notification("GPU", "Forcing GPU to suspend...")
             self.log_debug("USER ACTION", {"Action": "Forced GPU to auto (suspend)"})
         else:
@@ -422,29 +493,29 @@ done
         """Cycle through thermal policies"""
         current = self.get_policy()
         policies = ['quiet', 'balanced', 'performance']
-        policy_vals = {'quiet': '2', 'balanced': '0', 'performance': '1'}
         
         try:
             current_idx = policies.index(current)
             next_idx = (current_idx + 1) % len(policies)
             next_policy = policies[next_idx]
             
-            self.run_command(f'echo {policy_vals[next_policy]} | sudo tee /sys/devices/platform/asus-nb-wmi/throttle_thermal_policy > /dev/null')
+            self.write_attr('throttle_policy', POLICY_VALUES[next_policy])
             self.show_notification("Policy", f"Switched to {next_policy}")
             self.log_debug("USER ACTION", {"Action": f"Changed policy to {next_policy}"})
-        except:
-            pass
+        except ValueError as e:
+            # The current policy couldn't be read
+            instrument.error('cycle_policy', e)
     
     def force_quiet(self, widget):
         """Force quiet mode"""
-        self.run_command('echo 2 | sudo tee /sys/devices/platform/asus-nb-wmi/throttle_thermal_policy > /dev/null')
-        self.run_command('echo quiet | sudo tee /sys/firmware/acpi/platform_profile > /dev/null')
+        self.write_attr('throttle_policy', '2')
+        self.write_attr('platform_profile', 'quiet')
         self.show_notification("Fan Control", "Forced quiet mode")
         self.log_debug("USER ACTION", {"Action": "Forced quiet mode"})
     
     def force_gpu_sleep(self, widget):
         """Force GPU to sleep"""
-        self.run_command('echo auto | sudo tee /sys/bus/pci/devices/0000:01:00.0/power/control > /dev/null')
+        self.write_attr('gpu_control', 'auto')
         self.show_notification("GPU", "Forced GPU to auto (should suspend)")
         self.log_debug("USER ACTION", {"Action": "Forced GPU sleep"})
     
@@ -452,193 +523,90 @@ done
         """Show desktop notification"""
         try:
             subprocess.run(['notify-send', title, message])
-        except:
-            pass
+        except OSError as e:
+            instrument.error('notify-send', e)
     
     def get_temp(self):
-        try:
-            result = subprocess.run(['sensors'], capture_output=True, text=True)
-            match = re.search(r'Tctl:\s+\+(\d+\.\d+)', result.stdout)
-            if match:
-                return float(match.group(1))
-        except:
-            pass
-        return None
+        return self.sampler.temp()
     
     def get_fan_speed(self):
-        try:
-            result = subprocess.run(['sensors'], capture_output=True, text=True)
-            match = re.search(r'cpu_fan:\s+(\d+) RPM', result.stdout)
-            if match:
-                return int(match.group(1))
-        except:
-            pass
-        return None
+        return self.sampler.fan_rpm()
 
-    def get_pwm_cpu(self):
+    def get_pwm_cpu(self, temp):
         """Calculate current CPU fan PWM value based on temp and curve (0-255)"""
-        try:
-            temp = self.get_temp()
-            if temp is None:
-                return None
-
-            # Read fan curve points
-            curve = []
-            for i in range(1, 9):
-                temp_path = f'/sys/class/hwmon/hwmon7/pwm1_auto_point{i}_temp'
-                pwm_path = f'/sys/class/hwmon/hwmon7/pwm1_auto_point{i}_pwm'
-                with open(temp_path, 'r') as f:
-                    curve_temp = float(f.read().strip())  # Already in degrees C
-                with open(pwm_path, 'r') as f:
-                    curve_pwm = int(f.read().strip())
-                curve.append((curve_temp, curve_pwm))
-
-            # Find current PWM by interpolation
-            if temp <= curve[0][0]:
-                return curve[0][1]
-            if temp >= curve[-1][0]:
-                return curve[-1][1]
-
-            for i in range(len(curve) - 1):
-                if curve[i][0] <= temp <= curve[i+1][0]:
-                    # Linear interpolation
-                    t1, pwm1 = curve[i]
-                    t2, pwm2 = curve[i+1]
-                    pwm = pwm1 + (pwm2 - pwm1) * (temp - t1) / (t2 - t1)
-                    return int(pwm)
-
-            return None
-        except:
-            return None
-
-    def get_pwm_gpu(self):
+        return self.sampler.pwm(1, temp)
+
+    def get_pwm_gpu(self, temp):
         """Calculate current GPU fan PWM value based on temp and curve (0-255)"""
-        try:
-            # GPU temp from sensors (if available)
-            temp = self.get_temp()  # Using CPU temp as proxy since GPU is suspended
-            if temp is None:
-                return None
-
-            # Read fan curve points
-            curve = []
-            for i in range(1, 9):
-                temp_path = f'/sys/class/hwmon/hwmon7/pwm2_auto_point{i}_temp'
-                pwm_path = f'/sys/class/hwmon/hwmon7/pwm2_auto_point{i}_pwm'
-                with open(temp_path, 'r') as f:
-                    curve_temp = float(f.read().strip())  # Already in degrees C
-                with open(pwm_path, 'r') as f:
-                    curve_pwm = int(f.read().strip())
-                curve.append((curve_temp, curve_pwm))
-
-            # Find current PWM by interpolation
-            if temp <= curve[0][0]:
-                return curve[0][1]
-            if temp >= curve[-1][0]:
-                return curve[-1][1]
-
-            for i in range(len(curve) - 1):
-                if curve[i][0] <= temp <= curve[i+1][0]:
-                    # Linear interpolation
-                    t1, pwm1 = curve[i]
-                    t2, pwm2 = curve[i+1]
-                    pwm = pwm1 + (pwm2 - pwm1) * (temp - t1) / (t2 - t1)
-                    return int(pwm)
-
-            return None
-        except:
-            return None
+        # CPU temp is used as a proxy since the GPU is usually suspended
+        return self.sampler.pwm(2, temp)
     
     def get_gpu_status(self):
-        try:
-            with open('/sys/bus/pci/devices/0000:01:00.0/power/runtime_status', 'r') as f:
-                status = f.read().strip()
-                return status
-        except:
-            return "unknown"
+        return self.sampler.gpu_status()
     
     def get_policy(self):
-        try:
-            with open('/sys/devices/platform/asus-nb-wmi/throttle_thermal_policy', 'r') as f:
-                val = f.read().strip()
-                policies = {
-                    '0': 'balanced',
-                    '1': 'performance', 
-                    '2': 'quiet'
-                }
-                return policies.get(val, 'unknown')
-        except:
-            return "unknown"
-    
-    def get_temp_icon(self, temp):
-        """Return emoji/icon based on temperature"""
-        if temp is None:
-            return "❓"
-        elif temp < 50:
-            return "🟢"
-        elif temp < 65:
-            return "🟡"
-        elif temp < 75:
-            return "🟠"
-        else:
-            return "🔴"
+        return self.sampler.policy()
     
     def update_status(self):
-        temp = self.get_temp()
-        power = self.get_power_draw()
-        gpu = self.get_gpu_status()
-        policy = self.get_policy()
-        pwm_cpu = self.get_pwm_cpu()
-        pwm_gpu = self.get_pwm_gpu()
-
-        # Detect PWM changes (fan spin-ups)
-        self.detect_pwm_change(pwm_cpu)
-
-        # Update indicator label
-        temp_icon = self.get_temp_icon(temp)
-        if temp is not None:
-            temp_str = f"{temp:.0f}°C"
-        else:
-            temp_str = "--°C"
-
-        gpu_icon = "⚡" if gpu == "active" else "💤"
-
-        # Update status icon tooltip
-        tooltip_text = f"G14 Monitor\n{temp_icon} {temp_str}"
-        if pwm_cpu is not None:
-            tooltip_text += f"\nCPU PWM: {pwm_cpu}/255"
-        self.status_icon.set_tooltip_text(tooltip_text)
-
-        # Update menu items with click hints
-        if temp is not None:
-            self.temp_item.set_label(f"Temp: {temp:.1f}°C {temp_icon}")
-        else:
-            self.temp_item.set_label("Temp: --°C")
-
-        if pwm_cpu is not None:
-            pwm_cpu_percent = pwm_cpu * 100 // 255
-            self.pwm_cpu_item.set_label(f"CPU PWM: {pwm_cpu}/255 ({pwm_cpu_percent}%)")
-        else:
-            self.pwm_cpu_item.set_label("CPU PWM: ---")
-
-        if pwm_gpu is not None:
-            pwm_gpu_percent = pwm_gpu * 100 // 255
-            self.pwm_gpu_item.set_label(f"GPU PWM: {pwm_gpu}/255 ({pwm_gpu_percent}%)")
-        else:
-            self.pwm_gpu_item.set_label("GPU PWM: ---")
-
-        if power is not None:
-            self.power_item.set_label(f"Power: {power:.1f}W")
-        else:
-            self.power_item.set_label("Power: -- W")
-
-        self.gpu_item.set_label(f"GPU: {gpu} {gpu_icon} (click to force sleep)")
-        self.policy_item.set_label(f"Policy: {policy} (click to cycle)")
-
-        return True
+        started = time.perf_counter()
+        snapshot = self.collect_snapshot()
+        # A shared snapshot is only new once the daemon has published again,
+        # until then there is nothing to record or redraw
+        if self.snapshot is None or snapshot.time != self.snapshot.time:
+            self.history.append(snapshot)
+            self.snapshot = snapshot
+
+            # Detect PWM changes (fan spin-ups)
+            self.detect_pwm_change(snapshot)
+
+            # Only the tooltip shows while the menu is closed
+            trend = [temp for _, temp in self.history.values('temp', limit=20)]
+            self.view.update(snapshot, trend, self.menu_open)
+
+        # Main loop cost of this tick
+        self.tick_ms = (time.perf_counter() - started) * 1000
+        self.tick_ms_max = max(self.tick_ms_max, self.tick_ms)
     
     def quit(self, widget):
+        self.helper.close()
+        self.recorder.stop()
+        self.jobs.shutdown()
+        self.debug_log.close()
+        if self.events is not None:
+            self.events.close()
         Gtk.main_quit()
 
-if __name__ == "__main__":
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ASUS G14 tray monitor")
+    parser.add_argument('--tui', action='store_true',
+                        help="show the live monitor in this terminal instead of the tray icon")
+    parser.add_argument('--interval', type=float, default=2.0,
+                        help="seconds between live monitor samples (default %(default)s)")
+    parser.add_argument('--capture', action='store_true',
+                        help="write a state capture (JSON and text) and exit")
+    parser.add_argument('-o', '--output-dir', default=capture.CAPTURE_DIR,
+                        help="directory --capture writes to (default %(default)s)")
+    parser.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'),
+                        help="compare two JSON state captures field by field and exit")
+    parser.add_argument('--all', action='store_true',
+                        help="with --diff, include counters and timings that always change")
+    args = parser.parse_args(argv)
+
+    if args.diff:
+        return capture.diff_main(*args.diff, volatile=args.all)
+    if args.capture:
+        return capture.capture_main(args.output_dir)
+    if args.tui:
+        from g14 import tui
+        return tui.main(interval=args.interval)
+    if Gtk is None:
+        print("GTK 3 (python3-gi) is required for the tray icon, try --tui", file=sys.stderr)
+        return 1
     monitor = G14Monitor()
     Gtk.main()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
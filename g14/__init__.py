@@ -0,0 +1 @@
+"""Shared helpers for the ASUS G14 fan monitor and fan control daemon"""
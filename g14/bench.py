@@ -0,0 +1,310 @@
+"""Per-tick cost benchmarks against a synthetic sysfs tree
+
+    python3 -m g14.bench [-n 200] [-o results.json] [--compare baseline.json]
+
+Builds a fakesys tree in a temporary directory and runs the per-tick
+paths of the daemon and the tray against it. Between the timed calls the
+sensor registry's clock moves on by one tick interval and the fake
+temperature changes, so every call does the reads and writes of a real
+tick rather than serving cached values. For each benchmark it reports
+wall time per call, the read and write family calls counted in
+/proc/self/io (syscr/syscw, not every syscall), file opens and process
+spawns (from audit hooks) and Python allocations per call, and prints the
+results as JSON for regression tracking. Tray benchmarks are skipped when
+GTK can't be loaded.
+"""
+import argparse
+import importlib.util
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from g14 import fakesys
+from g14.cadence import BASE_INTERVAL
+from g14.paths import probe, ROOT_ENV
+
+ITERATIONS = 200
+WARMUP = 5
+# Tctl of successive ticks, across the policy thresholds and back
+TEMPS = (48, 55, 61, 66, 72, 77, 81, 76, 69, 62, 57, 51)
+SPAWN_EVENTS = ('subprocess.Popen', 'os.fork', 'os.forkpty', 'os.posix_spawn', 'os.system', 'os.exec')
+
+
+class _Counts:
+    active = False
+    opens = 0
+    spawns = 0
+
+
+def _audit(event, args):
+    if not _Counts.active:
+        return
+    if event == 'open':
+        _Counts.opens += 1
+    elif event in SPAWN_EVENTS:
+        _Counts.spawns += 1
+
+
+def _io():
+    """(syscr, syscw) of this process so far, or None"""
+    try:
+        with open('/proc/self/io', 'r') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+        return int(fields['syscr']), int(fields['syscw'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class TickClock:
+    """A registry clock that only moves when told to"""
+
+    def __init__(self):
+        self.now = time.monotonic()
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def ticking(root, *samplers):
+    """A prepare step that makes the next call look one tick later"""
+    clock = TickClock()
+    for sampler in samplers:
+        sampler.registry.clock = clock
+    temps = itertools.cycle(TEMPS)
+
+    def prepare():
+        clock.advance(BASE_INTERVAL)
+        fakesys.set_temp(root, next(temps))
+    return prepare
+
+
+def measure(fn, iterations=ITERATIONS, warmup=WARMUP, prepare=None):
+    """Run fn repeatedly and return its per-call costs
+
+    prepare, if given, runs before every call and isn't measured.
+    """
+    for _ in range(warmup):
+        if prepare is not None:
+            prepare()
+        fn()
+
+    # What reading /proc/self/io costs in its own counters
+    first = _io()
+    second = _io()
+    io_overhead = None if first is None else (second[0] - first[0], second[1] - first[1])
+
+    times = []
+    io_calls = [0, 0]
+    _Counts.opens = _Counts.spawns = 0
+    for _ in range(iterations):
+        if prepare is not None:
+            prepare()
+        io_before = _io()
+        _Counts.active = True
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+        _Counts.active = False
+        io_after = _io()
+        if io_overhead is not None:
+            for i in (0, 1):
+                io_calls[i] += max(0, io_after[i] - io_before[i] - io_overhead[i])
+
+    # A separate pass, tracemalloc slows everything it traces
+    tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    allocated_before, _ = tracemalloc.get_traced_memory()
+    for _ in range(iterations):
+        if prepare is not None:
+            prepare()
+        fn()
+    allocated_after, peak = tracemalloc.get_traced_memory()
+    blocks_after = sys.getallocatedblocks()
+    tracemalloc.stop()
+
+    times.sort()
+    result = {
+        'iterations': iterations,
+        'wall_us': {
+            'mean': statistics.mean(times) * 1e6,
+            'median': statistics.median(times) * 1e6,
+            'p95': times[int(len(times) * 0.95) - 1] * 1e6,
+            'min': times[0] * 1e6,
+            'max': times[-1] * 1e6,
+        },
+        'opens_per_call': _Counts.opens / iterations,
+        'spawns_per_call': _Counts.spawns / iterations,
+        'alloc_blocks_per_call': (blocks_after - blocks_before) / iterations,
+        'alloc_bytes_per_call': (allocated_after - allocated_before) / iterations,
+        'alloc_peak_bytes': peak - allocated_before,
+    }
+    if io_overhead is not None:
+        result['io_syscr_per_call'] = io_calls[0] / iterations
+        result['io_syscw_per_call'] = io_calls[1] / iterations
+    return result
+
+
+def daemon_benchmarks(root, work, iterations):
+    from g14.controller import PolicyController
+    from g14.daemon import FanDaemon
+    from g14.metrics import Metrics
+    from g14.sampler import Sampler
+    from g14.shm import SnapshotPublisher, SnapshotReader
+    from g14.telemetry import TelemetryStore
+
+    results = {}
+    sampler = Sampler(probe(root))
+    tick = ticking(root, sampler)
+    results['sampler.sample'] = measure(sampler.sample, iterations, prepare=tick)
+    # Nothing due, the cost of serving cached values
+    results['sampler.sample.cached'] = measure(sampler.sample, iterations)
+    # Every sensor due, as on the first sample or after a long sleep
+    results['sampler.sample.full'] = measure(sampler.sample, iterations,
+                                             prepare=sampler.registry.expire)
+
+    # No minimum dwell, so the temperature swings change the policy and
+    # the ticks write it
+    daemon = FanDaemon(sampler=sampler, policy=PolicyController(min_dwell=0))
+    daemon.setup()
+    results['daemon.tick'] = measure(daemon.tick, iterations, prepare=tick)
+
+    shm_path = os.path.join(work, 'snapshot')
+    publishing = FanDaemon(sampler=sampler, policy=PolicyController(min_dwell=0),
+                           telemetry=TelemetryStore(os.path.join(work, 'telemetry')),
+                           publisher=SnapshotPublisher(shm_path), metrics=Metrics())
+    results['daemon.tick+publish'] = measure(publishing.tick, iterations, prepare=tick)
+
+    reader = SnapshotReader(shm_path)
+    results['shm.read'] = measure(reader.read, iterations)
+    results['metrics.render'] = measure(publishing.metrics.render, iterations)
+    publishing.close()
+    reader.close()
+    return results
+
+
+class _InlineJobs:
+    """Runs BackgroundJobs work synchronously so it is timed with the call"""
+    completed = coalesced = failed = 0
+    in_flight = ()
+
+    def submit(self, key, fn, *args, callback=None):
+        result = fn(*args)
+        if callback is not None:
+            callback(result, None)
+        return True
+
+    def busy(self, key):
+        return False
+
+    def shutdown(self):
+        pass
+
+
+def load_tray():
+    """Import g14-monitor.py, which isn't importable by name"""
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'g14-monitor.py')
+    spec = importlib.util.spec_from_file_location('g14_monitor', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def tray_benchmarks(root, iterations):
+    try:
+        tray = load_tray()
+    except Exception as e:
+        return {'tray': {'skipped': f"cannot load g14-monitor.py: {e}"}}
+    if tray.Gtk is None:
+        return {'tray': {'skipped': "GTK 3 (python3-gi) not available"}}
+    try:
+        monitor = tray.G14Monitor()
+    except Exception as e:
+        return {'tray': {'skipped': f"cannot create the tray monitor: {e}"}}
+
+    # No timers, background threads or daemon snapshots while measuring
+    if monitor.sampler.shared is not None:
+        monitor.sampler.shared.close()
+        monitor.sampler.shared = None
+    tray.GLib.source_remove(monitor.timeout_id)
+    monitor.recorder.stop()
+    monitor.jobs.shutdown()
+    monitor.jobs = _InlineJobs()
+
+    results = {
+        'tray.update_status': measure(monitor.update_status, iterations,
+                                      prepare=ticking(root, monitor.sampler)),
+        # Nothing due, a redraw of cached values
+        'tray.update_status.cached': measure(monitor.update_status, iterations),
+    }
+    snapshot = monitor.collect_snapshot()
+    results['tray.log_fan_event'] = measure(
+        lambda: monitor.log_fan_event("FAN SPIN-UP DETECTED", snapshot), max(1, iterations // 10))
+    results['tray.capture_state'] = measure(
+        lambda: monitor.capture_state(None), max(1, iterations // 10))
+    monitor.debug_log.close()
+    return results
+
+
+def compare(results, baseline):
+    """Print mean wall time against a baseline run"""
+    print(f"{'benchmark':<24} {'baseline us':>12} {'now us':>12} {'ratio':>7}", file=sys.stderr)
+    for name, result in results['benchmarks'].items():
+        old = baseline.get('benchmarks', {}).get(name)
+        if 'wall_us' not in result or not old or 'wall_us' not in old:
+            continue
+        before, now = old['wall_us']['mean'], result['wall_us']['mean']
+        print(f"{name:<24} {before:12.1f} {now:12.1f} {now / before:7.2f}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the G14 tools against a fake sysfs tree")
+    parser.add_argument('-n', '--iterations', type=int, default=ITERATIONS,
+                        help="calls per benchmark (default %(default)s)")
+    parser.add_argument('-o', '--output', help="write the JSON results to a file")
+    parser.add_argument('--compare', metavar='BASELINE', help="compare against an earlier results file")
+    parser.add_argument('--no-tray', action='store_true', help="skip the tray benchmarks")
+    args = parser.parse_args(argv)
+
+    sys.addaudithook(_audit)
+    with tempfile.TemporaryDirectory(prefix='g14-bench-') as work:
+        root = fakesys.build(os.path.join(work, 'root'))
+        # Everything probed or spawned from here on sees the fake machine
+        os.environ[ROOT_ENV] = root
+        os.environ['PATH'] = os.path.join(root, 'bin') + os.pathsep + os.environ.get('PATH', '')
+        os.environ['HOME'] = work
+
+        benchmarks = daemon_benchmarks(root, work, args.iterations)
+        if not args.no_tray:
+            benchmarks.update(tray_benchmarks(root, args.iterations))
+
+    results = {
+        'version': 1,
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'benchmarks': benchmarks,
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Adaptive sampling cadence
+
+AdaptiveInterval decides how long to wait before the next sample. Stable
+readings back the interval off exponentially up to max_interval, a fast
+temperature slope or a PWM jump tightens it straight to min_interval, and
+anything in between (or an open menu) runs at the base interval.
+"""
+
+BASE_INTERVAL = 2.0
+MIN_INTERVAL = 0.5
+MAX_INTERVAL = 10.0
+
+# Degrees C per second that count as a fast change
+SLOPE_THRESHOLD = 0.5
+# PWM steps (0-255) between samples that count as a fan change
+PWM_THRESHOLD = 10
+# Temperature change below which a reading counts as stable
+STABLE_TEMP = 1.0
+
+
+class AdaptiveInterval:
+    """Picks the next sampling interval from how fast readings change"""
+
+    def __init__(self, base=BASE_INTERVAL, min_interval=MIN_INTERVAL,
+                 max_interval=MAX_INTERVAL, slope_threshold=SLOPE_THRESHOLD,
+                 pwm_threshold=PWM_THRESHOLD, stable_temp=STABLE_TEMP):
+        self.base = base
+        self.min_interval = min(min_interval, base)
+        self.max_interval = max(max_interval, base)
+        self.slope_threshold = slope_threshold
+        self.pwm_threshold = pwm_threshold
+        self.stable_temp = stable_temp
+
+        self.interval = base
+        self.wakeups = 0
+        self.elapsed = 0.0
+        self.last_time = None
+        self.last_temp = None
+        self.last_pwm = None
+
+    @property
+    def wakeups_saved(self):
+        """Wakeups avoided compared to sampling at the base interval"""
+        return int(self.elapsed / self.base) - self.wakeups
+
+    def reset(self):
+        """Go back to the base interval, e.g. when the user opens the menu"""
+        self.interval = self.base
+        return self.interval
+
+    def update(self, temp, pwm, now, active=False):
+        """Record a sample taken at now (seconds), return the next interval
+
+        active means someone is looking (the menu is open) so the
+        interval never backs off past the base.
+        """
+        self.wakeups += 1
+        if self.last_time is not None:
+            self.elapsed += now - self.last_time
+
+        fast = False
+        stable = False
+        if self.last_time is not None and now > self.last_time:
+            if temp is not None and self.last_temp is not None:
+                delta = abs(temp - self.last_temp)
+                fast = delta / (now - self.last_time) >= self.slope_threshold
+                stable = delta < self.stable_temp
+            if pwm is not None and self.last_pwm is not None:
+                pwm_delta = abs(pwm - self.last_pwm)
+                fast = fast or pwm_delta >= self.pwm_threshold
+                stable = stable and pwm_delta == 0
+
+        if fast:
+            self.interval = self.min_interval
+        elif stable and not active:
+            if self.interval < self.base:
+                self.interval = self.base
+            else:
+                self.interval = min(self.interval * 2, self.max_interval)
+        else:
+            self.interval = self.base
+
+        self.last_time = now
+        self.last_temp = temp
+        self.last_pwm = pwm
+        return self.interval
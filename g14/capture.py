@@ -0,0 +1,385 @@
+"""Structured state captures
+
+A capture is a versioned JSON document of plain sections: the current
+snapshot, raw attribute values, both fan curves, the busiest processes,
+sensors(1) output, machine identity and the tools' own counters. The
+slow sections come from independent sources (a sensors fork, the /proc
+scan, 32 curve files, sysfs) and are collected on a thread each, so a
+capture takes as long as its slowest source rather than their sum. The
+text report is rendered from the document, and diff() compares two
+documents field by field, curve points included.
+
+    python3 g14-monitor.py --capture [-o DIR]
+    python3 g14-monitor.py --diff OLD.json NEW.json [--all]
+"""
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from g14 import instrument
+from g14.curves import FANS
+from g14.hwmon import parse_tctl, parse_cpu_fan
+from g14.procs import ProcSampler
+from g14.sampler import Sampler
+from g14.shm import SnapshotReader
+
+FORMAT = 'g14-state-capture'
+VERSION = 1
+
+CAPTURE_DIR = os.path.expanduser('~')
+
+# Identity of the machine, relative to the sysfs root
+DMI = ('product_name', 'product_version', 'board_name', 'bios_version', 'bios_date')
+
+# Sections that change from one capture to the next whatever the machine
+# does, left out of diffs unless asked for
+VOLATILE = ('time', 'collected_ms', 'instrumentation', 'sampling', 'sensor_cadence')
+
+TOP_PROCESSES = 5
+
+
+def status(snapshot):
+    """The snapshot as a plain dict"""
+    return {name: getattr(snapshot, name) for name in snapshot.__slots__ if name != 'time'}
+
+
+def probes():
+    """Instrumentation probes as {name: {...}}"""
+    result = {}
+    for probe in instrument.probes():
+        result[probe.name] = {
+            'calls': probe.calls,
+            'mean_us': None if probe.mean is None else round(probe.mean * 1e6, 1),
+            'max_us': round(probe.max * 1e6, 1),
+            'errors': dict(probe.errors),
+            'stale': probe.stale,
+        }
+    return result
+
+
+def sensor_cadence(registry):
+    """Cadence and read counts of every registry sensor"""
+    return {
+        name: {'cadence': sensor.cadence, 'reads': sensor.reads,
+               'failures': sensor.failures, 'value': sensor.value}
+        for name, sensor in registry.sensors.items()
+    }
+
+
+def snapshot_sections(snapshot, sampler):
+    """Sections rendered from state that is already in memory"""
+    return {
+        'status': status(snapshot),
+        'extra_sensors': sampler.extra_values(),
+        'sensor_cadence': sensor_cadence(sampler.registry),
+        'instrumentation': probes(),
+        'paths': sampler.paths._asdict(),
+    }
+
+
+def _read(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def machine(root):
+    """Host, kernel and DMI identity"""
+    info = {'hostname': socket.gethostname(), 'kernel': platform.release()}
+    for name in DMI:
+        info[name] = _read(os.path.join(root, 'sys/class/dmi/id', name))
+    return info
+
+
+def attributes(sampler):
+    """Raw value of every attribute in the path index and the extra sensors"""
+    paths = dict(sampler.paths._asdict(), **sampler.extra_paths)
+    values = {}
+    for name, path in paths.items():
+        if name in ('root', 'curve_hwmon', 'gpu_device'):
+            continue
+        values[name] = _read(path) if path else None
+    return values
+
+
+def fan_curves(curves):
+    """Both fan curves re-read from the hardware, as lists of points"""
+    curves.refresh(force=True)
+    result = {}
+    for fan, name in FANS.items():
+        curve = curves.curves.get(fan)
+        result[name] = None if curve is None else [
+            {'temp': temp, 'pwm': pwm} for temp, pwm in curve.points]
+    return result
+
+
+def processes(top):
+    """CPU percent of the busiest processes, summed by name"""
+    usage = defaultdict(float)
+    for _, name, percent in top():
+        usage[name] += percent
+    return {name: round(percent, 1) for name, percent in usage.items()}
+
+
+def sensors():
+    """sensors(1) output and the values the fallback parser finds in it"""
+    try:
+        output = subprocess.run(['sensors'], capture_output=True, text=True).stdout
+    except OSError as e:
+        instrument.error('sensors', e)
+        return {'error': str(e)}
+    return {'tctl': parse_tctl(output), 'cpu_fan': parse_cpu_fan(output), 'output': output}
+
+
+def collect(sources):
+    """Run {section: fn} concurrently, return the sections and their timings
+
+    A source that raises becomes {'error': message} instead of failing
+    the whole capture.
+    """
+    def run(fn):
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            result = {'error': f"{type(e).__name__}: {e}"}
+        return result, round((time.perf_counter() - started) * 1000, 1)
+
+    with ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix='g14-capture') as pool:
+        futures = {name: pool.submit(run, fn) for name, fn in sources.items()}
+    sections = {}
+    timings = {}
+    for name, future in futures.items():
+        sections[name], timings[name] = future.result()
+    return sections, timings
+
+
+def hardware_sections(sampler, top):
+    """Collect the slow sections, re-read from the hardware"""
+    sections, timings = collect({
+        'machine': lambda: machine(sampler.paths.root),
+        'attributes': lambda: attributes(sampler),
+        'curves': lambda: fan_curves(sampler.curves),
+        'processes': lambda: processes(top),
+        'sensors': sensors,
+    })
+    sections['collected_ms'] = timings
+    return sections
+
+
+def document(sections, now=None):
+    """Wrap sections into a capture document"""
+    now = now or datetime.now()
+    doc = {'format': FORMAT, 'version': VERSION, 'time': now.isoformat(timespec='seconds')}
+    doc.update(sections)
+    return doc
+
+
+def load(path):
+    """Read a capture document, raising ValueError if it isn't one"""
+    with open(path, 'r') as f:
+        doc = json.load(f)
+    if not isinstance(doc, dict) or doc.get('format') != FORMAT:
+        raise ValueError(f"{path} is not a G14 state capture")
+    if doc.get('version', 0) > VERSION:
+        raise ValueError(f"{path} is capture version {doc['version']}, this tool reads up to {VERSION}")
+    return doc
+
+
+def write(doc, directory=CAPTURE_DIR):
+    """Write doc as JSON and as a text report, return both paths"""
+    stamp = datetime.fromisoformat(doc['time']).strftime('%Y%m%d-%H%M%S')
+    base = os.path.join(directory, f"g14-state-capture-{stamp}")
+    with open(base + '.json', 'w') as f:
+        json.dump(doc, f, indent=2, sort_keys=False)
+        f.write('\n')
+    with open(base + '.txt', 'w') as f:
+        f.write(render_text(doc))
+    return base + '.json', base + '.txt'
+
+
+def _value(value, unit=''):
+    if value is None:
+        return "N/A"
+    if isinstance(value, float):
+        return f"{value:.1f}{unit}"
+    return f"{value}{unit}"
+
+
+def _pwm(value):
+    return "N/A" if value is None else f"{value}/255 ({value * 100 // 255}%)"
+
+
+def _generic(value, indent="  "):
+    """key: value lines of a nested section"""
+    lines = []
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if isinstance(item, dict) and item and not any(
+                    isinstance(v, (dict, list)) and v for v in item.values()):
+                # A flat record fits on one line
+                lines.append(f"{indent}{key}: " + ', '.join(
+                    f"{k} {_value(v)}" for k, v in item.items() if not isinstance(v, (dict, list))))
+            elif isinstance(item, (dict, list)) and item:
+                lines.append(f"{indent}{key}:")
+                lines.extend(_generic(item, indent + "  "))
+            else:
+                lines.append(f"{indent}{key}: {_value(item)}")
+    elif isinstance(value, list):
+        for item in value:
+            lines.append(f"{indent}- {item}")
+    else:
+        lines.append(f"{indent}{_value(value)}")
+    return lines
+
+
+def render_text(doc):
+    """Render a capture document as the human-readable report"""
+    lines = ["=" * 80, f"G14 STATE CAPTURE - {doc['time'].replace('T', ' ')}", "=" * 80, ""]
+
+    s = doc.get('status')
+    if s is not None:
+        lines.append("CURRENT STATUS:")
+        lines.append(f"  CPU Temp: {_value(s['temp'], '°C')}")
+        lines.append(f"  CPU Fan: {_value(s['fan_rpm'], ' RPM')}")
+        lines.append(f"  CPU PWM: {_pwm(s['pwm_cpu'])}")
+        lines.append(f"  GPU PWM: {_pwm(s['pwm_gpu'])}")
+        lines.append(f"  Power Draw: {_value(s['power'], 'W')}")
+        lines.append(f"  GPU Status: {s['gpu_status']}")
+        lines.append(f"  GPU Control: {s['gpu_control']}")
+        lines.append(f"  Throttle Policy: {s['policy']}")
+        lines.append(f"  Platform Profile: {s['platform']}")
+        lines.append(f"  CPU Boost: {'Enabled' if s['boost'] else 'Disabled'}")
+        lines.append("")
+
+    curves = doc.get('curves')
+    if curves is not None and 'error' in curves:
+        lines += ["FAN CURVES:", f"  Error: {curves['error']}", ""]
+    elif curves is not None:
+        for fan, curve in curves.items():
+            lines.append(f"{fan.upper()} FAN CURVE:")
+            if curve is None:
+                lines.append(f"  Error reading curve from {doc.get('paths', {}).get('curve_hwmon')}")
+            else:
+                for i, point in enumerate(curve, 1):
+                    lines.append(f"  Point {i}: {point['temp']:.0f}°C = PWM {point['pwm']}")
+            lines.append("")
+
+    top = doc.get('processes')
+    if top is not None:
+        lines.append("TOP CPU PROCESSES:")
+        if 'error' in top:
+            lines.append(f"  Error: {top['error']}")
+        elif not top:
+            lines.append("  N/A")
+        else:
+            for name, percent in sorted(top.items(), key=lambda item: -item[1]):
+                lines.append(f"  {name}: {percent:.1f}%")
+        lines.append("")
+
+    titled = ('status', 'curves', 'processes', 'sensors', 'format', 'version', 'time')
+    for name, section in doc.items():
+        if name in titled:
+            continue
+        lines.append(f"{name.replace('_', ' ').upper()}:")
+        lines.extend(_generic(section))
+        lines.append("")
+
+    sensors_section = doc.get('sensors')
+    if sensors_section is not None:
+        lines.append("FULL SENSORS OUTPUT:")
+        if 'error' in sensors_section:
+            lines.append(f"  Error: {sensors_section['error']}")
+        else:
+            lines.append(sensors_section['output'].rstrip('\n'))
+        lines.append("")
+
+    lines += ["=" * 80, "State capture complete. Share the .json file for analysis.", "=" * 80]
+    return '\n'.join(lines) + '\n'
+
+
+def flatten(value, prefix=''):
+    """{dotted.path: leaf} of a nested document, list items as path[i]"""
+    if isinstance(value, dict):
+        items = {}
+        for key, item in value.items():
+            items.update(flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+        return items
+    if isinstance(value, list):
+        items = {}
+        for i, item in enumerate(value):
+            items.update(flatten(item, f"{prefix}[{i}]"))
+        return items
+    return {prefix: value}
+
+
+def diff(old, new, volatile=False):
+    """Return [(path, old value, new value)] of every field that differs
+
+    A field missing on one side shows as None there. Sections in
+    VOLATILE are skipped unless volatile is set.
+    """
+    a, b = flatten(old), flatten(new)
+    changes = []
+    for path in sorted(set(a) | set(b)):
+        section = path.split('.', 1)[0].split('[', 1)[0]
+        if not volatile and section in VOLATILE:
+            continue
+        if section == 'sensors' and path.endswith('.output'):
+            # The parsed values are compared instead
+            continue
+        if a.get(path) != b.get(path):
+            changes.append((path, a.get(path), b.get(path)))
+    return changes
+
+
+def format_diff(old, new, changes):
+    lines = [f"--- {old.get('time')} {old.get('machine', {}).get('hostname', '')}",
+             f"+++ {new.get('time')} {new.get('machine', {}).get('hostname', '')}"]
+    if not changes:
+        lines.append("No differences")
+    for path, before, after in changes:
+        lines.append(f"{path}: {_json(before)} -> {_json(after)}")
+    return '\n'.join(lines)
+
+
+def _json(value):
+    return "-" if value is None else json.dumps(value, ensure_ascii=False)
+
+
+def capture_main(directory=CAPTURE_DIR):
+    """Take a capture without the tray, print the paths written"""
+    sampler = Sampler(shared=SnapshotReader())
+    procs = ProcSampler(os.path.join(sampler.paths.root, 'proc'))
+    try:
+        sections = snapshot_sections(sampler.sample(), sampler)
+        sections.update(hardware_sections(sampler, lambda: procs.top(TOP_PROCESSES)))
+        paths = write(document(sections), directory)
+    except OSError as e:
+        print(f"Cannot write the capture: {e}", file=sys.stderr)
+        return 1
+    finally:
+        sampler.close()
+    print('\n'.join(paths))
+    return 0
+
+
+def diff_main(old_path, new_path, volatile=False):
+    """Print the differences between two captures, exit 1 if there are any"""
+    try:
+        old, new = load(old_path), load(new_path)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read capture: {e}", file=sys.stderr)
+        return 2
+    changes = diff(old, new, volatile)
+    print(format_diff(old, new, changes))
+    return 1 if changes else 0
@@ -0,0 +1,231 @@
+"""Throttle policy controller
+
+PolicyController replaces the fixed 60/75 degree thresholds with
+hysteresis bands, a minimum dwell time between transitions and an EWMA of
+the temperature slope. It steps up early when the temperature is climbing
+fast and steps down late when it is cooling, so a CPU hovering around a
+threshold no longer flaps the policy (and the fans) every tick.
+
+replay() runs a controller over a recorded temperature trace so settings
+can be compared offline without touching the hardware.
+"""
+from collections import Counter
+
+# Policy levels, from coolest/quietest to hottest
+LEVELS = ('quiet', 'balanced', 'performance')
+
+# (throttle_thermal_policy, platform_profile or None) written for each level
+LEVEL_SETTINGS = {
+    'quiet': ('2', 'quiet'),
+    'balanced': ('0', None),
+    'performance': ('1', None),
+}
+
+QUIET_BELOW = 60
+BALANCED_BELOW = 75
+
+HYSTERESIS = 3.0
+MIN_DWELL = 10.0
+SLOPE_ALPHA = 0.3
+LOOKAHEAD = 6.0
+
+# Don't step down while heating faster than this (degrees C per second)
+HEATING_SLOPE = 0.05
+
+
+class FixedThresholdController:
+    """The original behaviour: hard thresholds, no hysteresis or dwell"""
+
+    def __init__(self, quiet_below=QUIET_BELOW, balanced_below=BALANCED_BELOW):
+        self.thresholds = (quiet_below, balanced_below)
+        self.level = None
+        self.transitions = Counter()
+
+    def target(self, temp):
+        temp = int(temp)
+        if temp < self.thresholds[0]:
+            return 0
+        elif temp < self.thresholds[1]:
+            return 1
+        return 2
+
+    def update(self, temp, now):
+        """Feed one temperature sample, return the level name to apply"""
+        level = self.target(temp)
+        if self.level is not None and level != self.level:
+            self.transitions[(LEVELS[self.level], LEVELS[level])] += 1
+        self.level = level
+        return LEVELS[level]
+
+
+class PolicyController:
+    """Hysteresis, dwell and slope aware throttle policy selection
+
+    Going up a level needs the projected temperature (current temperature
+    plus the rising EWMA slope times lookahead seconds) to reach the
+    threshold. Going down needs the actual temperature to fall hysteresis
+    degrees below it while not heating faster than HEATING_SLOPE.
+    Transitions are at least min_dwell seconds apart unless the actual
+    temperature is already hysteresis degrees past the next threshold up.
+    """
+
+    def __init__(self, quiet_below=QUIET_BELOW, balanced_below=BALANCED_BELOW,
+                 hysteresis=HYSTERESIS, min_dwell=MIN_DWELL,
+                 slope_alpha=SLOPE_ALPHA, lookahead=LOOKAHEAD):
+        self.thresholds = (quiet_below, balanced_below)
+        self.hysteresis = hysteresis
+        self.min_dwell = min_dwell
+        self.slope_alpha = slope_alpha
+        self.lookahead = lookahead
+
+        self.level = None
+        self.slope = 0.0
+        self.last_temp = None
+        self.last_time = None
+        self.changed_at = None
+        self.transitions = Counter()
+
+    def update(self, temp, now):
+        """Feed one temperature sample taken at now (seconds), return the level name"""
+        self._update_slope(temp, now)
+
+        if self.level is None:
+            self.level = self._initial_level(temp)
+            self.changed_at = now
+            return LEVELS[self.level]
+
+        level = self.level
+        projected = temp + max(self.slope, 0.0) * self.lookahead
+        while level < len(self.thresholds) and projected >= self.thresholds[level]:
+            level += 1
+        if level == self.level:
+            while (level > 0 and temp < self.thresholds[level - 1] - self.hysteresis
+                   and self.slope <= HEATING_SLOPE):
+                level -= 1
+
+        if level != self.level and self._may_switch(temp, level, now):
+            self.transitions[(LEVELS[self.level], LEVELS[level])] += 1
+            self.level = level
+            self.changed_at = now
+        return LEVELS[self.level]
+
+    def _initial_level(self, temp):
+        level = 0
+        while level < len(self.thresholds) and temp >= self.thresholds[level]:
+            level += 1
+        return level
+
+    def _update_slope(self, temp, now):
+        if self.last_time is not None and now > self.last_time:
+            rate = (temp - self.last_temp) / (now - self.last_time)
+            self.slope += self.slope_alpha * (rate - self.slope)
+        self.last_temp = temp
+        self.last_time = now
+
+    def _may_switch(self, temp, level, now):
+        if now - self.changed_at >= self.min_dwell:
+            return True
+        # Never hold a cool policy while the CPU is clearly past the threshold
+        return level > self.level and temp >= self.thresholds[level - 1] + self.hysteresis
+
+
+def load_trace(f, interval=2.0):
+    """Read a trace of "seconds,temp" or bare "temp" lines into (time, temp) pairs"""
+    trace = []
+    for line in f:
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        fields = line.replace(',', ' ').split()
+        try:
+            if len(fields) >= 2:
+                trace.append((float(fields[0]), float(fields[1])))
+            else:
+                trace.append((len(trace) * interval, float(fields[0])))
+        except ValueError:
+            # Header line
+            continue
+    return trace
+
+
+def replay(trace, controller, reference=None):
+    """Run controller over trace and return its statistics as a dict
+
+    Response latency is measured against reference (the fixed threshold
+    controller by default). Each time either of them steps up into a
+    level the controller wasn't already in, the latency is the
+    controller's step time minus the reference's, so it is negative when
+    the controller anticipated the step. Reference steps that are undone
+    before the controller follows are counted as filtered.
+    """
+    if reference is None:
+        reference = FixedThresholdController(*controller.thresholds)
+
+    time_in = Counter()
+    latencies = []
+    filtered = 0
+    # Per level: when the reference stepped up and is waiting for the
+    # controller, and when the controller stepped up ahead of the reference
+    waiting = {}
+    ahead = {}
+    prev_time = prev_level = prev_ref = None
+
+    for now, temp in trace:
+        level = LEVELS.index(controller.update(temp, now))
+        ref = LEVELS.index(reference.update(temp, now))
+
+        if prev_time is not None:
+            time_in[LEVELS[prev_level]] += now - prev_time
+
+            for lvl in range(1, len(LEVELS)):
+                rose = prev_level < lvl <= level
+                ref_rose = prev_ref < lvl <= ref
+                if rose and (ref_rose or lvl in waiting):
+                    latencies.append(now - waiting.pop(lvl, now))
+                elif rose:
+                    ahead[lvl] = now
+                elif ref_rose and lvl in ahead:
+                    latencies.append(ahead.pop(lvl) - now)
+                elif ref_rose and level < lvl:
+                    waiting[lvl] = now
+
+                if level < lvl:
+                    ahead.pop(lvl, None)
+                    if ref < lvl and lvl in waiting:
+                        del waiting[lvl]
+                        filtered += 1
+
+        prev_time, prev_level, prev_ref = now, level, ref
+
+    return {
+        'samples': len(trace),
+        'duration': trace[-1][0] - trace[0][0] if trace else 0.0,
+        'transitions': sum(controller.transitions.values()),
+        'reference_transitions': sum(reference.transitions.values()),
+        'transitions_by_kind': {f"{a}->{b}": n for (a, b), n in sorted(controller.transitions.items())},
+        'time_in_level': {name: time_in[name] for name in LEVELS},
+        'latency_mean': sum(latencies) / len(latencies) if latencies else None,
+        'latency_max': max(latencies) if latencies else None,
+        'filtered_steps': filtered + len(waiting),
+    }
+
+
+def format_report(stats):
+    """Render replay() statistics as text"""
+    lines = [
+        f"Samples:      {stats['samples']} over {stats['duration']:.0f}s",
+        f"Transitions:  {stats['transitions']} (fixed thresholds: {stats['reference_transitions']})",
+    ]
+    for kind, count in stats['transitions_by_kind'].items():
+        lines.append(f"  {kind}: {count}")
+    lines.append("Time in level:")
+    for name, seconds in stats['time_in_level'].items():
+        lines.append(f"  {name}: {seconds:.0f}s")
+    if stats['latency_mean'] is None:
+        lines.append("Step-up latency: n/a")
+    else:
+        lines.append(f"Step-up latency: mean {stats['latency_mean']:+.1f}s, "
+                     f"max {stats['latency_max']:+.1f}s (vs fixed thresholds)")
+    if stats['filtered_steps']:
+        lines.append(f"Short excursions ridden out: {stats['filtered_steps']}")
+    return '\n'.join(lines)
@@ -0,0 +1,201 @@
+"""Cached fan curves with precomputed temp -> PWM lookup
+
+The asus custom fan curve is exposed as 8 pwmN_auto_point{i}_{temp,pwm}
+pairs per fan. They are read once through persistent file descriptors
+and turned into a per-degree segment index, so mapping a temperature to a
+PWM value is an array lookup instead of 16 file reads and a linear scan.
+Every RECHECK_INTERVAL seconds an inotify watch on the 16 files is checked
+with a single non-blocking read, and the files are only re-read when
+someone wrote them, after invalidate(), or every RELOAD_INTERVAL seconds
+in case the firmware changed them without a write through sysfs. Each
+refresh publishes a new {fan: FanCurve} dict in one assignment, so readers
+on other threads see either the old or the new curves.
+"""
+import bisect
+import os
+import threading
+import time
+
+from g14 import instrument
+from g14.events import Inotify
+from g14.hwmon import SysfsAttr
+
+CURVE_POINTS = 8
+RECHECK_INTERVAL = 30.0
+# Full re-read even without inotify events, or on every check without inotify
+RELOAD_INTERVAL = 300.0
+
+FANS = {1: 'cpu', 2: 'gpu'}
+
+
+class FanCurve:
+    """An immutable fan curve with a per-degree segment index"""
+
+    def __init__(self, points):
+        self.points = tuple(points)
+        self.temps = [t for t, _ in self.points]
+        self.pwms = [p for _, p in self.points]
+
+        # (pwm delta, width) of each segment, None for zero-width segments
+        self._segments = []
+        for i in range(len(self.points) - 1):
+            width = self.temps[i + 1] - self.temps[i]
+            if width > 0:
+                self._segments.append((self.pwms[i + 1] - self.pwms[i], width))
+            else:
+                self._segments.append(None)
+
+        # _index[d - _base] is the segment that starts at or below degree d
+        self._base = int(self.temps[0])
+        top = int(self.temps[-1])
+        self._index = [
+            bisect.bisect_right(self.temps, d) - 1
+            for d in range(self._base, top + 1)
+        ]
+
+    def pwm(self, temp):
+        """Interpolate the PWM value (0-255) for temp, or None"""
+        if temp is None:
+            return None
+        temps = self.temps
+        if temp <= temps[0]:
+            return self.pwms[0]
+        if temp >= temps[-1]:
+            return self.pwms[-1]
+
+        seg = self._index[int(temp) - self._base]
+        if temps[seg + 1] < temp:
+            # Only reachable with fractional curve temperatures
+            seg = bisect.bisect_right(temps, temp) - 1
+        segment = self._segments[seg]
+        if segment is None:
+            return None
+        delta, width = segment
+        return int(self.pwms[seg] + delta * (temp - temps[seg]) / width)
+
+    def __eq__(self, other):
+        return isinstance(other, FanCurve) and self.points == other.points
+
+    def __hash__(self):
+        return hash(self.points)
+
+
+class FanCurves:
+    """Both fan curves, loaded once and reloaded only when they change"""
+
+    def __init__(self, hwmon_path, recheck_interval=RECHECK_INTERVAL,
+                 reload_interval=RELOAD_INTERVAL):
+        self.hwmon_path = hwmon_path
+        self.recheck_interval = recheck_interval
+        self.reload_interval = reload_interval
+        # Replaced as a whole, never modified in place
+        self.curves = {}
+        self.reloads = 0
+        self.reads = 0
+        self._attrs = {}
+        self._checked = None
+        self._loaded = None
+        self._dirty = True
+        self._watch = None
+        self._unwatched = False
+        # Captures force a refresh from a worker thread
+        self._lock = threading.Lock()
+
+    def pwm(self, fan, temp):
+        """Return the PWM value (0-255) for fan 1 (CPU) or 2 (GPU) at temp"""
+        self.refresh()
+        curve = self.curves.get(fan)
+        if curve is None:
+            return None
+        return curve.pwm(temp)
+
+    def invalidate(self):
+        """Force a reload on the next access, e.g. after writing a curve"""
+        with self._lock:
+            self._dirty = True
+
+    def refresh(self, force=False):
+        """Re-read the curve files if they are due and may have changed"""
+        now = time.monotonic()
+        with self._lock:
+            if not (force or self._dirty or self._checked is None
+                    or now - self._checked >= self.recheck_interval):
+                return
+            self._checked = now
+            if not (force or self._dirty or self._loaded is None
+                    or now - self._loaded >= self.reload_interval or self._written()):
+                return
+            self.reads += 1
+            self._loaded = now
+            self._dirty = False
+            curves = {}
+            for fan in FANS:
+                curve = self._read(fan)
+                if curve != self.curves.get(fan):
+                    self.reloads += 1
+                if curve is not None:
+                    curves[fan] = curve
+            self.curves = curves
+
+    def _written(self):
+        """Whether a curve file was written since the last check"""
+        if self._watch is None:
+            return True
+        try:
+            return bool(self._watch.read())
+        except OSError:
+            return True
+
+    def _watch_file(self, path, fan):
+        if self._unwatched:
+            return
+        try:
+            if self._watch is None:
+                self._watch = Inotify()
+            self._watch.add(path, fan)
+        except (OSError, AttributeError):
+            # Without a watch on every file, re-read on every check
+            if self._watch is not None:
+                self._watch.close()
+                self._watch = None
+            self._unwatched = True
+
+    @instrument.timed('curves.read')
+    def _read(self, fan):
+        """Read one fan curve through the cached descriptors"""
+        if self.hwmon_path is None:
+            return None
+        try:
+            attrs = self._attrs.get(fan)
+            if attrs is None:
+                attrs = self._attrs[fan] = []
+                for i in range(1, CURVE_POINTS + 1):
+                    prefix = os.path.join(self.hwmon_path, f'pwm{fan}_auto_point{i}')
+                    temp_attr = SysfsAttr(prefix + '_temp')
+                    try:
+                        pwm_attr = SysfsAttr(prefix + '_pwm')
+                    except OSError:
+                        temp_attr.close()
+                        raise
+                    attrs.append((temp_attr, pwm_attr))
+                    self._watch_file(temp_attr.path, fan)
+                    self._watch_file(pwm_attr.path, fan)
+            # Curve temps are already in degrees C
+            return FanCurve((float(t.read()), int(p.read())) for t, p in attrs)
+        except (OSError, ValueError) as e:
+            instrument.error('curves.read', e)
+            instrument.stale('curves.read')
+            self._close(fan)
+            return None
+
+    def _close(self, fan):
+        for temp_attr, pwm_attr in self._attrs.pop(fan, ()):
+            temp_attr.close()
+            pwm_attr.close()
+
+    def close(self):
+        for fan in list(self._attrs):
+            self._close(fan)
+        if self._watch is not None:
+            self._watch.close()
+            self._watch = None
@@ -0,0 +1,375 @@
+"""Fan curve what-if simulator
+
+    python3 g14-curvesim.py [--since 24h] [--random 5000] [--curve 30:0,40:10,...]
+
+Replays a recorded temperature trace (the telemetry store, or a
+"seconds,temp" file as taken by the daemon's --simulate) through candidate
+8-point fan curves and reports, for each curve, the time spent above PWM
+thresholds, the spin-ups the tray would have logged and the mean PWM.
+The interpolation matches FanCurve.pwm and the spin-up rule matches the
+tray's detect_pwm_change (a rise of 30+ PWM over the lowest value of the
+last 10 s, logged at most every 30 s).
+
+Curves are evaluated in batches with NumPy: PWM is computed once per
+distinct temperature in the trace, so time-above and mean PWM are a
+matrix product, and spin-ups of a non-decreasing curve are checked once
+per distinct (temperature, 10 s minimum) pair. The trace is
+replayed as recorded, a curve that moves more air doesn't lower the
+temperatures it is evaluated against.
+"""
+import argparse
+import json
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    # Only the simulator needs it
+    np = None
+
+from g14 import controller, telemetry
+from g14.curves import CURVE_POINTS, FanCurves
+from g14.paths import probe
+
+# PWM levels (0-255) to report the time above, 25/50/75%
+THRESHOLDS = (64, 128, 192)
+
+# The tray's spin-up rule
+SPINUP_DELTA = 30
+SPINUP_WINDOW = 10.0
+SPINUP_HOLDOFF = 30.0
+
+# A longer gap between samples (suspend, daemon stopped) counts as this long
+MAX_GAP = 10.0
+
+# Curve x sample cells evaluated at once, bounds memory to some tens of MB
+BATCH_CELLS = 2000000
+
+TEMP_RANGE = (20, 105)
+SORT_KEYS = ('spinups', 'mean', 'above')
+
+
+def parse_curve(text):
+    """Parse "temp:pwm,..." with CURVE_POINTS points into a tuple of pairs"""
+    points = []
+    for point in text.replace(' ', '').split(','):
+        temp, sep, pwm = point.partition(':')
+        if not sep:
+            raise ValueError(f"curve point {point!r} isn't temp:pwm")
+        points.append((float(temp), int(pwm)))
+    check_curve(points)
+    return tuple(points)
+
+
+def check_curve(points):
+    if len(points) != CURVE_POINTS:
+        raise ValueError(f"a curve has {CURVE_POINTS} points, got {len(points)}")
+    temps = [t for t, _ in points]
+    if any(b <= a for a, b in zip(temps, temps[1:])):
+        raise ValueError("curve temperatures must be increasing")
+    if any(not 0 <= p <= 255 for _, p in points):
+        raise ValueError("curve PWM values must be 0-255")
+
+
+def format_curve(points):
+    return ','.join(f"{t:g}:{p:d}" for t, p in points)
+
+
+def load_curves(f):
+    """Read one curve per line, # starts a comment"""
+    curves = []
+    for line in f:
+        line = line.split('#', 1)[0].strip()
+        if line:
+            curves.append(parse_curve(line))
+    return curves
+
+
+def current_curve(fan=1):
+    """Return the curve programmed for fan, or None"""
+    curves = FanCurves(probe().curve_hwmon)
+    try:
+        curves.refresh(force=True)
+        curve = curves.curves.get(fan)
+        return curve.points if curve is not None else None
+    finally:
+        curves.close()
+
+
+def random_curves(base, count, spread_temp=5.0, spread_pwm=30, seed=None):
+    """Return count random variations of base as a (count, points, 2) array
+
+    Each point moves by up to spread_temp degrees and spread_pwm PWM, then
+    the temperatures are kept a degree apart and both columns sorted, so
+    every candidate is a valid, non-decreasing curve.
+    """
+    rng = np.random.default_rng(seed)
+    base = np.asarray(base, dtype=float)
+    temps = base[:, 0] + rng.uniform(-spread_temp, spread_temp, (count, CURVE_POINTS))
+    temps = np.sort(np.round(np.clip(temps, *TEMP_RANGE)), axis=1)
+    # Strictly increasing, a degree apart
+    temps = np.maximum.accumulate(temps - np.arange(CURVE_POINTS), axis=1) + np.arange(CURVE_POINTS)
+    pwms = base[:, 1] + rng.integers(-spread_pwm, spread_pwm + 1, (count, CURVE_POINTS))
+    pwms = np.sort(np.clip(pwms, 0, 255), axis=1)
+    return np.stack([temps, pwms], axis=2)
+
+
+def trace_arrays(trace):
+    """(times, temps) arrays of a [(seconds, temp)] trace, unreadable samples dropped"""
+    data = np.array([(t, temp) for t, temp in trace if temp is not None], dtype=float).reshape(-1, 2)
+    data = data[~np.isnan(data).any(axis=1)]
+    data = data[np.argsort(data[:, 0], kind='stable')]
+    return data[:, 0], data[:, 1]
+
+
+def curve_pwm(temps, pwms, values):
+    """PWM of every curve at every value, as FanCurve.pwm computes it
+
+    temps and pwms are (curves, points), values is (samples,), the result
+    is (curves, samples).
+    """
+    values = values[None, :]
+    # The segment a value falls in starts at the last point at or below it
+    seg = (temps[:, :, None] <= values[:, None, :]).sum(axis=1) - 1
+    seg = np.clip(seg, 0, CURVE_POINTS - 2)
+    t0 = np.take_along_axis(temps, seg, axis=1)
+    t1 = np.take_along_axis(temps, seg + 1, axis=1)
+    p0 = np.take_along_axis(pwms, seg, axis=1)
+    p1 = np.take_along_axis(pwms, seg + 1, axis=1)
+    pwm = np.trunc(p0 + (p1 - p0) * (values - t0) / (t1 - t0))
+    pwm = np.where(values <= temps[:, :1], pwms[:, :1], pwm)
+    pwm = np.where(values >= temps[:, -1:], pwms[:, -1:], pwm)
+    return pwm.astype(np.int16)
+
+
+def _window_lags(times, window):
+    """Per lag k, which samples have the sample k before them inside the window"""
+    lags = []
+    k = 1
+    while k < len(times):
+        inside = np.zeros(len(times), dtype=bool)
+        inside[k:] = times[k:] - times[:-k] <= window
+        if not inside.any():
+            break
+        lags.append(inside)
+        k += 1
+    return lags
+
+
+def _rolling_min(rows, lags):
+    """Minimum of each row over the samples inside the window, per sample"""
+    lowest = rows.copy()
+    for k, inside in enumerate(lags, 1):
+        shifted = rows.copy()
+        shifted[..., k:] = np.where(inside[k:], rows[..., :-k], rows[..., k:])
+        np.minimum(lowest, shifted, out=lowest)
+    return lowest
+
+
+def _count_spinups(n, rows, times):
+    """Spin-ups per curve from the (curve, time) of every sample meeting the rule"""
+    counts = np.zeros(n, dtype=np.int64)
+    order = np.lexsort((times, rows))
+    rows, times = rows[order], times[order]
+    starts = np.searchsorted(rows, np.arange(n + 1))
+    for row in np.nonzero(np.diff(starts))[0]:
+        candidates = times[starts[row]:starts[row + 1]]
+        # Logged at most once per holdoff, each log starts a new one
+        i = 0
+        while i < len(candidates):
+            counts[row] += 1
+            i = np.searchsorted(candidates, candidates[i] + SPINUP_HOLDOFF, 'left')
+    return counts
+
+
+def evaluate(curves, times, temps, thresholds=THRESHOLDS):
+    """Replay the trace through every curve of a (curves, points, 2) array
+
+    Returns a dict of per-curve arrays: mean and max PWM, seconds above
+    each threshold (curves, thresholds) and spin-ups.
+    """
+    curves = np.asarray(curves, dtype=float)
+    dt = np.minimum(np.diff(times, append=times[-1]), MAX_GAP)
+    total = dt.sum()
+    values, inverse = np.unique(temps, return_inverse=True)
+    # Seconds spent at each distinct temperature
+    weights = np.bincount(inverse, weights=dt, minlength=len(values))
+    lags = _window_lags(times, SPINUP_WINDOW)
+    levels = np.asarray(thresholds)
+
+    # With a non-decreasing curve the lowest PWM in the window is the PWM
+    # of the lowest temperature in it, so a spin-up only depends on the
+    # (temperature, window minimum) pair and each distinct pair is checked
+    # once per curve instead of every sample
+    monotonic = (np.diff(curves[:, :, 1], axis=1) >= 0).all(axis=1)
+    lowest = np.searchsorted(values, _rolling_min(temps, lags))
+    rising = np.nonzero(lowest < inverse)[0]
+    pairs, pair_of = np.unique(inverse[rising] * len(values) + lowest[rising], return_inverse=True)
+    high, low = np.divmod(pairs, len(values))
+
+    n = len(curves)
+    mean = np.empty(n)
+    peak = np.empty(n, dtype=np.int64)
+    above = np.empty((n, len(levels)))
+    spinups = np.empty(n, dtype=np.int64)
+    batch = max(1, BATCH_CELLS // max(len(times), len(values) * CURVE_POINTS))
+    for start in range(0, n, batch):
+        chunk = curves[start:start + batch]
+        end = start + len(chunk)
+        table = curve_pwm(chunk[:, :, 0], chunk[:, :, 1], values)
+        mean[start:end] = table @ weights / total if total else table.mean(axis=1)
+        peak[start:end] = table.max(axis=1)
+        above[start:end] = (table[:, None, :] > levels[None, :, None]) @ weights
+        if monotonic[start:end].all():
+            jumps = table[:, high] - table[:, low] >= SPINUP_DELTA
+            rows, cols = np.nonzero(jumps[:, pair_of])
+            hits = rising[cols]
+        else:
+            pwm = table[:, inverse]
+            rows, hits = np.nonzero(pwm - _rolling_min(pwm, lags) >= SPINUP_DELTA)
+        spinups[start:end] = _count_spinups(len(chunk), rows, times[hits])
+    return {'mean': mean, 'max': peak, 'above': above, 'spinups': spinups,
+            'duration': total, 'samples': len(times)}
+
+
+def rank(results, key='spinups'):
+    """Curve indices, best first by key, ties broken by the other two
+
+    'above' is the time above the highest threshold.
+    """
+    above = results['above'][:, -1]
+    orders = {
+        'spinups': (results['mean'], above, results['spinups']),
+        'above': (results['mean'], results['spinups'], above),
+        'mean': (above, results['spinups'], results['mean']),
+    }
+    return np.lexsort(orders[key])
+
+
+def report(curves, results, order, thresholds, top, fmt, out, baseline=None):
+    rows = [(str(n), i) for n, i in enumerate(order[:top], 1)]
+    if baseline is not None:
+        rows.insert(0, ('now', baseline))
+
+    def row(i):
+        return {
+            'curve': format_curve((float(t), int(p)) for t, p in curves[i]),
+            'spinups': int(results['spinups'][i]),
+            'mean_pwm': round(float(results['mean'][i]), 1),
+            'max_pwm': int(results['max'][i]),
+            'seconds_above': {str(level): round(float(s), 1)
+                              for level, s in zip(thresholds, results['above'][i])},
+        }
+
+    if fmt == 'json':
+        json.dump({'duration': results['duration'], 'samples': results['samples'],
+                   'curves': len(curves),
+                   'ranked': [dict(rank=label, **row(i)) for label, i in rows]}, out, indent=2)
+        out.write('\n')
+        return
+
+    duration = results['duration']
+    header = f"{'rank':>4} {'spinups':>7} {'mean':>6} {'max':>4} " + ' '.join(
+        f"{f'>{level}':>6}" for level in thresholds) + "  curve (temp:pwm)"
+    print(header, file=out)
+    for label, i in rows:
+        r = row(i)
+        shares = ' '.join(f"{100 * s / duration if duration else 0:5.1f}%"
+                          for s in results['above'][i])
+        print(f"{label:>4} {r['spinups']:7d} {r['mean_pwm']:6.1f} {r['max_pwm']:4d} {shares}  {r['curve']}",
+              file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded temperatures through candidate fan curves")
+    parser.add_argument('--dir', default=telemetry.TELEMETRY_DIR,
+                        help="telemetry directory to read the trace from (default %(default)s)")
+    parser.add_argument('--since', default='24h',
+                        help="trace start as epoch, ISO time or age like 6h, 7d (default %(default)s)")
+    parser.add_argument('--until', help="trace end, same formats as --since (default now)")
+    parser.add_argument('--tier', choices=['auto'] + list(telemetry.TIERS), default='auto',
+                        help="telemetry resolution to read (default picks one for the range)")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="read a \"seconds,temp\" trace instead of telemetry (- for stdin)")
+    parser.add_argument('--trace-interval', type=float, default=2.0,
+                        help="sample spacing for traces without timestamps (default %(default)s)")
+    parser.add_argument('--curve', action='append', default=[], metavar='T:P,...',
+                        help=f"a candidate curve of {CURVE_POINTS} temp:pwm points, repeatable")
+    parser.add_argument('--candidates', metavar='FILE', help="read candidate curves, one per line")
+    parser.add_argument('--random', type=int, default=0, metavar='N',
+                        help="add N random variations of the current (or first) curve")
+    parser.add_argument('--spread-temp', type=float, default=5.0,
+                        help="how far random variations move a point's temperature (default %(default)s)")
+    parser.add_argument('--spread-pwm', type=int, default=30,
+                        help="how far random variations move a point's PWM (default %(default)s)")
+    parser.add_argument('--seed', type=int, help="random seed, for repeatable searches")
+    parser.add_argument('--fan', type=int, choices=(1, 2), default=1,
+                        help="fan whose programmed curve is the baseline, 1 CPU or 2 GPU (default %(default)s)")
+    parser.add_argument('--thresholds', default=','.join(map(str, THRESHOLDS)),
+                        help="PWM levels to report the time above (default %(default)s)")
+    parser.add_argument('--sort', choices=SORT_KEYS, default='spinups',
+                        help="what ranks a curve first (default %(default)s)")
+    parser.add_argument('--top', type=int, default=10, help="curves to show (default %(default)s)")
+    parser.add_argument('--format', choices=('text', 'json'), default='text',
+                        help="output format (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    if np is None:
+        print("NumPy (python3-numpy) is required for the curve simulator", file=sys.stderr)
+        return 1
+
+    try:
+        thresholds = tuple(int(level) for level in args.thresholds.split(','))
+        candidates = [parse_curve(text) for text in args.curve]
+        if args.candidates:
+            with open(args.candidates, 'r') as f:
+                candidates.extend(load_curves(f))
+    except ValueError as e:
+        parser.error(str(e))
+    except OSError as e:
+        print(f"Cannot read candidates: {e}", file=sys.stderr)
+        return 1
+
+    try:
+        if args.trace:
+            if args.trace == '-':
+                trace = controller.load_trace(sys.stdin, args.trace_interval)
+            else:
+                with open(args.trace, 'r') as f:
+                    trace = controller.load_trace(f, args.trace_interval)
+        else:
+            since = telemetry.parse_time(args.since)
+            until = telemetry.parse_time(args.until)
+            trace = [(r['time'], r['temp']) for r in
+                     telemetry.query(args.dir, since, until, args.tier)]
+    except (OSError, ValueError) as e:
+        print(f"Cannot read the trace: {e}", file=sys.stderr)
+        return 1
+    times, temps = trace_arrays(trace)
+    if len(times) < 2:
+        print("The trace has fewer than 2 temperature samples", file=sys.stderr)
+        return 1
+
+    baseline = current_curve(args.fan)
+    curves = ([baseline] if baseline is not None else []) + candidates
+    if args.random:
+        base = curves[0] if curves else None
+        if base is None:
+            parser.error("--random needs a programmed curve or a --curve to vary")
+        curves = np.concatenate([np.asarray(curves, dtype=float),
+                                 random_curves(base, args.random, args.spread_temp,
+                                               args.spread_pwm, args.seed)])
+    if not len(curves):
+        parser.error("no curves to simulate, give --curve, --candidates or --random")
+    curves = np.asarray(curves, dtype=float)
+
+    started = time.perf_counter()
+    results = evaluate(curves, times, temps, thresholds)
+    elapsed = time.perf_counter() - started
+    order = rank(results, args.sort)
+    report(curves, results, order, thresholds, args.top, args.format, sys.stdout,
+           baseline=0 if baseline is not None else None)
+    print(f"{len(curves)} curves over {len(times)} samples ({results['duration'] / 3600:.1f}h) "
+          f"in {elapsed:.2f}s", file=sys.stderr)
+    return 0
@@ -0,0 +1,373 @@
+"""Root fan control daemon
+
+Replaces the nuclear-fan-control-v2.sh loop. Sensors are read through
+the shared Sampler's persistent handles and every control attribute goes
+through a CachedWriter that remembers the last value written, so the
+ACPI/WMI attributes are only touched on an actual transition and nothing
+is forked per tick. Slow-changing attributes are only re-read at their registry
+cadence, or right after the daemon writes them. Between ticks the loop
+waits on an EventSource, so a profile change, an AC unplug or a dGPU
+wake starts a tick within milliseconds instead of on the next poll.
+Each tick's snapshot is appended to the binary telemetry store and
+published to shared memory for the tray and TUI, and can be served as
+OpenMetrics on localhost.
+"""
+import argparse
+import glob
+import os
+import signal
+import sys
+import time
+
+from g14 import cadence, controller, events, metrics, shm, telemetry
+from g14.cadence import AdaptiveInterval
+from g14.controller import PolicyController, LEVEL_SETTINGS
+from g14.energy import EnergyMeter, state_of
+from g14.metrics import Metrics, MetricsServer
+from g14.sampler import Sampler, POLICY_NAMES
+from g14.shm import SnapshotPublisher
+from g14.telemetry import TelemetryStore
+
+STATS_INTERVAL = 3600.0
+
+# Attributes the kernel notifies about only need a slow safety poll
+NOTIFIED_CADENCE = 60.0
+# Shortest gap between ticks started by events
+EVENT_HOLDOFF = 0.1
+
+
+def log(message):
+    """Log a line to stdout, which systemd sends to the journal"""
+    print(message, flush=True)
+
+
+class CachedWriter:
+    """A writable sysfs attribute that skips writes of an unchanged value"""
+
+    def __init__(self, path):
+        self.path = path
+        self.last = None
+        self.writes = 0
+        self.skipped = 0
+        self.errors = 0
+        if path is not None:
+            # Seed the cache so a value that is already set is never rewritten
+            try:
+                with open(path, 'r') as f:
+                    self.last = f.read().strip()
+            except OSError:
+                pass
+
+    def write(self, value):
+        """Write value unless it was the last value written, return True if written"""
+        if self.path is None:
+            return False
+        if value == self.last:
+            self.skipped += 1
+            return False
+        try:
+            # Writes only happen on transitions, so there's no handle to keep
+            with open(self.path, 'w') as f:
+                f.write(value)
+        except OSError as e:
+            self.errors += 1
+            log(f"Failed to write {value} to {self.path}: {e}")
+            return False
+        self.last = value
+        self.writes += 1
+        return True
+
+    def forget(self):
+        """Drop the cached value so the next write always goes through"""
+        self.last = None
+
+
+class FanDaemon:
+    """Keeps the G14 in its quietest usable thermal state"""
+
+    def __init__(self, sampler=None, policy=None, cadence=None,
+                 stats_interval=STATS_INTERVAL, telemetry=None, publisher=None,
+                 metrics=None, events=None):
+        self.sampler = sampler or Sampler()
+        self.policy = policy or PolicyController()
+        self.cadence = cadence or AdaptiveInterval()
+        self.telemetry = telemetry
+        self.publisher = publisher
+        self.metrics = metrics
+        self.events = events
+        self.event_ticks = 0
+        # Energy per supply, policy, profile and GPU state, while snapshots are taken
+        self.energy = EnergyMeter()
+        self.paths = self.sampler.paths
+        self.stats_interval = stats_interval
+        self.running = False
+        self.ticks = 0
+
+        self.writers = {
+            'throttle_policy': CachedWriter(self.paths.throttle_policy),
+            'platform_profile': CachedWriter(self.paths.platform_profile),
+            'gpu_control': CachedWriter(self.paths.gpu_control),
+            'cpu_boost': CachedWriter(self.paths.cpu_boost),
+        }
+        governors = os.path.join(self.paths.root, 'sys/devices/system/cpu/cpu*/cpufreq/scaling_governor')
+        self.governors = [CachedWriter(path) for path in sorted(glob.glob(governors))]
+
+    def write(self, name, value):
+        """Write a control attribute and have the sampler re-read it"""
+        if self.writers[name].write(value):
+            self.sampler.registry.invalidate(name)
+
+    def enforce(self, name, value, current, shown=None):
+        """Write value, also when the cache says it is set but the attribute
+        was read back as something else (shown is how current spells value)"""
+        if current != (value if shown is None else shown):
+            # Another tool changed it behind our back
+            self.writers[name].forget()
+        self.write(name, value)
+
+    def setup(self):
+        """One-off settings applied at startup"""
+        self.write('cpu_boost', '0')
+        for governor in self.governors:
+            governor.write('powersave')
+
+    def tick(self):
+        """Run one control iteration, return the seconds until the next one"""
+        self.ticks += 1
+        started = time.perf_counter()
+        now = time.monotonic()
+
+        snapshot = sample_seconds = None
+        if self.telemetry is not None or self.publisher is not None or self.metrics is not None:
+            # The control decision uses the same readings that get recorded
+            snapshot = self.sampler.sample()
+            sample_seconds = time.perf_counter() - started
+            self.energy.add(now, snapshot.power, state_of(snapshot))
+            values = {'gpu_control': snapshot.gpu_control, 'temp': snapshot.temp,
+                      'policy': snapshot.policy, 'platform': snapshot.platform}
+        else:
+            # The attributes are only read when due or invalidated by an event
+            values = self.sampler.registry.poll(('gpu_control', 'temp', 'policy', 'platform'))
+        temp = values['temp']
+
+        # Keep the dGPU on runtime PM, other tools can change it behind our back
+        if values['gpu_control'] not in ("auto", "unknown"):
+            self.enforce('gpu_control', 'auto', values['gpu_control'])
+
+        # Act on what was read back, not on what we last wrote
+        if temp is not None:
+            level = self.policy.update(temp, now)
+            policy, profile = LEVEL_SETTINGS[level]
+            self.enforce('throttle_policy', policy, values['policy'], POLICY_NAMES[policy])
+            if profile is not None:
+                self.enforce('platform_profile', profile, values['platform'])
+
+        pwm = snapshot.pwm_cpu if snapshot is not None else self.sampler.pwm(1, temp)
+        interval = self.cadence.update(temp, pwm, now)
+
+        if self.telemetry is not None:
+            self.record(snapshot)
+        if self.publisher is not None:
+            self.publisher.publish(snapshot, interval)
+        if self.metrics is not None:
+            self.metrics.update(snapshot, self.ticks, interval, self.policy.transitions,
+                                self.stats(), time.perf_counter() - started, sample_seconds,
+                                self.sampler.extra_values(), self.energy.states)
+        return interval
+
+    def record(self, snapshot):
+        try:
+            self.telemetry.append(snapshot)
+        except OSError as e:
+            log(f"Telemetry disabled, failed to write {self.telemetry.directory}: {e}")
+            self.telemetry.close()
+            self.telemetry = None
+
+    def stats(self):
+        """Return (writes, writes avoided, errors) over every attribute"""
+        writers = list(self.writers.values()) + self.governors
+        return (sum(w.writes for w in writers),
+                sum(w.skipped for w in writers),
+                sum(w.errors for w in writers))
+
+    def log_stats(self):
+        writes, skipped, errors = self.stats()
+        transitions = sum(self.policy.transitions.values())
+        log(f"{self.ticks} ticks ({self.cadence.wakeups_saved} wakeups saved, "
+            f"{self.event_ticks} started by events, interval {self.cadence.interval:g}s), "
+            f"{transitions} policy transitions, "
+            f"{writes} writes, {skipped} writes avoided, {errors} errors")
+        seconds, joules = self.energy.total(('battery',))
+        if seconds:
+            log(f"{joules / 3600:.2f} Wh drawn from the battery over {seconds / 3600:.2f}h "
+                f"by {len(self.energy.totals(supplies=('battery',)))} policy/profile/GPU states")
+
+    def stop(self, *args):
+        self.running = False
+
+    def run(self):
+        log("=== NUCLEAR FAN CONTROL V2 (python) ===")
+        for name, path in self.paths._asdict().items():
+            log(f"  {name}: {path or 'not found'}")
+        if self.events is not None:
+            for line in self.events.describe():
+                log(f"  events {line}")
+            for name in self.events.notified:
+                self.sampler.registry.set_cadence(name, NOTIFIED_CADENCE)
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGUSR1, lambda *args: self.log_stats())
+
+        if self.telemetry is None and self.publisher is None and self.metrics is None:
+            log("  energy not metered, snapshots are only taken for telemetry, shm or metrics")
+
+        self.setup()
+        self.running = True
+        last_stats = time.monotonic()
+        while self.running:
+            started = time.monotonic()
+            interval = self.tick()
+            now = time.monotonic()
+            if now - last_stats >= self.stats_interval:
+                self.log_stats()
+                last_stats = now
+            self.wait(started, interval)
+
+        self.log_stats()
+        self.close()
+        return 0
+
+    def wait(self, started, interval):
+        """Sleep until the tick that started at started is interval old, or
+        until an event, return the names of the attributes that changed"""
+        deadline = started + interval
+        if self.events is None:
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            return set()
+        while True:
+            changed = self.events.wait(max(0.0, deadline - time.monotonic()))
+            # The notifications our own writes raise don't need a tick
+            changed -= self.written_back(changed)
+            if changed or time.monotonic() >= deadline:
+                break
+        if changed:
+            # The next tick acts on the values read back, not the cached ones
+            for name in changed:
+                self.sampler.registry.invalidate(name)
+            self.event_ticks += 1
+            # Writes by a misbehaving tool mustn't spin the loop
+            holdoff = started + EVENT_HOLDOFF - time.monotonic()
+            if holdoff > 0:
+                time.sleep(holdoff)
+        return changed
+
+    def written_back(self, names):
+        """The names of attributes that read back as the value we last wrote"""
+        own = set()
+        for name in names:
+            writer = self.writers.get(name)
+            if writer is not None and writer.last is not None \
+                    and self.sampler.read(name) == writer.last:
+                own.add(name)
+        return own
+
+    def close(self):
+        if self.telemetry is not None:
+            self.telemetry.close()
+        if self.publisher is not None:
+            self.publisher.close()
+        if self.events is not None:
+            self.events.close()
+        self.sampler.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ASUS G14 fan control daemon")
+    parser.add_argument('--interval', type=float, default=cadence.BASE_INTERVAL,
+                        help="base seconds between control iterations (default %(default)s)")
+    parser.add_argument('--min-interval', type=float, default=cadence.MIN_INTERVAL,
+                        help="interval while temperature or PWM change fast (default %(default)s)")
+    parser.add_argument('--max-interval', type=float, default=cadence.MAX_INTERVAL,
+                        help="longest interval while readings are stable (default %(default)s)")
+    parser.add_argument('--stats-interval', type=float, default=STATS_INTERVAL,
+                        help="seconds between write statistics log lines (default %(default)s)")
+    parser.add_argument('--hysteresis', type=float, default=controller.HYSTERESIS,
+                        help="degrees below a threshold before stepping down (default %(default)s)")
+    parser.add_argument('--min-dwell', type=float, default=controller.MIN_DWELL,
+                        help="minimum seconds between policy changes (default %(default)s)")
+    parser.add_argument('--lookahead', type=float, default=controller.LOOKAHEAD,
+                        help="seconds of temperature slope to anticipate (default %(default)s)")
+    parser.add_argument('--simulate', metavar='TRACE',
+                        help="replay a temperature trace (\"seconds,temp\" lines, - for stdin) "
+                             "through the controller and exit")
+    parser.add_argument('--trace-interval', type=float, default=cadence.BASE_INTERVAL,
+                        help="sample spacing for traces without timestamps (default %(default)s)")
+    parser.add_argument('--telemetry-dir', default=telemetry.TELEMETRY_DIR,
+                        help="directory for the telemetry store, empty to disable "
+                             "(default %(default)s)")
+    parser.add_argument('--snapshot-path', default=shm.SNAPSHOT_PATH,
+                        help="shared memory file the latest snapshot is published to, "
+                             "empty to disable (default %(default)s)")
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help="serve OpenMetrics on this localhost port (default off)")
+    parser.add_argument('--metrics-address', default=metrics.ADDRESS,
+                        help="address the metrics endpoint binds to (default %(default)s)")
+    parser.add_argument('--no-events', action='store_true',
+                        help="only poll, don't wait on inotify and uevents between ticks")
+    args = parser.parse_args(argv)
+
+    policy = PolicyController(hysteresis=args.hysteresis, min_dwell=args.min_dwell,
+                              lookahead=args.lookahead)
+    if args.simulate:
+        if args.simulate == '-':
+            trace = controller.load_trace(sys.stdin, args.trace_interval)
+        else:
+            with open(args.simulate, 'r') as f:
+                trace = controller.load_trace(f, args.trace_interval)
+        print(controller.format_report(controller.replay(trace, policy)))
+        return 0
+
+    interval = AdaptiveInterval(base=args.interval, min_interval=args.min_interval,
+                                max_interval=args.max_interval)
+    store = None
+    if args.telemetry_dir:
+        try:
+            store = TelemetryStore(args.telemetry_dir)
+        except (OSError, ValueError) as e:
+            log(f"Telemetry disabled: {e}")
+    publisher = None
+    if args.snapshot_path:
+        try:
+            publisher = SnapshotPublisher(args.snapshot_path)
+        except OSError as e:
+            log(f"Snapshot publishing disabled: {e}")
+    sampler = Sampler()
+    source = None
+    if not args.no_events:
+        try:
+            # Attributes that don't notify are left to the ticks' own reads
+            source = events.EventSource(sampler.paths, watch=events.NOTIFYING)
+        except OSError as e:
+            log(f"Event source disabled: {e}")
+    state = server = None
+    if args.metrics_port:
+        state = Metrics()
+        try:
+            server = MetricsServer(state, args.metrics_port, args.metrics_address)
+        except OSError as e:
+            log(f"Metrics endpoint disabled: {e}")
+            state = None
+        else:
+            server.start()
+            log(f"Serving metrics on http://{args.metrics_address}:{args.metrics_port}/metrics")
+    try:
+        return FanDaemon(sampler=sampler, policy=policy, cadence=interval,
+                         stats_interval=args.stats_interval, telemetry=store,
+                         publisher=publisher, metrics=state, events=source).run()
+    finally:
+        if server is not None:
+            server.close()
+
@@ -0,0 +1,204 @@
+"""Buffered, rotating debug log
+
+DebugLog hands records to a background writer thread through a bounded
+queue, so logging never blocks the UI thread. The writer keeps the file
+open, writes records in batches, fsyncs at most every FSYNC_INTERVAL
+seconds and rotates the file by size and age, keeping BACKUPS old files.
+Records that don't fit in the queue are dropped and counted, and the
+count is written to the log once there is room again.
+"""
+import os
+import queue
+import threading
+import time
+
+from g14 import instrument
+
+MAX_BYTES = 1024 * 1024
+MAX_AGE = 7 * 24 * 3600
+BACKUPS = 5
+QUEUE_SIZE = 1000
+BATCH_SIZE = 100
+FLUSH_INTERVAL = 1.0
+FSYNC_INTERVAL = 30.0
+FLUSH_TIMEOUT = 2.0
+
+# Control messages sent through the queue so they stay ordered with records,
+# a flush request is a threading.Event set once it is done
+_CLEAR = object()
+_STOP = object()
+
+
+class DebugLog:
+    """A debug log file written by a background thread"""
+
+    def __init__(self, path, max_bytes=MAX_BYTES, max_age=MAX_AGE, backups=BACKUPS,
+                 queue_size=QUEUE_SIZE, fsync_interval=FSYNC_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        self.fsync_interval = fsync_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self._reported_drops = 0
+        self._file = None
+        self._started = None
+        self._last_sync = time.monotonic()
+        self._dirty = False
+
+        self.thread = threading.Thread(target=self._run, name='g14-debuglog', daemon=True)
+        self.thread.start()
+
+    def write(self, text):
+        """Queue text for writing, never blocks"""
+        try:
+            self.queue.put_nowait(text)
+        except queue.Full:
+            self.dropped += 1
+
+    def clear(self, header=""):
+        """Truncate the log, then write header"""
+        self._control(_CLEAR)
+        if header:
+            self.write(header)
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """Have the writer flush and fsync what it has, wait up to timeout
+        seconds for it and return whether it was done"""
+        done = threading.Event()
+        self._control(done, block=True)
+        return done.wait(timeout)
+
+    def close(self, timeout=2.0):
+        """Write out everything queued and stop the writer"""
+        self._control(_STOP, block=True)
+        self.thread.join(timeout)
+
+    def _control(self, message, block=False):
+        try:
+            self.queue.put(message, block=block, timeout=1.0 if block else None)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            # Only wake up on our own while an fsync is pending
+            timeout = None
+            if self._dirty:
+                timeout = max(FLUSH_INTERVAL, self._last_sync + self.fsync_interval - time.monotonic())
+            try:
+                batch = [self.queue.get(timeout=timeout)]
+            except queue.Empty:
+                self._sync(force=False)
+                continue
+            # Take whatever else is already waiting
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if not self._handle(batch):
+                    return
+            except OSError as e:
+                # Disk full or home unmounted, drop this batch and retry later
+                instrument.error('debuglog.write', e)
+                self.dropped += len(batch)
+                self._close_file()
+
+    def _handle(self, batch):
+        """Write a batch, return False once told to stop"""
+        records = []
+        for item in batch:
+            if item is _CLEAR:
+                self._write(records)
+                records = []
+                self._close_file()
+                open(self.path, 'w').close()
+            elif isinstance(item, threading.Event):
+                self._write(records)
+                records = []
+                self._sync(force=True)
+                item.set()
+            elif item is _STOP:
+                self._write(records)
+                self._sync(force=True)
+                self._close_file()
+                return False
+            else:
+                records.append(item)
+        self._write(records)
+        self._sync(force=False)
+        return True
+
+    @instrument.timed('debuglog.write')
+    def _write(self, records):
+        if self.dropped > self._reported_drops:
+            records.insert(0, f"[debug log: {self.dropped - self._reported_drops} records dropped]\n\n")
+            self._reported_drops = self.dropped
+        if not records:
+            return
+        f = self._open()
+        data = ''.join(records)
+        f.write(data)
+        self.written += len(records)
+        self._dirty = True
+        if self._should_rotate():
+            self._rotate()
+
+    def _open(self):
+        if self._file is None:
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                mtime = None
+            self._file = open(self.path, 'a')
+            # Age counts from when we started writing, unless the file has
+            # already sat untouched for longer than max_age
+            now = time.time()
+            self._started = mtime if mtime is not None and now - mtime >= self.max_age else now
+            if self._should_rotate():
+                self._rotate()
+                self._file = open(self.path, 'a')
+                self._started = time.time()
+        return self._file
+
+    def _should_rotate(self):
+        return (self._file.tell() >= self.max_bytes
+                or time.time() - self._started >= self.max_age)
+
+    def _sync(self, force):
+        if self._file is None or not self._dirty:
+            return
+        self._file.flush()
+        now = time.monotonic()
+        if force or now - self._last_sync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_sync = now
+            self._dirty = False
+
+    def _rotate(self):
+        """Shift path -> path.1 -> ... -> path.BACKUPS, dropping the oldest"""
+        self._sync(force=True)
+        self._close_file()
+        for i in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            finally:
+                self._file = None
+                self._dirty = False
@@ -0,0 +1,277 @@
+"""Energy accounting per throttle policy, platform profile and GPU state
+
+    python3 g14-energy.py [--since 24h] [--by policy] [--sort time]
+
+The menu only shows the instantaneous BAT0/power_now. EnergyMeter
+integrates those samples into joules as they arrive, at whatever spacing
+the adaptive cadence and events produced, and attributes each interval to
+the (supply, policy, profile, GPU runtime status) state it ran under. The
+daemon feeds one live for the metrics endpoint; the report command
+replays the telemetry store and ranks the states by average watts or time
+spent, so the cost of a policy or of a dGPU left awake can be read off
+directly.
+
+power_now is what the battery delivers. On AC it is the charge rate or 0,
+so the supply (AC adapter online or not) is part of the state and the
+report only ranks time on battery unless asked for AC, which it lists
+separately. Records written before the supply was stored count as
+unknown.
+
+A sample's state is read before the tick writes a new policy, so the
+interval leading up to a sample ran under that sample's state. Within a
+state power is integrated with the trapezoid rule; across a state change
+only the closing sample's power is used, it was drawn in the new state.
+"""
+import argparse
+import json
+import sys
+import time
+
+from g14 import telemetry
+
+# State fields, in key order
+DIMENSIONS = ('supply', 'policy', 'platform', 'gpu_status')
+# --by choices -> indexes into the state key
+GROUPS = {
+    'state': (1, 2, 3),
+    'policy': (1,),
+    'platform': (2,),
+    'gpu': (3,),
+    'supply': (0,),
+}
+SORT_KEYS = ('watts', 'time', 'energy')
+# --supply choices -> supplies counted
+SUPPLIES = {
+    'battery': ('battery',),
+    'ac': ('ac',),
+    'all': ('battery', 'ac', 'unknown'),
+}
+
+# A longer gap between samples (suspend, daemon stopped) isn't metered
+MAX_GAP = 30.0
+
+# Raw records for ranges up to this long, downsampled tiers beyond
+RAW_SPAN = 2 * 24 * 3600
+
+
+def supply(ac):
+    """'ac', 'battery' or 'unknown' for an AC online flag"""
+    if ac is None:
+        return 'unknown'
+    return 'ac' if ac else 'battery'
+
+
+def state_of(snapshot):
+    """The state key of a Snapshot"""
+    return (supply(snapshot.ac), snapshot.policy or 'unknown',
+            snapshot.platform or 'unknown', snapshot.gpu_status or 'unknown')
+
+
+class EnergyMeter:
+    """Integrates power samples into seconds and joules per state"""
+
+    def __init__(self, max_gap=MAX_GAP):
+        self.max_gap = max_gap
+        # state -> [seconds, joules]
+        self.states = {}
+        self.last = None
+        self.samples = 0
+        self.unmetered = 0.0
+
+    def add(self, t, watts, state):
+        """Add a power sample taken at t seconds, watts None when it failed"""
+        self.samples += 1
+        last = self.last
+        self.last = (t, watts, state)
+        if last is None:
+            return
+        dt = t - last[0]
+        if dt <= 0:
+            return
+        if dt > self.max_gap or watts is None or last[1] is None:
+            self.unmetered += dt
+            return
+        if state == last[2]:
+            self._account(state, dt, (watts + last[1]) / 2 * dt)
+        else:
+            self._account(state, dt, watts * dt)
+
+    def add_interval(self, seconds, watts, state):
+        """Add seconds at a mean of watts, for downsampled records"""
+        self.samples += 1
+        self.last = None
+        if watts is None:
+            self.unmetered += seconds
+        else:
+            self._account(state, seconds, watts * seconds)
+
+    def _account(self, state, seconds, joules):
+        totals = self.states.get(state)
+        if totals is None:
+            self.states[state] = [seconds, joules]
+        else:
+            totals[0] += seconds
+            totals[1] += joules
+
+    def total(self, supplies=None):
+        """(seconds, joules) of every state, or of the states on some supplies"""
+        seconds = joules = 0.0
+        for state, totals in self.states.items():
+            if supplies is None or state[0] in supplies:
+                seconds += totals[0]
+                joules += totals[1]
+        return seconds, joules
+
+    def totals(self, group='state', supplies=None):
+        """Return {key: (seconds, joules)} with states merged by a GROUPS key"""
+        indexes = GROUPS[group]
+        merged = {}
+        for state, (seconds, joules) in self.states.items():
+            if supplies is not None and state[0] not in supplies:
+                continue
+            key = tuple(state[i] for i in indexes)
+            old = merged.get(key, (0.0, 0.0))
+            merged[key] = (old[0] + seconds, old[1] + joules)
+        return merged
+
+
+def meter_records(records, seconds=0, max_gap=MAX_GAP):
+    """Meter telemetry records, bucket means of a tier when seconds > 0"""
+    meter = EnergyMeter(max_gap)
+    for record in records:
+        state = (supply(record['ac']), record['policy'], record['platform'], record['gpu_status'])
+        if seconds:
+            meter.add_interval(seconds, record['power'], state)
+        else:
+            meter.add(record['time'], record['power'], state)
+    return meter
+
+
+def pick_tier(since, until, now=None):
+    """The finest tier that still holds the range, raw for up to RAW_SPAN"""
+    now = time.time() if now is None else now
+    since = now - 3600 if since is None else since
+    until = now if until is None else until
+    for name, (seconds, retention) in telemetry.TIERS.items():
+        if retention is not None and since < now - retention:
+            continue
+        if seconds or until - since <= RAW_SPAN:
+            return name
+    return list(telemetry.TIERS)[-1]
+
+
+def rows(meter, group='state', sort='watts', supplies=SUPPLIES['battery']):
+    """Ranked report rows for a GROUPS key, of the states on supplies"""
+    total, _ = meter.total(supplies)
+    result = []
+    for key, (seconds, joules) in meter.totals(group, supplies).items():
+        result.append({
+            **dict(zip((DIMENSIONS[i] for i in GROUPS[group]), key)),
+            'seconds': round(seconds, 1),
+            'share': round(seconds / total, 4) if total else 0.0,
+            'wh': round(joules / 3600, 3),
+            'watts': round(joules / seconds, 2) if seconds else 0.0,
+        })
+    field = {'watts': 'watts', 'time': 'seconds', 'energy': 'wh'}[sort]
+    result.sort(key=lambda row: row[field], reverse=True)
+    return result
+
+
+def _duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def report(meter, group, sort, fmt, out, supplies=SUPPLIES['battery']):
+    ranked = rows(meter, group, sort, supplies)
+    seconds, joules = meter.total(supplies)
+    # Metered time left out of the ranking, by supply
+    excluded = {}
+    for state, totals in meter.states.items():
+        if state[0] not in supplies:
+            excluded[state[0]] = excluded.get(state[0], 0.0) + totals[0]
+    if fmt == 'json':
+        json.dump({'supplies': list(supplies),
+                   'seconds': round(seconds, 1), 'wh': round(joules / 3600, 3),
+                   'watts': round(joules / seconds, 2) if seconds else None,
+                   'excluded_seconds': {name: round(s, 1) for name, s in sorted(excluded.items())},
+                   'unmetered_seconds': round(meter.unmetered, 1),
+                   'samples': meter.samples, 'by': group, 'states': ranked}, out, indent=2)
+        out.write('\n')
+        return
+    if fmt == 'csv':
+        import csv
+        writer = csv.writer(out)
+        fields = list(ranked[0]) if ranked else [DIMENSIONS[i] for i in GROUPS[group]]
+        writer.writerow(fields)
+        for row in ranked:
+            writer.writerow([row[f] for f in fields])
+        return
+
+    notes = []
+    if excluded.get('ac'):
+        notes.append(f"{_duration(excluded['ac'])} on AC left out, power_now is the charge "
+                     "rate there (--supply ac lists it)")
+    if excluded.get('unknown'):
+        notes.append(f"{_duration(excluded['unknown'])} with the supply unknown left out, "
+                     "from records older than the AC status (--supply all counts it)")
+    if not seconds:
+        print(f"No power samples on {' or '.join(supplies)} in range", file=out)
+        for note in notes:
+            print(note, file=out)
+        return
+    names = [DIMENSIONS[i] for i in GROUPS[group]]
+    widths = [max(len(name), *(len(str(row[name])) for row in ranked)) for name in names]
+    print('  '.join(f"{name:<{w}}" for name, w in zip(names, widths))
+          + f"  {'time':>9} {'share':>6} {'energy':>10} {'avg':>7}", file=out)
+    for row in ranked:
+        print('  '.join(f"{row[name]:<{w}}" for name, w in zip(names, widths))
+              + f"  {_duration(row['seconds']):>9} {100 * row['share']:5.1f}%"
+              f" {row['wh']:7.2f} Wh {row['watts']:5.1f} W", file=out)
+    line = f"{_duration(seconds)} metered, {joules / 3600:.2f} Wh, {joules / seconds:.1f} W average"
+    if meter.unmetered:
+        line += f", {_duration(meter.unmetered)} in gaps or without power readings"
+    print(line, file=out)
+    for note in notes:
+        print(note, file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Rank throttle policies, profiles and GPU states by the power they drew")
+    parser.add_argument('--dir', default=telemetry.TELEMETRY_DIR,
+                        help="telemetry directory (default %(default)s)")
+    parser.add_argument('--since', default='24h',
+                        help="start as epoch, ISO time or age like 6h, 7d (default %(default)s)")
+    parser.add_argument('--until', help="end, same formats as --since (default now)")
+    parser.add_argument('--tier', choices=['auto'] + list(telemetry.TIERS), default='auto',
+                        help="resolution to read (default raw while it covers the range)")
+    parser.add_argument('--by', choices=list(GROUPS), default='state',
+                        help="what to account energy to (default the full state)")
+    parser.add_argument('--supply', choices=list(SUPPLIES), default='battery',
+                        help="count time on battery, on AC or all of it (default %(default)s)")
+    parser.add_argument('--sort', choices=SORT_KEYS, default='watts',
+                        help="what ranks a state first (default %(default)s)")
+    parser.add_argument('--max-gap', type=float, default=MAX_GAP,
+                        help="longest sample gap that is metered, in seconds (default %(default)s)")
+    parser.add_argument('--format', choices=('text', 'csv', 'json'), default='text',
+                        help="output format (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    try:
+        since = telemetry.parse_time(args.since)
+        until = telemetry.parse_time(args.until)
+    except ValueError as e:
+        parser.error(str(e))
+
+    tier = pick_tier(since, until) if args.tier == 'auto' else args.tier
+    try:
+        records = telemetry.query(args.dir, since, until, tier)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read telemetry: {e}", file=sys.stderr)
+        return 1
+
+    meter = meter_records(records, telemetry.TIERS[tier][0], args.max_gap)
+    report(meter, args.by, args.sort, args.format, sys.stdout, SUPPLIES[args.supply])
+    return 0
@@ -0,0 +1,336 @@
+"""Event-driven attribute changes
+
+Polling only notices a dGPU wake, an AC unplug or a profile changed by
+another tool on the next tick, seconds after the fans have reacted.
+EventSource waits on every notification the kernel offers and returns as
+soon as one arrives:
+
+- inotify on the attributes the kernel sysfs_notify()s when they change
+  (platform_profile, asus-nb-wmi's throttle_thermal_policy), or POLLPRI
+  on them when inotify isn't available
+- a NETLINK_KOBJECT_UEVENT socket for power_supply (AC plugged in or
+  pulled, battery state) and the dGPU's PCI device
+- attributes that never notify, such as the runtime PM status, are
+  compared by poll(), which the caller runs on its own update tick, so
+  they never wake a loop that has backed off
+
+Under a fake root (G14_SYSFS_ROOT) the same attributes are watched, a
+write to the regular file raising the inotify event sysfs_notify() would,
+and uevents arrive on a Unix datagram socket under the root that
+fakesys.uevent() sends to instead of netlink.
+"""
+import ctypes
+import ctypes.util
+import itertools
+import os
+import select
+import socket
+import struct
+import time
+
+from g14.hwmon import open_attr
+
+# Attributes watched by default, polled when the kernel doesn't notify
+WATCH = ('gpu_runtime_status', 'gpu_control', 'throttle_policy', 'platform_profile', 'cpu_boost')
+# Attributes the kernel calls sysfs_notify() on
+NOTIFYING = ('platform_profile', 'throttle_policy')
+
+# A write can arrive as several events, collect until it's this quiet
+SETTLE = 0.005
+SETTLE_ROUNDS = 10
+
+NETLINK_KOBJECT_UEVENT = 15
+UEVENT_GROUP = 1
+# Stand-in uevent sockets under a fake root, one per listener
+UEVENT_SOCKETS = 'run/g14-uevent-*.sock'
+_listeners = itertools.count()
+
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class Inotify:
+    """inotify through libc, there is no binding in the standard library"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.watches = {}
+
+    def add(self, path, name):
+        wd = self._add_watch(self.fd, os.fsencode(path), IN_MODIFY | IN_CLOSE_WRITE)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        self.watches[wd] = name
+
+    def read(self):
+        """Names of the watched attributes with pending events"""
+        names = set()
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset + INOTIFY_EVENT.size <= len(data):
+                wd, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size + length
+                if wd in self.watches:
+                    names.add(self.watches[wd])
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def parse_uevent(data):
+    """Return the {KEY: value} of a kernel uevent message, None for other messages"""
+    fields = data.split(b'\0')
+    if b'@' not in fields[0]:
+        # udevd's own "libudev" messages
+        return None
+    env = {}
+    for field in fields[1:]:
+        key, sep, value = field.partition(b'=')
+        if sep:
+            env[key.decode(errors='replace')] = value.decode(errors='replace')
+    return env
+
+
+class UeventListener:
+    """Kernel uevents from netlink, or from the stand-in socket under a fake root"""
+
+    def __init__(self, root='/'):
+        self.path = None
+        if os.path.abspath(root) == '/':
+            self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+            try:
+                self.sock.bind((0, UEVENT_GROUP))
+            except OSError:
+                self.sock.close()
+                raise
+        else:
+            name = f"{os.getpid()}-{next(_listeners)}"
+            self.path = os.path.join(root, UEVENT_SOCKETS.replace('*', name))
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.bind(self.path)
+        self.sock.setblocking(False)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def read(self):
+        """Every pending uevent as a dict"""
+        events = []
+        while True:
+            try:
+                data = self.sock.recv(8192)
+            except BlockingIOError:
+                return events
+            env = parse_uevent(data)
+            if env is not None:
+                events.append(env)
+
+    def close(self):
+        self.sock.close()
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+class _Notified:
+    """An attribute woken through POLLPRI, re-armed by reading it"""
+
+    def __init__(self, attr, name):
+        self.attr = attr
+        self.name = name
+
+    def read(self):
+        try:
+            self.attr.read()
+        except OSError:
+            pass
+        return {self.name}
+
+
+class _Polled:
+    """An attribute that never notifies, compared on each poll"""
+
+    def __init__(self, attr):
+        self.attr = attr
+        self.value = self.read()
+
+    def read(self):
+        try:
+            return self.attr.read()
+        except OSError:
+            return None
+
+    def changed(self):
+        value = self.read()
+        if value == self.value:
+            return False
+        self.value = value
+        return True
+
+
+class EventSource:
+    """Waits for changes of the watched attributes"""
+
+    def __init__(self, paths, watch=None, uevents=True):
+        watch = WATCH if watch is None else watch
+        self.epoll = select.epoll()
+        self.handlers = {}
+        self.notified = set()
+        self.polled = {}
+        self.inotify = None
+        self.uevents = None
+        self.gpu = os.path.basename(paths.gpu_device) if paths.gpu_device else None
+        self.wakeups = 0
+        self.notifications = 0
+        self.uevent_count = 0
+        self.poll_changes = 0
+
+        found = {name: getattr(paths, name) for name in watch if getattr(paths, name)}
+        notifying = [name for name in NOTIFYING if name in found]
+
+        try:
+            self.inotify = Inotify()
+        except (OSError, AttributeError):
+            self.inotify = None
+        if self.inotify is not None:
+            for name in notifying:
+                try:
+                    self.inotify.add(found[name], name)
+                    self.notified.add(name)
+                except OSError:
+                    pass
+            self._register(self.inotify.fd, select.EPOLLIN, self.inotify.read)
+        else:
+            for name in notifying:
+                attr = open_attr(found[name])
+                if attr is not None:
+                    notified = _Notified(attr, name)
+                    # sysfs only signals POLLPRI after the attribute was read
+                    notified.read()
+                    self._register(attr.fd, select.EPOLLPRI | select.EPOLLERR, notified.read)
+                    self.notified.add(name)
+
+        for name, path in found.items():
+            if name not in self.notified:
+                attr = open_attr(path)
+                if attr is not None:
+                    self.polled[name] = _Polled(attr)
+
+        if uevents:
+            try:
+                self.uevents = UeventListener(paths.root)
+            except OSError:
+                self.uevents = None
+            else:
+                self._register(self.uevents.fileno(), select.EPOLLIN, self._read_uevents)
+
+    def _register(self, fd, mask, handler):
+        self.epoll.register(fd, mask)
+        self.handlers[fd] = handler
+
+    def fileno(self):
+        """Readable whenever a notification is pending, for a main loop io watch"""
+        return self.epoll.fileno()
+
+    def describe(self):
+        """What each attribute is watched with, for the log"""
+        lines = []
+        if self.notified:
+            how = 'inotify' if self.inotify is not None else 'POLLPRI'
+            lines.append(f"{how}: {', '.join(sorted(self.notified))}")
+        if self.polled:
+            lines.append(f"polled on each tick: {', '.join(sorted(self.polled))}")
+        if self.uevents is None:
+            lines.append("uevents: unavailable")
+        else:
+            lines.append(f"uevents: {'netlink' if self.uevents.path is None else self.uevents.path}")
+        return lines
+
+    def _read_uevents(self):
+        names = set()
+        for env in self.uevents.read():
+            subsystem = env.get('SUBSYSTEM')
+            if subsystem == 'power_supply':
+                names.update(('power_now', 'ac_online'))
+            elif subsystem == 'pci' and self.gpu and env.get('DEVPATH', '').endswith(self.gpu):
+                names.update(('gpu_runtime_status', 'gpu_control'))
+            else:
+                continue
+            self.uevent_count += 1
+        return names
+
+    def _dispatch(self, timeout):
+        names = set()
+        for fd, _ in self.epoll.poll(timeout):
+            handler = self.handlers.get(fd)
+            if handler is not None:
+                names |= handler()
+        self.notifications += len(names)
+        return names
+
+    def read(self):
+        """Names of attributes with pending notifications, without blocking"""
+        return self._dispatch(0)
+
+    def poll(self):
+        """Compare the polled attributes, return the names that changed
+
+        Neither wait() nor fileno() notices these, the caller polls them on
+        its own update tick.
+        """
+        changed = set()
+        for name, polled in self.polled.items():
+            if polled.changed():
+                changed.add(name)
+                self.poll_changes += 1
+        return changed
+
+    def wait(self, timeout):
+        """Block up to timeout seconds for a notification, return the names
+        of attributes that changed"""
+        deadline = time.monotonic() + timeout
+        while True:
+            changed = self._dispatch(max(0.0, deadline - time.monotonic()))
+            if changed:
+                for _ in range(SETTLE_ROUNDS):
+                    more = self._dispatch(SETTLE)
+                    if not more:
+                        break
+                    changed |= more
+                self.wakeups += 1
+                return changed
+            if time.monotonic() >= deadline:
+                return changed
+
+    def close(self):
+        for polled in self.polled.values():
+            polled.attr.close()
+        self.polled.clear()
+        for handler in self.handlers.values():
+            notified = getattr(handler, '__self__', None)
+            if isinstance(notified, _Notified):
+                notified.attr.close()
+        if self.inotify is not None:
+            self.inotify.close()
+        if self.uevents is not None:
+            self.uevents.close()
+        self.epoll.close()
@@ -0,0 +1,172 @@
+"""Synthetic G14 sysfs tree
+
+build() writes a directory that looks like the parts of / the tools read
+on a 2020 G14: k10temp (Tctl and per-CCD) and asus hwmon nodes, the
+custom fan curve node, a battery, the NVIDIA dGPU's PCI power attributes,
+asus-nb-wmi, the platform profile, cpufreq, a handful of /proc/[pid]
+entries and stub `sensors` and `notify-send` programs in bin/. Point
+G14_SYSFS_ROOT at it and put bin/ first in PATH to run the daemon, tray
+or benchmarks off the machine. uevent() stands in for the kernel's uevents, sending them to
+every EventSource listening under the root.
+"""
+import glob
+import os
+import socket
+import stat
+
+from g14.events import UEVENT_SOCKETS
+from g14.procs import parse_stat
+
+CURVE_TEMPS = (30, 40, 50, 60, 70, 80, 90, 100)
+CURVE_PWMS = (0, 10, 30, 60, 100, 150, 200, 255)
+
+# Attribute name from the SysfsPaths index -> path under the root
+ATTRS = {
+    'tctl': 'sys/class/hwmon/hwmon2/temp1_input',
+    'tccd1': 'sys/class/hwmon/hwmon2/temp3_input',
+    'tccd2': 'sys/class/hwmon/hwmon2/temp4_input',
+    'cpu_fan': 'sys/class/hwmon/hwmon5/fan1_input',
+    'power_now': 'sys/class/power_supply/BAT0/power_now',
+    'battery_capacity': 'sys/class/power_supply/BAT0/capacity',
+    'ac_online': 'sys/class/power_supply/AC0/online',
+    'gpu_runtime_status': 'sys/bus/pci/devices/0000:01:00.0/power/runtime_status',
+    'gpu_control': 'sys/bus/pci/devices/0000:01:00.0/power/control',
+    'throttle_policy': 'sys/devices/platform/asus-nb-wmi/throttle_thermal_policy',
+    'platform_profile': 'sys/firmware/acpi/platform_profile',
+    'cpu_boost': 'sys/devices/system/cpu/cpufreq/boost',
+}
+
+PROCESSES = ('systemd', 'Xorg', 'cinnamon', 'firefox', 'code', 'python3', 'pulseaudio', 'kworker/0:1')
+
+SENSORS = """#!/bin/sh
+read t < "{tctl}"
+read rpm < "{cpu_fan}"
+echo "k10temp-pci-00c3"
+echo "Adapter: PCI adapter"
+echo "Tctl:         +$((t / 1000)).$((t % 1000 / 100))°C"
+echo ""
+echo "asus-isa-0000"
+echo "Adapter: ISA adapter"
+echo "cpu_fan:     $rpm RPM"
+"""
+
+NOTIFY_SEND = "#!/bin/sh\nexit 0\n"
+
+
+def _write(root, relative, value):
+    path = os.path.join(root, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(f"{value}\n")
+    return path
+
+
+def _script(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def proc_stat(pid, comm, jiffies, starttime=1000):
+    """A /proc/[pid]/stat line with utime = jiffies and stime = 0"""
+    fields = ['0'] * 50
+    fields[0] = 'S'
+    fields[11] = str(jiffies)
+    fields[19] = str(starttime)
+    return f"{pid} ({comm}) {' '.join(fields)}"
+
+
+def build(root, temp=52.125, fan_rpm=2600, power=12.5, policy='2', profile='quiet',
+          gpu_status='suspended', ac=False, cpus=8):
+    """Create the tree under root and return root"""
+    _write(root, 'sys/class/hwmon/hwmon2/name', 'k10temp')
+    _write(root, 'sys/class/hwmon/hwmon2/temp1_label', 'Tctl')
+    _write(root, 'sys/class/hwmon/hwmon2/temp3_label', 'Tccd1')
+    _write(root, 'sys/class/hwmon/hwmon2/temp4_label', 'Tccd2')
+    _write(root, 'sys/class/hwmon/hwmon5/name', 'asus')
+    _write(root, 'sys/class/hwmon/hwmon5/fan1_label', 'cpu_fan')
+    _write(root, 'sys/class/hwmon/hwmon8/name', 'asus_custom_fan_curve')
+    for fan in (1, 2):
+        for point, (t, pwm) in enumerate(zip(CURVE_TEMPS, CURVE_PWMS), 1):
+            _write(root, f'sys/class/hwmon/hwmon8/pwm{fan}_auto_point{point}_temp', t)
+            _write(root, f'sys/class/hwmon/hwmon8/pwm{fan}_auto_point{point}_pwm', pwm)
+
+    _write(root, 'sys/class/power_supply/AC0/type', 'Mains')
+    set_value(root, 'ac_online', int(ac))
+    _write(root, 'sys/class/power_supply/BAT0/type', 'Battery')
+    # The iGPU, which the dGPU probe must skip
+    _write(root, 'sys/bus/pci/devices/0000:05:00.0/vendor', '0x1002')
+    _write(root, 'sys/bus/pci/devices/0000:05:00.0/class', '0x030000')
+    _write(root, 'sys/bus/pci/devices/0000:01:00.0/vendor', '0x10de')
+    _write(root, 'sys/bus/pci/devices/0000:01:00.0/class', '0x030000')
+    for cpu in range(cpus):
+        _write(root, f'sys/devices/system/cpu/cpu{cpu}/cpufreq/scaling_governor', 'powersave')
+
+    set_temp(root, temp)
+    set_value(root, 'cpu_fan', fan_rpm)
+    set_value(root, 'power_now', int(power * 1000000))
+    set_value(root, 'battery_capacity', 80)
+    set_value(root, 'gpu_runtime_status', gpu_status)
+    set_value(root, 'gpu_control', 'auto')
+    set_value(root, 'throttle_policy', policy)
+    set_value(root, 'platform_profile', profile)
+    set_value(root, 'cpu_boost', '0')
+
+    for pid, comm in enumerate(PROCESSES, 100):
+        _write(root, f'proc/{pid}/stat', proc_stat(pid, comm, 0))
+        with open(os.path.join(root, f'proc/{pid}/cmdline'), 'wb') as f:
+            f.write(b'' if comm.startswith('kworker') else f'/usr/bin/{comm}\0'.encode())
+
+    _script(os.path.join(root, 'bin/sensors'), SENSORS.format(
+        tctl=os.path.join(root, ATTRS['tctl']), cpu_fan=os.path.join(root, ATTRS['cpu_fan'])))
+    _script(os.path.join(root, 'bin/notify-send'), NOTIFY_SEND)
+    return root
+
+
+def set_value(root, name, value):
+    """Change an attribute from ATTRS"""
+    return _write(root, ATTRS[name], value)
+
+
+def set_temp(root, celsius):
+    """Set Tctl, and the CCDs a few degrees below it"""
+    set_value(root, 'tctl', int(round(celsius * 1000)))
+    set_value(root, 'tccd1', int(round((celsius - 3) * 1000)))
+    set_value(root, 'tccd2', int(round((celsius - 5) * 1000)))
+
+
+def burn(root, pid, jiffies):
+    """Charge jiffies of CPU time to a fake process"""
+    with open(os.path.join(root, f'proc/{pid}/stat'), 'r') as f:
+        comm, starttime, used = parse_stat(f.read())
+    _write(root, f'proc/{pid}/stat', proc_stat(pid, comm, used + jiffies, starttime))
+
+
+def uevent(root, action, devpath, subsystem, **env):
+    """Send a kernel-format uevent to the listeners under root, return how many got it"""
+    fields = [f"{action}@{devpath}", f"ACTION={action}", f"DEVPATH={devpath}",
+              f"SUBSYSTEM={subsystem}"] + [f"{key}={value}" for key, value in env.items()]
+    message = '\0'.join(fields).encode() + b'\0'
+    sent = 0
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        for path in glob.glob(os.path.join(root, UEVENT_SOCKETS)):
+            try:
+                sock.sendto(message, path)
+                sent += 1
+            except OSError:
+                # Left behind by a listener that died
+                pass
+    return sent
+
+
+def plug(root, online):
+    """Plug in or pull the charger, as the kernel reports it"""
+    set_value(root, 'ac_online', int(online))
+    return uevent(root, 'change', '/devices/LNXSYSTM:00/LNXSYBUS:00/ACPI0003:00/power_supply/AC0',
+                  'power_supply', POWER_SUPPLY_NAME='AC0', POWER_SUPPLY_ONLINE=int(online))
+
+
+def wake_gpu(root, active=True):
+    """Change the dGPU's runtime PM status, which the kernel doesn't notify"""
+    return set_value(root, 'gpu_runtime_status', 'active' if active else 'suspended')
@@ -0,0 +1,284 @@
+"""Privileged sysfs write helper
+
+The tray used to change policy and GPU state by running
+`echo value | sudo tee path` through a shell, which forks three processes
+per click and asks for a password when sudo has nothing cached. The
+helper runs as root, keeps the whitelisted attributes open and accepts
+writes over a Unix socket from allowed users only (checked with
+SO_PEERCRED). Clients name an attribute from the SysfsPaths index, never a
+path, and only values from WRITABLE are accepted.
+
+The protocol is one line per request and reply:
+
+    write <name> <value>   ->  ok <value read back>
+    read <name>            ->  ok <value>
+                           ->  error <message>
+"""
+import argparse
+import os
+import pwd
+import selectors
+import signal
+import socket
+import struct
+
+from g14.paths import probe
+
+SOCKET_PATH = '/run/g14-helper.sock'
+TIMEOUT = 1.0
+MAX_LINE = 256
+
+# Only the values the tray sends, anything else is refused
+WRITABLE = {
+    'throttle_policy': ('0', '1', '2'),
+    'platform_profile': ('quiet',),
+    'gpu_control': ('auto',),
+}
+
+# struct ucred from SO_PEERCRED
+UCRED = struct.Struct('3i')
+
+
+def log(message):
+    """Log a line to stdout, which systemd sends to the journal"""
+    print(message, flush=True)
+
+
+class HelperError(Exception):
+    """The helper refused or failed a request"""
+
+
+class WritableAttr:
+    """A sysfs attribute kept open for writing and reading back"""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR)
+
+    def write(self, value):
+        os.pwrite(self.fd, value.encode(), 0)
+        return self.read()
+
+    def read(self):
+        return os.pread(self.fd, 4096, 0).decode().strip()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class HelperServer:
+    """Serves whitelisted sysfs writes on a Unix socket"""
+
+    def __init__(self, path=SOCKET_PATH, paths=None, allowed_uids=()):
+        self.path = path
+        self.paths = paths or probe()
+        self.allowed_uids = {0} | set(allowed_uids)
+        self.attrs = {}
+        self.selector = selectors.DefaultSelector()
+        self.buffers = {}
+        self.running = False
+        self.requests = 0
+        self.refused = 0
+        self.listener = None
+
+    def attr(self, name):
+        attr = self.attrs.get(name)
+        if attr is None:
+            path = getattr(self.paths, name)
+            if path is None:
+                raise HelperError(f"{name} not available")
+            attr = self.attrs[name] = WritableAttr(path)
+        return attr
+
+    def handle(self, line):
+        """Answer one request line"""
+        self.requests += 1
+        parts = line.split()
+        try:
+            if len(parts) == 3 and parts[0] == 'write':
+                name, value = parts[1], parts[2]
+                if value not in WRITABLE.get(name, ()):
+                    raise HelperError(f"refusing {name}={value}")
+                return f"ok {self.attr(name).write(value)}"
+            if len(parts) == 2 and parts[0] == 'read':
+                if parts[1] not in WRITABLE:
+                    raise HelperError(f"unknown attribute {parts[1]}")
+                return f"ok {self.attr(parts[1]).read()}"
+            raise HelperError("bad request")
+        except HelperError as e:
+            self.refused += 1
+            return f"error {e}"
+        except OSError as e:
+            # Drop the handle so the next request reopens it
+            attr = self.attrs.pop(parts[1], None)
+            if attr is not None:
+                attr.close()
+            return f"error {e.strerror}"
+
+    def listen(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        # Anyone may connect, SO_PEERCRED decides who gets an answer
+        os.chmod(self.path, 0o666)
+        self.listener.listen(4)
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ, self.accept)
+
+    def accept(self, listener):
+        conn, _ = listener.accept()
+        pid, uid, gid = UCRED.unpack(conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, UCRED.size))
+        if uid not in self.allowed_uids:
+            log(f"Refused connection from pid {pid} uid {uid}")
+            conn.close()
+            return
+        conn.setblocking(False)
+        self.buffers[conn] = b''
+        self.selector.register(conn, selectors.EVENT_READ, self.receive)
+
+    def receive(self, conn):
+        try:
+            data = conn.recv(4096)
+        except OSError:
+            data = b''
+        if not data:
+            self.disconnect(conn)
+            return
+        buffer = self.buffers[conn] + data
+        *lines, rest = buffer.split(b'\n')
+        if len(rest) > MAX_LINE:
+            self.disconnect(conn)
+            return
+        self.buffers[conn] = rest
+        replies = [self.handle(line.decode(errors='replace')) + '\n' for line in lines]
+        if replies:
+            try:
+                conn.sendall(''.join(replies).encode())
+            except OSError:
+                self.disconnect(conn)
+
+    def disconnect(self, conn):
+        self.selector.unregister(conn)
+        self.buffers.pop(conn, None)
+        conn.close()
+
+    def stop(self, *args):
+        self.running = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.listen()
+        log(f"Listening on {self.path} for uids {sorted(self.allowed_uids)}")
+        self.running = True
+        while self.running:
+            self.poll()
+        self.close()
+        return 0
+
+    def poll(self, timeout=1.0):
+        """Handle the connections and requests that arrive within timeout"""
+        for key, _ in self.selector.select(timeout=timeout):
+            key.data(key.fileobj)
+
+    def close(self):
+        for conn in list(self.buffers):
+            self.disconnect(conn)
+        if self.listener is not None:
+            self.selector.unregister(self.listener)
+            self.listener.close()
+            self.listener = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        for attr in self.attrs.values():
+            attr.close()
+        self.attrs = {}
+
+
+class HelperClient:
+    """A persistent connection to the helper, reconnected on demand"""
+
+    def __init__(self, path=SOCKET_PATH, timeout=TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.sock = None
+        self.file = None
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+        self.file = sock.makefile('rb')
+
+    def request(self, line):
+        """Send one request line and return the value from the reply"""
+        # A helper restart drops our connection, so retry once on a fresh one
+        for attempt in (0, 1):
+            try:
+                if self.sock is None:
+                    self.connect()
+                self.sock.sendall(line.encode() + b'\n')
+                reply = self.file.readline().decode().rstrip('\n')
+            except OSError:
+                self.close()
+                if attempt:
+                    raise
+                continue
+            if reply:
+                break
+            self.close()
+        else:
+            raise HelperError("helper closed the connection")
+        status, _, value = reply.partition(' ')
+        if status != 'ok':
+            raise HelperError(value)
+        return value
+
+    def write(self, name, value):
+        """Write value to attribute name, return the value read back"""
+        return self.request(f"write {name} {value}")
+
+    def read(self, name):
+        return self.request(f"read {name}")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def uid_of(user):
+    """Resolve a user name or numeric uid"""
+    if user.isdigit():
+        return int(user)
+    return pwd.getpwnam(user).pw_uid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ASUS G14 privileged sysfs write helper")
+    parser.add_argument('--socket', default=SOCKET_PATH,
+                        help="Unix socket path (default %(default)s)")
+    parser.add_argument('--allow-user', action='append', default=[], metavar='USER',
+                        help="user name or uid allowed to connect, may be repeated (root always is)")
+    args = parser.parse_args(argv)
+
+    try:
+        allowed = [uid_of(user) for user in args.allow_user]
+    except KeyError as e:
+        parser.error(f"unknown user {e}")
+    return HelperServer(args.socket, allowed_uids=allowed).run()
@@ -0,0 +1,220 @@
+"""Fixed-capacity telemetry history
+
+History keeps the last `capacity` snapshots in preallocated array-module
+columns, so memory stays constant however long the monitor runs. Rolling
+min/max/mean/EWMA over configurable time windows are maintained
+incrementally on append (monotonic deques plus running sums), so reading
+them is O(1) and never touches the hardware.
+"""
+import math
+from array import array
+from collections import deque
+
+from g14.controller import LEVELS
+
+CAPACITY = 3600
+WINDOWS = (10.0, 60.0, 300.0)
+
+# Numeric columns that rolling statistics are kept for
+FIELDS = ('temp', 'power', 'pwm_cpu', 'pwm_gpu')
+
+GPU_STATES = ('suspended', 'active')
+
+NAN = float('nan')
+
+
+def _float(value):
+    return NAN if value is None else float(value)
+
+
+def _code(value, names):
+    try:
+        return names.index(value)
+    except ValueError:
+        return -1
+
+
+class RollingStats:
+    """Min, max, mean and EWMA of one column over a sliding time window"""
+
+    def __init__(self, history, field, window):
+        self.history = history
+        self.column = history.columns[field]
+        self.window = window
+        self.start = 0          # oldest sequence number still in the window
+        self.count = 0
+        self.total = 0.0
+        self.ewma = None
+        self._mins = deque()
+        self._maxs = deque()
+        self._last_time = None
+
+    def push(self, seq, now, value):
+        self._expire_time(now)
+        if not math.isnan(value):
+            self.count += 1
+            self.total += value
+            while self._mins and self._value(self._mins[-1]) >= value:
+                self._mins.pop()
+            self._mins.append(seq)
+            while self._maxs and self._value(self._maxs[-1]) <= value:
+                self._maxs.pop()
+            self._maxs.append(seq)
+
+            if self.ewma is None:
+                self.ewma = value
+            else:
+                # Time-weighted so irregular sample spacing is handled
+                alpha = 1.0 - math.exp(-(now - self._last_time) / self.window)
+                self.ewma += alpha * (value - self.ewma)
+            self._last_time = now
+
+    def expire(self, seq):
+        """Drop every sample older than sequence number seq"""
+        while self.start < seq:
+            value = self._value(self.start)
+            if not math.isnan(value):
+                self.count -= 1
+                self.total -= value
+            self.start += 1
+        while self._mins and self._mins[0] < seq:
+            self._mins.popleft()
+        while self._maxs and self._maxs[0] < seq:
+            self._maxs.popleft()
+        if self.count == 0:
+            self.total = 0.0
+
+    def _expire_time(self, now):
+        history = self.history
+        cutoff = now - self.window
+        seq = self.start
+        while seq < history.seq and history.time_of(seq) < cutoff:
+            seq += 1
+        self.expire(seq)
+
+    def _value(self, seq):
+        return self.column[seq % self.history.capacity]
+
+    @property
+    def min(self):
+        return self._value(self._mins[0]) if self._mins else None
+
+    @property
+    def max(self):
+        return self._value(self._maxs[0]) if self._maxs else None
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean,
+            'ewma': self.ewma,
+        }
+
+
+class History:
+    """Ring buffer of timestamped snapshots with rolling statistics"""
+
+    def __init__(self, capacity=CAPACITY, windows=WINDOWS):
+        self.capacity = capacity
+        self.seq = 0            # sequence number of the next append
+        self.times = array('d', [NAN]) * capacity
+        self.columns = {field: array('d', [NAN]) * capacity for field in FIELDS}
+        self.policy = array('b', [-1]) * capacity
+        self.gpu = array('b', [-1]) * capacity
+        self.windows = tuple(windows)
+        self.stats = {
+            (field, window): RollingStats(self, field, window)
+            for field in FIELDS for window in self.windows
+        }
+
+    def __len__(self):
+        return min(self.seq, self.capacity)
+
+    def time_of(self, seq):
+        return self.times[seq % self.capacity]
+
+    def append(self, snapshot):
+        """Store a Snapshot, overwriting the oldest entry when full"""
+        seq = self.seq
+        slot = seq % self.capacity
+        now = snapshot.time.timestamp()
+
+        # Stats must forget the entry before its slot is reused
+        if seq >= self.capacity:
+            for stats in self.stats.values():
+                stats.expire(seq - self.capacity + 1)
+
+        self.times[slot] = now
+        for field in FIELDS:
+            self.columns[field][slot] = _float(getattr(snapshot, field))
+        self.policy[slot] = _code(snapshot.policy, LEVELS)
+        self.gpu[slot] = _code(snapshot.gpu_status, GPU_STATES)
+        self.seq = seq + 1
+
+        for (field, window), stats in self.stats.items():
+            stats.push(seq, now, self.columns[field][slot])
+
+    def rolling(self, field, window):
+        """Return the RollingStats for field over one of the configured windows"""
+        return self.stats[(field, window)]
+
+    def _seqs(self, since=None, limit=None):
+        first = max(0, self.seq - self.capacity)
+        if limit is not None:
+            first = max(first, self.seq - limit)
+        seqs = range(first, self.seq)
+        if since is not None:
+            seqs = [seq for seq in seqs if self.time_of(seq) >= since]
+        return seqs
+
+    def values(self, field, since=None, limit=None):
+        """Return [(time, value)] for field, oldest first, skipping missing values"""
+        column = self.columns[field]
+        result = []
+        for seq in self._seqs(since, limit):
+            value = column[seq % self.capacity]
+            if not math.isnan(value):
+                result.append((self.time_of(seq), value))
+        return result
+
+    def records(self, since=None, limit=None):
+        """Return stored entries as dicts, oldest first"""
+        result = []
+        for seq in self._seqs(since, limit):
+            slot = seq % self.capacity
+            record = {'time': self.times[slot]}
+            for field in FIELDS:
+                value = self.columns[field][slot]
+                record[field] = None if math.isnan(value) else value
+            policy = self.policy[slot]
+            gpu = self.gpu[slot]
+            record['policy'] = LEVELS[policy] if policy >= 0 else 'unknown'
+            record['gpu_status'] = GPU_STATES[gpu] if gpu >= 0 else 'unknown'
+            result.append(record)
+        return result
+
+
+SPARK_CHARS = '▁▂▃▄▅▆▇█'
+
+
+def sparkline(values, low=None, high=None):
+    """Render a sequence of numbers as a unicode sparkline"""
+    values = list(values)
+    if not values:
+        return ''
+    low = min(values) if low is None else low
+    high = max(values) if high is None else high
+    span = high - low
+    if span <= 0:
+        return SPARK_CHARS[0] * len(values)
+    top = len(SPARK_CHARS) - 1
+    return ''.join(
+        SPARK_CHARS[max(0, min(top, int((v - low) / span * top + 0.5)))]
+        for v in values
+    )
@@ -0,0 +1,166 @@
+"""Direct hwmon sysfs readers
+
+Temperatures and fan speeds are read from file descriptors that stay open
+for the life of the process and are re-read with pread(), so a sample costs
+one syscall instead of a fork+exec of sensors(1). The sensors text parsing
+is kept as a fallback for machines where the hwmon nodes can't be found.
+"""
+import os
+import re
+import subprocess
+
+from g14 import instrument
+
+
+class SysfsAttr:
+    """A sysfs attribute kept open and re-read from offset 0"""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def read(self):
+        """Return the current value as a stripped string"""
+        # sysfs regenerates the value on every read at offset 0
+        return os.pread(self.fd, 4096, 0).decode().strip()
+
+    def read_int(self):
+        """Return the current value as an int"""
+        return int(self.read())
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def find_hwmon(name, hwmon_dir):
+    """Return the hwmon directory whose name attribute matches, or None"""
+    try:
+        entries = sorted(os.listdir(hwmon_dir))
+    except OSError:
+        return None
+    for entry in entries:
+        path = os.path.join(hwmon_dir, entry)
+        try:
+            with open(os.path.join(path, 'name'), 'r') as f:
+                if f.read().strip() == name:
+                    return path
+        except OSError:
+            continue
+    return None
+
+
+def find_input(hwmon_path, kind, label):
+    """Return the {kind}N_input path labelled label, falling back to {kind}1"""
+    try:
+        entries = sorted(os.listdir(hwmon_path))
+    except OSError:
+        return None
+    for entry in entries:
+        if entry.startswith(kind) and entry.endswith('_label'):
+            try:
+                with open(os.path.join(hwmon_path, entry), 'r') as f:
+                    if f.read().strip() != label:
+                        continue
+            except OSError:
+                continue
+            path = os.path.join(hwmon_path, entry[:-len('_label')] + '_input')
+            if os.path.exists(path):
+                return path
+    path = os.path.join(hwmon_path, f'{kind}1_input')
+    if os.path.exists(path):
+        return path
+    return None
+
+
+def find_ccd_temps(hwmon_path):
+    """Return (name, path) of the k10temp per-CCD inputs (Tccd1, Tccd2, ...)"""
+    ccds = []
+    try:
+        entries = sorted(os.listdir(hwmon_path))
+    except OSError:
+        return ccds
+    for entry in entries:
+        if not (entry.startswith('temp') and entry.endswith('_label')):
+            continue
+        try:
+            with open(os.path.join(hwmon_path, entry), 'r') as f:
+                label = f.read().strip()
+        except OSError:
+            continue
+        path = os.path.join(hwmon_path, entry[:-len('_label')] + '_input')
+        if label.startswith('Tccd') and os.path.exists(path):
+            ccds.append((label.lower(), path))
+    return ccds
+
+
+def open_attr(path):
+    """Open path as a SysfsAttr, or return None if it's missing"""
+    if path is None:
+        return None
+    try:
+        return SysfsAttr(path)
+    except OSError:
+        return None
+
+
+class HwmonSensors:
+    """Tctl and CPU fan readers backed by the k10temp and asus hwmon nodes"""
+
+    def __init__(self, paths):
+        self.tctl = open_attr(paths.tctl)
+        self.cpu_fan = open_attr(paths.cpu_fan)
+
+    def temp(self):
+        """Return Tctl in degrees C, or None if it can't be read"""
+        if self.tctl is None:
+            return None
+        try:
+            # hwmon temperatures are in millidegrees
+            return self.tctl.read_int() / 1000.0
+        except (OSError, ValueError) as e:
+            instrument.error('hwmon.temp', e)
+            return None
+
+    def fan_rpm(self):
+        """Return the CPU fan speed in RPM, or None if it can't be read"""
+        if self.cpu_fan is None:
+            return None
+        try:
+            return self.cpu_fan.read_int()
+        except (OSError, ValueError) as e:
+            instrument.error('hwmon.fan_rpm', e)
+            return None
+
+    def close(self):
+        for attr in (self.tctl, self.cpu_fan):
+            if attr is not None:
+                attr.close()
+
+
+@instrument.timed('sensors')
+def read_sensors():
+    """Return the text output of sensors(1), or an empty string"""
+    try:
+        result = subprocess.run(['sensors'], capture_output=True, text=True)
+        return result.stdout
+    except OSError as e:
+        instrument.error('sensors', e)
+        return ""
+
+
+def parse_tctl(text):
+    """Parse Tctl in degrees C out of sensors(1) output"""
+    match = re.search(r'Tctl:\s+\+(\d+\.\d+)', text)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+def parse_cpu_fan(text):
+    """Parse the cpu_fan RPM out of sensors(1) output"""
+    match = re.search(r'cpu_fan:\s+(\d+) RPM', text)
+    if match:
+        return int(match.group(1))
+    return None
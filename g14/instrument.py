@@ -0,0 +1,155 @@
+"""Hot-path instrumentation for the collectors
+
+Collectors swallow their errors and return None or "unknown" so the tray
+keeps running, which also hides which of them is slow or failing. Each
+collector records into a named Probe here: a latency histogram, errors
+by exception type and stale reads (a call that produced no value).
+
+Set G14_INSTRUMENT=0 to switch it off. The timed() decorator then returns
+the function unchanged and record/error/stale return immediately.
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+from collections import Counter
+
+from g14.metrics import Histogram
+
+ENV = 'G14_INSTRUMENT'
+ENABLED = os.environ.get(ENV, '1') not in ('0', 'no', 'off', 'false')
+
+# Seconds, a sysfs pread is microseconds and a sensors fork milliseconds
+BUCKETS = (0.00001, 0.00003, 0.0001, 0.0003, 0.001, 0.003, 0.01, 0.03, 0.1, 0.3, 1.0)
+
+_lock = threading.Lock()
+_probes = {}
+
+
+class Probe:
+    """Latency, errors and stale reads of one collector"""
+
+    def __init__(self, name):
+        self.name = name
+        self.histogram = Histogram(BUCKETS)
+        self.max = 0.0
+        self.errors = Counter()
+        self.stale = 0
+
+    @property
+    def calls(self):
+        return self.histogram.count
+
+    @property
+    def mean(self):
+        return self.histogram.sum / self.histogram.count if self.histogram.count else None
+
+    def percentile(self, fraction):
+        """Upper bucket bound holding the given fraction of calls"""
+        if not self.histogram.count:
+            return None
+        wanted = fraction * self.histogram.count
+        seen = 0
+        for bound, n in zip(self.histogram.buckets, self.histogram.counts):
+            seen += n
+            if seen >= wanted:
+                return bound
+        return self.max
+
+    def summary(self):
+        """One line for menus and captures"""
+        parts = []
+        if self.calls:
+            parts.append(f"{self.calls} calls, avg {_duration(self.mean)}, "
+                         f"p95 ≤{_duration(self.percentile(0.95))}, max {_duration(self.max)}")
+        if self.errors:
+            parts.append(', '.join(f"{n} {kind}" for kind, n in self.errors.most_common()))
+        if self.stale:
+            parts.append(f"{self.stale} stale")
+        return f"{self.name}: {', '.join(parts)}"
+
+
+def _duration(seconds):
+    if seconds < 0.001:
+        return f"{seconds * 1e6:.0f}µs"
+    return f"{seconds * 1000:.1f}ms"
+
+
+def _probe(name):
+    with _lock:
+        return _probes.setdefault(name, Probe(name))
+
+
+def record(name, seconds):
+    """Record one call of a collector"""
+    if not ENABLED:
+        return
+    probe = _probes.get(name) or _probe(name)
+    histogram = probe.histogram
+    # Histogram.observe inlined, this runs several times per tick
+    i = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        if i < len(BUCKETS):
+            histogram.counts[i] += 1
+        histogram.count += 1
+        histogram.sum += seconds
+        if seconds > probe.max:
+            probe.max = seconds
+
+
+def error(name, exc):
+    """Record an exception a collector caught"""
+    if not ENABLED:
+        return
+    probe = _probes.get(name) or _probe(name)
+    with _lock:
+        probe.errors[type(exc).__name__] += 1
+
+
+def stale(name):
+    """Record a call that returned no value"""
+    if not ENABLED:
+        return
+    probe = _probes.get(name) or _probe(name)
+    with _lock:
+        probe.stale += 1
+
+
+def timed(name):
+    """Decorator recording the latency of every call, and exceptions that escape"""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                error(name, e)
+                raise
+            finally:
+                record(name, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def probes():
+    """Return the probes recorded so far, sorted by name"""
+    with _lock:
+        return [_probes[name] for name in sorted(_probes)]
+
+
+def report():
+    """Render every probe as lines, for captures"""
+    if not ENABLED:
+        return [f"  Instrumentation off ({ENV}=0)"]
+    lines = [f"  {probe.summary()}" for probe in probes()]
+    return lines or ["  No collector calls recorded yet"]
+
+
+def reset():
+    with _lock:
+        _probes.clear()
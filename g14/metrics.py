@@ -0,0 +1,225 @@
+"""OpenMetrics endpoint for the daemon
+
+The daemon hands Metrics its snapshot and counters once per tick. A scrape
+renders that cached state (and reuses the rendered text until the next
+tick), so it never reads the hardware and can't slow the control loop.
+render() needs no sockets, MetricsServer serves it on localhost.
+"""
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from g14.controller import LEVELS
+from g14.history import GPU_STATES
+
+ADDRESS = '127.0.0.1'
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Seconds, a tick is normally well under a millisecond
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def lines(self, name):
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            yield f'{name}_bucket{{le="{bound:g}"}} {cumulative}'
+        yield f'{name}_bucket{{le="+Inf"}} {self.count}'
+        yield f'{name}_sum {self.sum:.9g}'
+        yield f'{name}_count {self.count}'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _number(value):
+    return 'NaN' if value is None else str(value)
+
+
+class Metrics:
+    """The daemon's latest state, rendered on demand"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.ticks = 0
+        self.interval = None
+        self.transitions = {}
+        self.writes = (0, 0, 0)
+        self.tick_seconds = Histogram()
+        self.sample_seconds = Histogram()
+        self.sensors = {}
+        self.energy = {}
+        self.scrapes = 0
+        self._body = None
+
+    def update(self, snapshot, ticks, interval, transitions, writes,
+               tick_seconds=None, sample_seconds=None, sensors=None, energy=None):
+        """Record one tick, called from the control loop"""
+        with self.lock:
+            self.snapshot = snapshot
+            self.ticks = ticks
+            self.interval = interval
+            self.transitions = dict(transitions)
+            self.writes = writes
+            if tick_seconds is not None:
+                self.tick_seconds.observe(tick_seconds)
+            if sample_seconds is not None:
+                self.sample_seconds.observe(sample_seconds)
+            if sensors is not None:
+                self.sensors = sensors
+            if energy is not None:
+                self.energy = {state: tuple(totals) for state, totals in energy.items()}
+            self._body = None
+
+    def render(self):
+        """Return the OpenMetrics exposition as bytes"""
+        with self.lock:
+            self.scrapes += 1
+            if self._body is None:
+                self._body = ('\n'.join(self._lines()) + '\n').encode()
+            return self._body
+
+    def _lines(self):
+        s = self.snapshot
+
+        def gauge(name, text, value, unit=None):
+            yield f'# TYPE {name} gauge'
+            if unit:
+                yield f'# UNIT {name} {unit}'
+            yield f'# HELP {name} {text}'
+            yield f'{name} {_number(value)}'
+
+        def stateset(name, text, states, current):
+            yield f'# TYPE {name} stateset'
+            yield f'# HELP {name} {text}'
+            for state in states:
+                yield f'{name}{{{name}="{_escape(state)}"}} {int(state == current)}'
+
+        if s is not None:
+            yield from gauge('g14_tctl_celsius', "CPU temperature (Tctl)", s.temp, 'celsius')
+            yield from gauge('g14_cpu_fan_rpm', "CPU fan speed in RPM", s.fan_rpm)
+            yield '# TYPE g14_fan_curve_pwm gauge'
+            yield '# HELP g14_fan_curve_pwm Fan curve PWM (0-255) at the current temperature'
+            yield f'g14_fan_curve_pwm{{fan="cpu"}} {_number(s.pwm_cpu)}'
+            yield f'g14_fan_curve_pwm{{fan="gpu"}} {_number(s.pwm_gpu)}'
+            yield from gauge('g14_power_watts', "Battery power draw (power_now)", s.power, 'watts')
+            yield from stateset('g14_gpu_runtime_status', "dGPU runtime PM status",
+                                GPU_STATES + ('unknown',), s.gpu_status)
+            yield from stateset('g14_throttle_policy', "ASUS throttle thermal policy",
+                                LEVELS + ('unknown',), s.policy)
+            yield from gauge('g14_cpu_boost', "CPU boost enabled",
+                             None if s.boost is None else int(s.boost))
+            yield from gauge('g14_snapshot_timestamp_seconds', "When the snapshot was taken",
+                             s.time.timestamp(), 'seconds')
+
+        ccds = sorted(name for name in self.sensors if name.startswith('tccd'))
+        if ccds:
+            yield '# TYPE g14_ccd_celsius gauge'
+            yield '# UNIT g14_ccd_celsius celsius'
+            yield '# HELP g14_ccd_celsius Per-CCD temperature (Tccd)'
+            for name in ccds:
+                yield f'g14_ccd_celsius{{ccd="{name[4:]}"}} {_number(self.sensors[name])}'
+        if 'battery_capacity' in self.sensors:
+            yield from gauge('g14_battery_capacity_percent', "Battery charge",
+                             self.sensors['battery_capacity'], 'percent')
+
+        if self.energy:
+            for name, text, unit, index in (
+                    ('g14_energy_joules', "Battery energy per supply, policy, profile and GPU state "
+                     "(on AC the charge rate)", 'joules', 1),
+                    ('g14_state_seconds', "Time metered per supply, policy, profile and GPU state",
+                     'seconds', 0)):
+                yield f'# TYPE {name} counter'
+                yield f'# UNIT {name} {unit}'
+                yield f'# HELP {name} {text}'
+                for (supply, policy, platform, gpu), totals in sorted(self.energy.items()):
+                    yield (f'{name}_total{{supply="{_escape(supply)}",policy="{_escape(policy)}",'
+                           f'platform="{_escape(platform)}",gpu="{_escape(gpu)}"}} '
+                           f'{_number(totals[index])}')
+
+        yield from gauge('g14_sample_interval_seconds', "Current adaptive sampling interval",
+                         self.interval, 'seconds')
+
+        yield '# TYPE g14_ticks counter'
+        yield '# HELP g14_ticks Control iterations run'
+        yield f'g14_ticks_total {self.ticks}'
+
+        yield '# TYPE g14_policy_transitions counter'
+        yield '# HELP g14_policy_transitions Thermal policy changes by direction'
+        for (old, new), n in sorted(self.transitions.items()):
+            yield f'g14_policy_transitions_total{{from="{old}",to="{new}"}} {n}'
+
+        writes, skipped, errors = self.writes
+        yield '# TYPE g14_sysfs_writes counter'
+        yield '# HELP g14_sysfs_writes Control attribute writes by outcome'
+        yield f'g14_sysfs_writes_total{{result="written"}} {writes}'
+        yield f'g14_sysfs_writes_total{{result="skipped"}} {skipped}'
+        yield f'g14_sysfs_writes_total{{result="error"}} {errors}'
+
+        for name, text, histogram in (
+                ('g14_tick_duration_seconds', "Time spent in one control iteration", self.tick_seconds),
+                ('g14_sample_duration_seconds', "Time spent reading the sensors", self.sample_seconds)):
+            yield f'# TYPE {name} histogram'
+            yield f'# UNIT {name} seconds'
+            yield f'# HELP {name} {text}'
+            yield from histogram.lines(name)
+
+        yield '# EOF'
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes would flood the journal
+        pass
+
+
+class MetricsServer:
+    """Serves Metrics over HTTP from a background thread"""
+
+    def __init__(self, metrics, port, address=ADDRESS):
+        self.httpd = ThreadingHTTPServer((address, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.metrics = metrics
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       name='g14-metrics', daemon=True)
+
+    @property
+    def address(self):
+        return self.httpd.server_address
+
+    def start(self):
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,147 @@
+"""Sysfs path discovery
+
+hwmon numbering and PCI addresses change between boots and kernels, so
+every attribute the tools use is resolved once at startup by hwmon name,
+PCI vendor/class or driver binding and stored in an immutable SysfsPaths
+index. Attributes that can't be found are None and readers skip them.
+
+All lookups are relative to a configurable root (G14_SYSFS_ROOT, default
+"/"), which lets the whole tool run against a fake tree.
+"""
+import os
+from collections import namedtuple
+
+from g14.hwmon import find_hwmon, find_input
+
+ROOT_ENV = 'G14_SYSFS_ROOT'
+
+NVIDIA_VENDOR = '0x10de'
+DISPLAY_CLASS_PREFIX = '0x03'
+
+SysfsPaths = namedtuple('SysfsPaths', [
+    'root',
+    'tctl',                 # k10temp Tctl input (millidegrees C)
+    'cpu_fan',              # asus cpu_fan input (RPM)
+    'curve_hwmon',          # hwmon dir with pwm{1,2}_auto_point* files
+    'power_now',            # battery power_now (microwatts)
+    'ac_online',            # AC adapter online, 1 on AC and 0 on battery
+    'gpu_device',           # dGPU PCI device dir
+    'gpu_runtime_status',
+    'gpu_control',
+    'throttle_policy',
+    'platform_profile',
+    'cpu_boost',
+])
+
+
+def sysfs_root():
+    """Return the configured filesystem root"""
+    return os.environ.get(ROOT_ENV) or '/'
+
+
+def _path(root, *parts):
+    return os.path.join(root, *parts)
+
+
+def _existing(path):
+    if path is not None and os.path.exists(path):
+        return path
+    return None
+
+
+def _read(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _listdir(path):
+    try:
+        return sorted(os.listdir(path))
+    except OSError:
+        return []
+
+
+def find_curve_hwmon(hwmon_dir):
+    """Return the hwmon dir exposing the custom fan curves, or None"""
+    path = find_hwmon('asus_custom_fan_curve', hwmon_dir)
+    if path is not None:
+        return path
+    # Older kernels put the curve on a differently named node
+    for entry in _listdir(hwmon_dir):
+        path = _path(hwmon_dir, entry)
+        if os.path.exists(_path(path, 'pwm1_auto_point1_pwm')):
+            return path
+    return None
+
+
+def find_dgpu(root):
+    """Return the PCI device dir of the NVIDIA display controller, or None"""
+    devices = _path(root, 'sys/bus/pci/devices')
+    for entry in _listdir(devices):
+        path = _path(devices, entry)
+        if (_read(_path(path, 'vendor')) == NVIDIA_VENDOR
+                and (_read(_path(path, 'class')) or '').startswith(DISPLAY_CLASS_PREFIX)):
+            return path
+    return None
+
+
+def find_power_supply(root, kind):
+    """Return the first power_supply dir of a type (Battery, Mains), or None"""
+    supplies = _path(root, 'sys/class/power_supply')
+    for entry in _listdir(supplies):
+        path = _path(supplies, entry)
+        if _read(_path(path, 'type')) == kind:
+            return path
+    return None
+
+
+def find_battery(root):
+    """Return the first power_supply dir of type Battery, or None"""
+    return find_power_supply(root, 'Battery')
+
+
+def find_asus_wmi(root):
+    """Return the asus-nb-wmi platform device dir, or None"""
+    driver = _path(root, 'sys/bus/platform/drivers/asus-nb-wmi')
+    candidates = [_path(driver, entry) for entry in _listdir(driver)]
+    candidates.append(_path(root, 'sys/devices/platform/asus-nb-wmi'))
+    for path in candidates:
+        if os.path.exists(_path(path, 'throttle_thermal_policy')):
+            return path
+    return None
+
+
+def probe(root=None):
+    """Resolve every attribute once and return a SysfsPaths index"""
+    if root is None:
+        root = sysfs_root()
+    hwmon_dir = _path(root, 'sys/class/hwmon')
+
+    k10temp = find_hwmon('k10temp', hwmon_dir)
+    asus = find_hwmon('asus', hwmon_dir)
+    battery = find_battery(root)
+    mains = find_power_supply(root, 'Mains')
+    gpu = find_dgpu(root)
+    wmi = find_asus_wmi(root)
+
+    boost = _existing(_path(root, 'sys/devices/system/cpu/cpu0/cpufreq/boost'))
+    if boost is None:
+        boost = _existing(_path(root, 'sys/devices/system/cpu/cpufreq/boost'))
+
+    return SysfsPaths(
+        root=root,
+        tctl=find_input(k10temp, 'temp', 'Tctl') if k10temp else None,
+        cpu_fan=find_input(asus, 'fan', 'cpu_fan') if asus else None,
+        curve_hwmon=find_curve_hwmon(hwmon_dir),
+        power_now=_existing(_path(battery, 'power_now')) if battery else None,
+        ac_online=_existing(_path(mains, 'online')) if mains else None,
+        gpu_device=gpu,
+        gpu_runtime_status=_existing(_path(gpu, 'power/runtime_status')) if gpu else None,
+        gpu_control=_existing(_path(gpu, 'power/control')) if gpu else None,
+        throttle_policy=_path(wmi, 'throttle_thermal_policy') if wmi else None,
+        platform_profile=_existing(_path(root, 'sys/firmware/acpi/platform_profile')),
+        cpu_boost=boost,
+    )
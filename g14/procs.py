@@ -0,0 +1,116 @@
+"""Per-process CPU usage from /proc
+
+ps reports each process's lifetime average %CPU, which hides the short
+bursts that actually ramp the fans. ProcSampler reads utime+stime from
+/proc/[pid]/stat, remembers them per pid between samples and reports the
+CPU used over the interval since the previous sample.
+"""
+import heapq
+import os
+import threading
+import time
+
+from g14 import instrument
+from g14.paths import sysfs_root
+
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+
+# Take a fresh baseline when the previous sample is older than this
+MAX_AGE = 10.0
+# How long to measure over when there is no recent baseline
+MIN_WINDOW = 1.0
+
+
+def parse_stat(data):
+    """Return (comm, starttime, utime + stime) from a /proc/[pid]/stat line"""
+    # comm may contain spaces and parentheses, so split on the last ")"
+    open_paren = data.index('(')
+    close_paren = data.rindex(')')
+    comm = data[open_paren + 1:close_paren]
+    fields = data[close_paren + 2:].split()
+    # fields[0] is state; utime, stime and starttime are stat fields 14, 15, 22
+    return comm, int(fields[19]), int(fields[11]) + int(fields[12])
+
+
+class ProcSampler:
+    """Interval CPU usage per process"""
+
+    def __init__(self, proc_dir=None):
+        self.proc_dir = proc_dir or os.path.join(sysfs_root(), 'proc')
+        self.lock = threading.Lock()
+        self.jiffies = {}
+        self.comms = {}
+        self.last_time = None
+
+    def read(self):
+        """Return {pid: (comm, starttime, jiffies)} for every running process"""
+        result = {}
+        try:
+            entries = os.listdir(self.proc_dir)
+        except OSError:
+            return result
+        for entry in entries:
+            if not entry.isdigit():
+                continue
+            try:
+                with open(os.path.join(self.proc_dir, entry, 'stat'), 'r') as f:
+                    result[int(entry)] = parse_stat(f.read())
+            except (OSError, ValueError, IndexError):
+                # Exited while we were listing, or a kernel oddity
+                continue
+        return result
+
+    @instrument.timed('procs.sample')
+    def sample(self):
+        """Return [(pid, comm, cpu_percent)] since the previous sample
+
+        The first call only records a baseline and returns an empty list.
+        """
+        with self.lock:
+            now = time.monotonic()
+            current = self.read()
+            usage = []
+            if self.last_time is not None and now > self.last_time:
+                scale = 100.0 / (CLK_TCK * (now - self.last_time))
+                for pid, (comm, start, jiffies) in current.items():
+                    previous = self.jiffies.get(pid)
+                    if previous is not None and previous[0] == start:
+                        delta = jiffies - previous[1]
+                    else:
+                        # New since the last sample (or a reused pid)
+                        delta = 0
+                    if delta > 0:
+                        usage.append((pid, comm, delta * scale))
+            self.jiffies = {pid: (start, jiffies) for pid, (_, start, jiffies) in current.items()}
+            self.comms = {pid: comm for pid, (comm, _, _) in current.items()}
+            self.last_time = now
+            return usage
+
+    def top(self, n=3, max_age=MAX_AGE, min_window=MIN_WINDOW):
+        """Return the n busiest processes as [(pid, name, cpu_percent)]
+
+        Measures over the time since the previous sample, or over
+        min_window seconds (blocking) when that sample is stale.
+        """
+        if self.last_time is None or time.monotonic() - self.last_time > max_age:
+            self.sample()
+            time.sleep(min_window)
+        usage = self.sample()
+        busiest = heapq.nlargest(n, usage, key=lambda item: item[2])
+        return [(pid, self.name(pid, comm), percent) for pid, comm, percent in busiest]
+
+    def name(self, pid, comm):
+        """argv[0] like ps shows it, or [comm] for kernel threads"""
+        try:
+            with open(os.path.join(self.proc_dir, str(pid), 'cmdline'), 'rb') as f:
+                argv0 = f.read().split(b'\0', 1)[0].decode(errors='replace')
+        except OSError:
+            argv0 = ''
+        return argv0 or f"[{comm}]"
+
+
+def format_top(processes):
+    """Render top() output the way the debug log has always shown it"""
+    if not processes:
+        return "N/A"
+    return ', '.join(f"{name} ({percent:.1f}%)" for _, name, percent in processes)
@@ -0,0 +1,137 @@
+"""Pre-trigger recording for fan spin-ups
+
+By the time a spin-up is detected the process that caused it has often
+already finished its burst. PreTriggerRecorder samples per-process CPU on
+a background thread and keeps the last `window` seconds of samples; when
+a spin-up fires, freeze() copies that window together with the matching
+temperature and power history so the event log shows what led up to it.
+attribute() ranks processes by the CPU time they used before the ramp.
+"""
+import heapq
+import threading
+import time
+from collections import deque
+
+from g14.procs import ProcSampler
+
+WINDOW = 30.0
+INTERVAL = 2.0
+# Processes kept per sample, the long tail isn't worth storing
+KEEP = 8
+# Seconds before the trigger that attribution looks at
+ATTRIBUTION_WINDOW = 10.0
+
+
+class ProcSample:
+    """CPU usage of the busiest processes over one sampling interval"""
+    __slots__ = ('time', 'interval', 'usage')
+
+    def __init__(self, time, interval, usage):
+        self.time = time
+        self.interval = interval
+        self.usage = usage      # [(pid, comm, cpu_percent)], busiest first
+
+
+class FrozenWindow:
+    """Everything recorded in the window before a trigger"""
+
+    def __init__(self, trigger_time, samples, records):
+        self.trigger_time = trigger_time
+        self.samples = samples
+        self.records = records
+
+    def attribute(self, seconds=ATTRIBUTION_WINDOW, n=3):
+        """Rank processes by CPU seconds used in the seconds before the trigger
+
+        Returns [(comm, pid, cpu_seconds)], biggest first.
+        """
+        since = self.trigger_time - seconds
+        used = {}
+        for sample in self.samples:
+            if sample.time < since:
+                continue
+            # The sample covers (time - interval, time], clip it to the window
+            covered = min(sample.interval, sample.time - since)
+            for pid, comm, percent in sample.usage:
+                key = (comm, pid)
+                used[key] = used.get(key, 0.0) + percent / 100.0 * covered
+        ranked = sorted(used.items(), key=lambda item: item[1], reverse=True)[:n]
+        return [(comm, pid, seconds) for (comm, pid), seconds in ranked]
+
+    def timeline(self):
+        """Render the window as one line per history record, oldest first"""
+        lines = []
+        samples = list(self.samples)
+        i = 0
+        for record in self.records:
+            # Pair each record with the last process sample taken before it
+            while i < len(samples) - 1 and samples[i + 1].time <= record['time']:
+                i += 1
+            offset = record['time'] - self.trigger_time
+            temp = f"{record['temp']:.1f}°C" if record['temp'] is not None else "--°C"
+            power = f"{record['power']:.1f}W" if record['power'] is not None else "--W"
+            pwm = f"{record['pwm_cpu']:.0f}" if record['pwm_cpu'] is not None else "---"
+            line = f"{offset:+6.1f}s {temp} {power} PWM {pwm}"
+            if samples and samples[i].time <= record['time']:
+                procs = ', '.join(f"{comm} {percent:.0f}%" for _, comm, percent in samples[i].usage[:3])
+                if procs:
+                    line += f" | {procs}"
+            lines.append(line)
+        return lines
+
+
+class PreTriggerRecorder:
+    """Background per-process CPU sampler with a rolling time window"""
+
+    def __init__(self, procs=None, window=WINDOW, interval=INTERVAL, keep=KEEP):
+        self.procs = procs or ProcSampler()
+        self.window = window
+        self.interval = interval
+        self.keep = keep
+        self.samples = deque()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='g14-recorder', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+
+    def _run(self):
+        # Baseline, the first sample has nothing to diff against
+        self.procs.sample()
+        while not self.stopping.wait(self.interval):
+            self.record()
+
+    def record(self):
+        """Take one process sample and drop samples older than the window"""
+        started = time.monotonic()
+        previous = self.procs.last_time
+        usage = heapq.nlargest(self.keep, self.procs.sample(), key=lambda item: item[2])
+        now = time.time()
+        interval = started - previous if previous is not None else self.interval
+        with self.lock:
+            self.samples.append(ProcSample(now, interval, usage))
+            while self.samples and self.samples[0].time < now - self.window:
+                self.samples.popleft()
+
+    def latest(self, max_age=None):
+        """Return the newest ProcSample, or None if there is none recent enough"""
+        with self.lock:
+            if not self.samples:
+                return None
+            sample = self.samples[-1]
+        if max_age is not None and time.time() - sample.time > max_age:
+            return None
+        return sample
+
+    def freeze(self, history, trigger_time):
+        """Copy the window before trigger_time (epoch seconds) into a FrozenWindow"""
+        since = trigger_time - self.window
+        with self.lock:
+            samples = [sample for sample in self.samples if sample.time >= since]
+        return FrozenWindow(trigger_time, samples, history.records(since=since))
@@ -0,0 +1,132 @@
+"""Sensor registry with a sampling cadence per attribute
+
+Tctl moves within a second, while the throttle policy, platform profile
+and CPU boost only change when someone writes them. Each Sensor declares
+how often it is worth reading (cadence) and how long its last good value
+may stand in when a read fails (max_age). poll() reads the sensors that
+are due in one pass and serves the cached values of the rest, so a sensor
+with a long cadence costs nothing on most wakeups. invalidate() makes a
+sensor due straight away, e.g. after we wrote its attribute ourselves.
+"""
+import time
+
+# Read a sensor that falls due this close to now, so a 2s cadence polled
+# every 2s doesn't slip to every other wakeup on timer jitter
+SLACK = 0.1
+
+
+class Sensor:
+    """One value, its reader and when it was last read"""
+    __slots__ = ('name', 'read', 'cadence', 'max_age', 'source', 'default',
+                 'value', 'ok', 'read_at', 'good_at', 'reads', 'failures')
+
+    def __init__(self, name, read, cadence, max_age=0.0, source=None, default=None):
+        self.name = name
+        self.read = read
+        self.cadence = cadence
+        self.max_age = max_age
+        self.source = source or name
+        self.default = default
+        self.value = None
+        self.ok = False
+        self.read_at = None
+        self.good_at = None
+        self.reads = 0
+        self.failures = 0
+
+    def due(self, now):
+        return self.read_at is None or now - self.read_at >= self.cadence - SLACK
+
+    def current(self, now):
+        """The last good value, or default once it is older than max_age"""
+        if self.good_at is None:
+            return self.default
+        if not self.ok and now - self.good_at > self.max_age:
+            return self.default
+        return self.value
+
+
+class SensorRegistry:
+    """Sensors polled together, each at its own cadence"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.sensors = {}
+        self.polls = 0
+        self.reads = 0
+        self.skipped = 0
+
+    def add(self, name, read, cadence, max_age=0.0, source=None, default=None):
+        """Register read() as sensor name, read at most every cadence seconds
+
+        source is the attribute the sensor reads, for invalidate(). read()
+        returns None when it can't produce a value.
+        """
+        sensor = Sensor(name, read, cadence, max_age, source, default)
+        self.sensors[name] = sensor
+        return sensor
+
+    def poll(self, names=None, now=None):
+        """Read the sensors that are due and return {name: value}
+
+        names limits the poll to some sensors, the others aren't read.
+        """
+        if now is None:
+            now = self.clock()
+        self.polls += 1
+        sensors = self.sensors
+        values = {}
+        for sensor in (sensors.values() if names is None else (sensors[n] for n in names)):
+            if sensor.due(now):
+                sensor.read_at = now
+                sensor.reads += 1
+                self.reads += 1
+                value = sensor.read()
+                sensor.ok = value is not None
+                if value is None:
+                    sensor.failures += 1
+                else:
+                    sensor.value = value
+                    sensor.good_at = now
+            else:
+                self.skipped += 1
+            values[sensor.name] = sensor.current(now)
+        return values
+
+    def value(self, name, now=None):
+        """Return the cached value of a sensor without reading it"""
+        return self.sensors[name].current(self.clock() if now is None else now)
+
+    def invalidate(self, source):
+        """Make every sensor reading attribute source due on the next poll"""
+        for sensor in self.sensors.values():
+            if sensor.source == source or sensor.name == source:
+                sensor.read_at = None
+
+    def set_cadence(self, source, cadence):
+        """Change the cadence of every sensor reading attribute source"""
+        for sensor in self.sensors.values():
+            if sensor.source == source or sensor.name == source:
+                sensor.cadence = cadence
+
+    def expire(self):
+        """Make every sensor due on the next poll"""
+        for sensor in self.sensors.values():
+            sensor.read_at = None
+
+    def report(self, now=None):
+        """Render every sensor's cadence and read counts as lines, for captures"""
+        if now is None:
+            now = self.clock()
+        lines = []
+        for sensor in self.sensors.values():
+            line = f"  {sensor.name}: every {sensor.cadence:g}s, {sensor.reads} reads"
+            if sensor.failures:
+                line += f", {sensor.failures} failed"
+            if sensor.read_at is not None:
+                line += f", last {now - sensor.read_at:.1f}s ago"
+            lines.append(line)
+        total = self.reads + self.skipped
+        if total:
+            lines.append(f"  {self.skipped} of {total} sensor reads skipped as not due")
+        return lines
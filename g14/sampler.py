@@ -0,0 +1,247 @@
+"""Per-tick sensor sampling shared by the tray monitor and the daemon
+
+A Sampler owns persistent handles for every attribute in the SysfsPaths
+index and turns one pass over them into an immutable Snapshot, so every
+consumer of a tick sees the same values and nothing is forked. Each
+value is registered in a SensorRegistry with its own cadence, so a sample
+re-reads Tctl but serves the policy and profile from cache until they are
+due. Given a shared SnapshotReader it returns the daemon's published
+snapshot instead and only reads the hardware itself when the daemon isn't
+publishing.
+"""
+import os
+import time
+from datetime import datetime
+
+from g14 import instrument
+
+from g14.curves import FanCurves
+from g14.hwmon import (HwmonSensors, find_ccd_temps, open_attr, read_sensors,
+                       parse_tctl, parse_cpu_fan)
+from g14.paths import probe
+from g14.registry import SensorRegistry
+
+# throttle_thermal_policy values as written by asus-nb-wmi
+POLICY_NAMES = {
+    '0': 'balanced',
+    '1': 'performance',
+    '2': 'quiet',
+}
+POLICY_VALUES = {name: value for value, name in POLICY_NAMES.items()}
+
+# Snapshot field -> (seconds between reads, seconds the last good value
+# may stand in for a failed read). Attributes we write ourselves are
+# invalidated on write, so their cadence only bounds outside changes.
+CADENCES = {
+    'temp': (0.5, 2.0),
+    'fan_rpm': (1.0, 5.0),
+    'power': (2.0, 10.0),
+    'ac': (2.0, 10.0),
+    'gpu_status': (2.0, 10.0),
+    'gpu_control': (10.0, 30.0),
+    'policy': (10.0, 30.0),
+    'platform': (30.0, 60.0),
+    'boost': (30.0, 60.0),
+}
+# Extra sensors, read only when due: per-CCD temperatures and battery charge
+CCD_CADENCE = 5.0
+BATTERY_CADENCE = 60.0
+
+
+class Snapshot:
+    """Sensor readings collected once per update tick"""
+    __slots__ = ('time', 'temp', 'fan_rpm', 'pwm_cpu', 'pwm_gpu', 'power',
+                 'gpu_status', 'gpu_control', 'policy', 'platform', 'boost', 'ac')
+
+    def __init__(self, time, temp, fan_rpm, pwm_cpu, pwm_gpu, power,
+                 gpu_status, gpu_control, policy, platform, boost, ac=None):
+        self.time = time
+        self.temp = temp
+        self.fan_rpm = fan_rpm
+        self.pwm_cpu = pwm_cpu
+        self.pwm_gpu = pwm_gpu
+        self.power = power
+        self.gpu_status = gpu_status
+        self.gpu_control = gpu_control
+        self.policy = policy
+        self.platform = platform
+        self.boost = boost
+        # On AC power_now is the charge rate, not what the machine draws
+        self.ac = ac
+
+
+def _millidegrees(value):
+    return int(value) / 1000.0
+
+
+class Sampler:
+    """Reads every sensor through persistent file handles"""
+
+    def __init__(self, paths=None, shared=None, cadences=None):
+        self.paths = paths or probe()
+        self.hwmon = HwmonSensors(self.paths)
+        self.curves = FanCurves(self.paths.curve_hwmon)
+        self.shared = shared
+        self.attrs = {}
+        self.extra_paths = {}
+        self.extras = ()
+
+        cadences = dict(CADENCES, **(cadences or {}))
+        self.registry = SensorRegistry()
+        for name, read, source, default in (
+                ('temp', self.temp, 'tctl', None),
+                ('fan_rpm', self.fan_rpm, 'cpu_fan', None),
+                ('power', self.power, 'power_now', None),
+                ('ac', self.ac_online, 'ac_online', None),
+                ('gpu_status', lambda: self.read('gpu_runtime_status'), 'gpu_runtime_status', "unknown"),
+                ('gpu_control', lambda: self.read('gpu_control'), 'gpu_control', "unknown"),
+                ('policy', lambda: POLICY_NAMES.get(self.read('throttle_policy')), 'throttle_policy', "unknown"),
+                ('platform', lambda: self.read('platform_profile'), 'platform_profile', "unknown"),
+                ('boost', self.cpu_boost, 'cpu_boost', None)):
+            cadence, max_age = cadences[name]
+            self.registry.add(name, read, cadence, max_age, source, default)
+
+        if self.paths.tctl is not None:
+            for name, path in find_ccd_temps(os.path.dirname(self.paths.tctl)):
+                self.add_sensor(name, path, _millidegrees, CCD_CADENCE)
+        if self.paths.power_now is not None:
+            capacity = os.path.join(os.path.dirname(self.paths.power_now), 'capacity')
+            if os.path.exists(capacity):
+                self.add_sensor('battery_capacity', capacity, int, BATTERY_CADENCE)
+
+    def add_sensor(self, name, path, parse, cadence, max_age=0.0):
+        """Register an extra attribute, read through a persistent handle when due"""
+        self.extra_paths[name] = path
+        self.extras += (name,)
+
+        def read():
+            value = self.read(name)
+            if value is None:
+                return None
+            try:
+                return parse(value)
+            except ValueError as e:
+                instrument.error('sysfs.' + name, e)
+                return None
+
+        return self.registry.add(name, read, cadence, max_age)
+
+    def read(self, name):
+        """Read attribute name from the path index, or None if unavailable"""
+        attr = self.attrs.get(name)
+        if attr is None:
+            path = self.extra_paths.get(name) or getattr(self.paths, name)
+            attr = open_attr(path)
+            if attr is None:
+                return None
+            self.attrs[name] = attr
+        started = time.perf_counter()
+        try:
+            value = attr.read()
+        except OSError as e:
+            instrument.error('sysfs.' + name, e)
+            instrument.stale('sysfs.' + name)
+            # Reopen on the next read in case the device went away
+            attr.close()
+            del self.attrs[name]
+            return None
+        instrument.record('sysfs.' + name, time.perf_counter() - started)
+        return value
+
+    @instrument.timed('temp')
+    def temp(self):
+        """CPU temperature (Tctl) in degrees C"""
+        temp = self.hwmon.temp()
+        if temp is None:
+            temp = parse_tctl(read_sensors())
+            if temp is None:
+                instrument.stale('temp')
+        return temp
+
+    @instrument.timed('fan_rpm')
+    def fan_rpm(self):
+        """CPU fan speed in RPM"""
+        rpm = self.hwmon.fan_rpm()
+        if rpm is None:
+            rpm = parse_cpu_fan(read_sensors())
+            if rpm is None:
+                instrument.stale('fan_rpm')
+        return rpm
+
+    def power(self):
+        """Battery power draw in watts"""
+        try:
+            # power_now is in microwatts, convert to watts
+            return int(self.read('power_now')) / 1000000.0
+        except ValueError as e:
+            instrument.error('sysfs.power_now', e)
+            return None
+        except TypeError:
+            # Not available on this machine
+            return None
+
+    def gpu_status(self):
+        return self.read('gpu_runtime_status') or "unknown"
+
+    def gpu_control(self):
+        return self.read('gpu_control') or "unknown"
+
+    def policy(self):
+        return POLICY_NAMES.get(self.read('throttle_policy'), "unknown")
+
+    def platform_profile(self):
+        return self.read('platform_profile') or "unknown"
+
+    def ac_online(self):
+        online = self.read('ac_online')
+        if online is None:
+            return None
+        return online == '1'
+
+    def cpu_boost(self):
+        boost = self.read('cpu_boost')
+        if boost is None:
+            return None
+        return boost == '1'
+
+    def pwm(self, fan, temp):
+        """Curve PWM (0-255) for fan 1 (CPU) or 2 (GPU) at temp"""
+        return self.curves.pwm(fan, temp)
+
+    def sample(self):
+        """Return the shared snapshot if one is published, else read the sensors that are due"""
+        if self.shared is not None:
+            snapshot = self.shared.read()
+            if snapshot is not None:
+                return snapshot
+        values = self.registry.poll()
+        temp = values['temp']
+        return Snapshot(
+            time=datetime.now(),
+            temp=temp,
+            fan_rpm=values['fan_rpm'],
+            pwm_cpu=self.pwm(1, temp),
+            # CPU temp is used as a proxy since the GPU is usually suspended
+            pwm_gpu=self.pwm(2, temp),
+            power=values['power'],
+            gpu_status=values['gpu_status'],
+            gpu_control=values['gpu_control'],
+            policy=values['policy'],
+            platform=values['platform'],
+            boost=values['boost'],
+            ac=values['ac'],
+        )
+
+    def extra_values(self):
+        """Cached values of the extra sensors, as of the last poll"""
+        registry = self.registry
+        return {name: registry.value(name) for name in self.extras}
+
+    def close(self):
+        if self.shared is not None:
+            self.shared.close()
+        self.hwmon.close()
+        self.curves.close()
+        for attr in self.attrs.values():
+            attr.close()
+        self.attrs.clear()
@@ -0,0 +1,193 @@
+"""Latest snapshot shared through a memory-mapped file
+
+The daemon already reads every sensor each tick. SnapshotPublisher writes
+that Snapshot into a small file on tmpfs and SnapshotReader maps it, so
+the tray, the TUI and scripts read the daemon's values without touching
+the hardware. Once mapped, a read is a few memory loads and no syscalls.
+
+Writes are guarded by a seqlock: the sequence number is odd while the
+publisher is writing and is bumped again when done, so a reader that sees
+an odd or changed sequence retries instead of returning a torn snapshot.
+"""
+import mmap
+import os
+import struct
+import time
+from datetime import datetime
+
+from g14.sampler import Snapshot
+
+SNAPSHOT_PATH = '/dev/shm/g14-snapshot'
+
+MAGIC = b'G14S'
+VERSION = 2
+HEADER = struct.Struct('<4sHxxQ')
+SEQ = struct.Struct('<Q')
+SEQ_OFFSET = 8
+# time, temp, fan_rpm, pwm_cpu, pwm_gpu, power, publisher interval,
+# gpu_status, gpu_control, policy, platform, boost, ac
+PAYLOAD = struct.Struct('<dffffff16s16s16s24sbbxx')
+SIZE = HEADER.size + PAYLOAD.size
+
+# A snapshot older than this means the publisher stopped
+MAX_AGE = 15.0
+RETRIES = 100
+
+NAN = float('nan')
+
+
+def _float(value):
+    return NAN if value is None else float(value)
+
+
+def _value(value, cast=float):
+    return None if value != value else cast(value)
+
+
+def _text(data):
+    return data.rstrip(b'\0').decode(errors='replace')
+
+
+class SnapshotPublisher:
+    """Writes snapshots for other processes to read"""
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        # Reuse an existing file so mappings held by readers stay valid
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.fchmod(fd, 0o644)
+            if os.fstat(fd).st_size != SIZE:
+                os.ftruncate(fd, SIZE)
+            self.data = mmap.mmap(fd, SIZE)
+        finally:
+            os.close(fd)
+        magic, version, self.seq = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            self.seq = 0
+        # Leave the sequence even in case a previous publisher died mid-write
+        self.seq += self.seq & 1
+        HEADER.pack_into(self.data, 0, MAGIC, VERSION, self.seq)
+        self.published = 0
+
+    def publish(self, snapshot, interval=None):
+        payload = PAYLOAD.pack(
+            snapshot.time.timestamp(),
+            _float(snapshot.temp),
+            _float(snapshot.fan_rpm),
+            _float(snapshot.pwm_cpu),
+            _float(snapshot.pwm_gpu),
+            _float(snapshot.power),
+            _float(interval),
+            snapshot.gpu_status.encode(),
+            snapshot.gpu_control.encode(),
+            snapshot.policy.encode(),
+            snapshot.platform.encode(),
+            -1 if snapshot.boost is None else int(snapshot.boost),
+            -1 if snapshot.ac is None else int(snapshot.ac),
+        )
+        self.seq += 1
+        SEQ.pack_into(self.data, SEQ_OFFSET, self.seq)
+        self.data[HEADER.size:SIZE] = payload
+        self.seq += 1
+        SEQ.pack_into(self.data, SEQ_OFFSET, self.seq)
+        self.published += 1
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+
+class SnapshotReader:
+    """Reads the published snapshot, or None when there is no live publisher"""
+
+    def __init__(self, path=SNAPSHOT_PATH, max_age=MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.data = None
+        self.inode = None
+        self.interval = None
+        self.hits = 0
+        self.misses = 0
+        self.retries = 0
+
+    def _map(self):
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            return False
+        try:
+            st = os.fstat(fd)
+            if st.st_size < SIZE:
+                return False
+            data = mmap.mmap(fd, SIZE, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        magic, version, _ = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            data.close()
+            return False
+        self.close()
+        self.data = data
+        self.inode = st.st_ino
+        return True
+
+    def _remap(self):
+        """Map the file again if it was replaced since we mapped it"""
+        try:
+            if os.stat(self.path).st_ino == self.inode:
+                return False
+        except OSError:
+            return False
+        return self._map()
+
+    def read_raw(self):
+        """Return a consistent payload tuple, or None"""
+        data = self.data
+        for _ in range(RETRIES):
+            before = SEQ.unpack_from(data, SEQ_OFFSET)[0]
+            if before & 1:
+                self.retries += 1
+                continue
+            values = PAYLOAD.unpack_from(data, HEADER.size)
+            if SEQ.unpack_from(data, SEQ_OFFSET)[0] == before:
+                return values if before else None
+            self.retries += 1
+        return None
+
+    def read(self):
+        """Return the published Snapshot if it is fresh enough"""
+        if self.data is None and not self._map():
+            self.misses += 1
+            return None
+        values = self.read_raw()
+        if values is not None and time.time() - values[0] > self.max_age:
+            # The daemon may have restarted with a new file
+            values = self.read_raw() if self._remap() else None
+            if values is not None and time.time() - values[0] > self.max_age:
+                values = None
+        if values is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.interval = _value(values[6])
+        return Snapshot(
+            time=datetime.fromtimestamp(values[0]),
+            temp=_value(values[1]),
+            fan_rpm=_value(values[2], int),
+            pwm_cpu=_value(values[3], int),
+            pwm_gpu=_value(values[4], int),
+            power=_value(values[5]),
+            gpu_status=_text(values[7]),
+            gpu_control=_text(values[8]),
+            policy=_text(values[9]),
+            platform=_text(values[10]),
+            boost=None if values[11] < 0 else bool(values[11]),
+            ac=None if values[12] < 0 else bool(values[12]),
+        )
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
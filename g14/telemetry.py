@@ -0,0 +1,445 @@
+"""Compact binary telemetry store
+
+Every snapshot is packed into a fixed-width RECORD and appended to
+raw.g14t: 33 bytes in version 2, which added the AC status, 32 in
+version 1, whose files are upgraded when the store opens them. Records
+are also averaged into 1 minute and 1 hour buckets in 1m.g14t and
+1h.g14t, so long ranges can be read from a small file. The bucket still
+filling is written when the store closes. Each tier keeps its own
+retention and is compacted by rewriting its tail.
+
+Readers mmap the files and binary search on the timestamp, so a range
+query only touches the records it returns. main() is the query/export
+command behind g14-telemetry.py.
+"""
+import argparse
+import bisect
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+
+from g14.controller import LEVELS
+from g14.history import GPU_STATES
+
+TELEMETRY_DIR = '/var/lib/g14-fan-control'
+
+MAGIC = b'G14T'
+VERSION = 2
+HEADER = struct.Struct('<4sHHI4x')
+# time, temp, power, fan_rpm, pwm_cpu, pwm_gpu, policy, gpu, platform, boost, ac
+RECORD = struct.Struct('<dfffffbbbbb')
+# Version 1 had no ac, files are upgraded when the store opens them
+RECORDS = {1: struct.Struct('<dfffffbbbb'), VERSION: RECORD}
+TIME = struct.Struct('<d')
+
+FIELDS = ('time', 'temp', 'power', 'fan_rpm', 'pwm_cpu', 'pwm_gpu',
+          'policy', 'gpu_status', 'platform', 'boost', 'ac')
+NUMERIC = ('temp', 'power', 'fan_rpm', 'pwm_cpu', 'pwm_gpu')
+
+PROFILES = ('low-power', 'cool', 'quiet', 'balanced', 'balanced-performance', 'performance')
+
+# name -> (bucket seconds, retention seconds or None to keep forever)
+TIERS = {
+    'raw': (0, 2 * 24 * 3600),
+    '1m': (60, 31 * 24 * 3600),
+    '1h': (3600, None),
+}
+
+FLUSH_INTERVAL = 60.0
+COMPACT_INTERVAL = 24 * 3600.0
+
+NAN = float('nan')
+
+
+def _float(value):
+    return NAN if value is None else float(value)
+
+
+def _code(value, names):
+    try:
+        return names.index(value)
+    except ValueError:
+        return -1
+
+
+def _name(code, names):
+    return names[code] if 0 <= code < len(names) else 'unknown'
+
+
+def pack_snapshot(snapshot):
+    """Pack a Snapshot into a RECORD"""
+    return RECORD.pack(
+        snapshot.time.timestamp(),
+        _float(snapshot.temp),
+        _float(snapshot.power),
+        _float(snapshot.fan_rpm),
+        _float(snapshot.pwm_cpu),
+        _float(snapshot.pwm_gpu),
+        _code(snapshot.policy, LEVELS),
+        _code(snapshot.gpu_status, GPU_STATES),
+        _code(snapshot.platform, PROFILES),
+        -1 if snapshot.boost is None else int(snapshot.boost),
+        -1 if snapshot.ac is None else int(snapshot.ac),
+    )
+
+
+def unpack_record(data, offset=0, fmt=RECORD):
+    """Unpack a RECORD (or fmt, an older one) into a dict with None for missing values"""
+    values = fmt.unpack_from(data, offset)
+    record = {'time': values[0]}
+    for field, value in zip(NUMERIC, values[1:6]):
+        record[field] = None if math.isnan(value) else value
+    record['policy'] = _name(values[6], LEVELS)
+    record['gpu_status'] = _name(values[7], GPU_STATES)
+    record['platform'] = _name(values[8], PROFILES)
+    record['boost'] = None if values[9] < 0 else bool(values[9])
+    record['ac'] = None if len(values) < 11 or values[10] < 0 else bool(values[10])
+    return record
+
+
+def upgrade(path, version):
+    """Rewrite a tier file of an older version as a VERSION file"""
+    old = RECORDS[version]
+    tmp = path + '.tmp'
+    with open(path, 'rb') as f, open(tmp, 'wb') as out:
+        _, _, _, seconds = HEADER.unpack(f.read(HEADER.size))
+        out.write(HEADER.pack(MAGIC, VERSION, RECORD.size, seconds))
+        while True:
+            data = f.read(old.size * 4096)
+            for offset in range(0, len(data) - old.size + 1, old.size):
+                # Older records didn't know the supply state
+                out.write(RECORD.pack(*old.unpack_from(data, offset), -1))
+            if len(data) < old.size * 4096:
+                break
+    os.replace(tmp, path)
+
+
+class Bucket:
+    """Running average of the raw records that fall into one time bucket"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.reset(None)
+
+    def reset(self, start):
+        self.start = start
+        self.sums = [0.0] * len(NUMERIC)
+        self.counts = [0] * len(NUMERIC)
+        self.last = None
+
+    def add(self, values):
+        """Add an unpacked RECORD tuple, return a packed record if a bucket closed"""
+        start = values[0] - values[0] % self.seconds
+        closed = None
+        if self.start is not None and start != self.start and self.last is not None:
+            closed = self.pack()
+        if start != self.start:
+            self.reset(start)
+        for i, value in enumerate(values[1:6]):
+            if not math.isnan(value):
+                self.sums[i] += value
+                self.counts[i] += 1
+        # Policy, GPU state, profile and boost take the bucket's last value
+        self.last = values[6:]
+        return closed
+
+    def pack(self):
+        means = [s / n if n else NAN for s, n in zip(self.sums, self.counts)]
+        return RECORD.pack(self.start, *means, *self.last)
+
+
+class TierFile:
+    """One append-only tier file"""
+
+    def __init__(self, path, seconds, retention):
+        self.path = path
+        self.seconds = seconds
+        self.retention = retention
+        self.file = None
+        self.last_time = None
+        self.open()
+
+    def open(self):
+        try:
+            with open(self.path, 'rb') as f:
+                magic, version, record_size, _ = HEADER.unpack(f.read(HEADER.size))
+        except (OSError, struct.error):
+            pass
+        else:
+            if magic == MAGIC and version != VERSION and version in RECORDS \
+                    and record_size == RECORDS[version].size:
+                upgrade(self.path, version)
+        self.file = open(self.path, 'ab')
+        size = self.file.tell()
+        if size < HEADER.size:
+            self.file.truncate(0)
+            self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, self.seconds))
+            self.file.flush()
+            self.last_time = None
+            return
+        # Cut a record torn by a crash so appends stay aligned
+        torn = (size - HEADER.size) % RECORD.size
+        if torn:
+            self.file.truncate(size - torn)
+        reader = TelemetryReader(self.path)
+        self.last_time = reader.last_time()
+        reader.close()
+
+    def append(self, record):
+        self.file.write(record)
+        self.last_time = TIME.unpack_from(record)[0]
+
+    def flush(self):
+        self.file.flush()
+
+    def compact(self, now):
+        """Drop records older than the retention by rewriting the file"""
+        if self.retention is None:
+            return 0
+        self.flush()
+        reader = TelemetryReader(self.path)
+        try:
+            keep_from = reader.index(now - self.retention)
+            if keep_from == 0:
+                return 0
+            tmp = self.path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, self.seconds))
+                f.write(reader.data[HEADER.size + keep_from * RECORD.size:])
+        finally:
+            reader.close()
+        self.file.close()
+        os.replace(tmp, self.path)
+        self.open()
+        return keep_from
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class TelemetryStore:
+    """Appends snapshots to the raw tier and feeds the downsampled tiers"""
+
+    def __init__(self, directory=TELEMETRY_DIR, tiers=TIERS):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.files = {
+            name: TierFile(os.path.join(directory, f'{name}.g14t'), seconds, retention)
+            for name, (seconds, retention) in tiers.items()
+        }
+        self.buckets = {name: Bucket(seconds) for name, (seconds, _) in tiers.items() if seconds}
+        self.records = 0
+        self._flushed = time.monotonic()
+        self._compacted = None
+
+    def append(self, snapshot):
+        record = pack_snapshot(snapshot)
+        self.files['raw'].append(record)
+        self.records += 1
+        values = RECORD.unpack(record)
+        for name, bucket in self.buckets.items():
+            closed = bucket.add(values)
+            if closed is not None:
+                self._append(name, closed)
+
+        now = time.monotonic()
+        if now - self._flushed >= FLUSH_INTERVAL:
+            self.flush()
+        if self._compacted is None or now - self._compacted >= COMPACT_INTERVAL:
+            self.compact()
+
+    def _append(self, name, record):
+        tier = self.files[name]
+        # A restart can reopen a bucket that was already written
+        if tier.last_time is None or TIME.unpack_from(record)[0] > tier.last_time:
+            tier.append(record)
+            tier.flush()
+
+    def flush(self):
+        for tier in self.files.values():
+            tier.flush()
+        self._flushed = time.monotonic()
+
+    def compact(self):
+        now = time.time()
+        for tier in self.files.values():
+            tier.compact(now)
+        self._compacted = time.monotonic()
+
+    def close(self):
+        # Write the buckets still filling, a restart would leave a hole
+        for name, bucket in self.buckets.items():
+            if bucket.last is not None:
+                self._append(name, bucket.pack())
+        for tier in self.files.values():
+            tier.close()
+
+
+class TelemetryReader:
+    """Memory-mapped read access to one tier file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        if size < HEADER.size:
+            raise ValueError(f"{path}: not a telemetry file")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, self.seconds = HEADER.unpack_from(self.data)
+        self.record = RECORDS.get(version)
+        if magic != MAGIC or self.record is None or record_size != self.record.size:
+            self.close()
+            raise ValueError(f"{path}: unsupported telemetry file")
+        # Ignore a torn record at the end
+        self.count = (size - HEADER.size) // record_size
+
+    def __len__(self):
+        return self.count
+
+    def time_at(self, i):
+        return TIME.unpack_from(self.data, HEADER.size + i * self.record.size)[0]
+
+    def last_time(self):
+        return self.time_at(self.count - 1) if self.count else None
+
+    def index(self, t):
+        """Index of the first record at or after t"""
+        return bisect.bisect_left(_Times(self), t)
+
+    def records(self, since=None, until=None):
+        """Yield records with since <= time < until"""
+        start = 0 if since is None else self.index(since)
+        end = self.count if until is None else self.index(until)
+        record = self.record
+        for i in range(start, end):
+            yield unpack_record(self.data, HEADER.size + i * record.size, record)
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        self.file.close()
+
+
+class _Times:
+    """Sequence view of record timestamps for bisect"""
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def __len__(self):
+        return len(self.reader)
+
+    def __getitem__(self, i):
+        return self.reader.time_at(i)
+
+
+def pick_tier(since, until, now=None):
+    """Pick the finest tier whose retention covers since and whose size suits the range"""
+    now = time.time() if now is None else now
+    since = now - 3600 if since is None else since
+    until = now if until is None else until
+    span = until - since
+    for name, (seconds, retention) in TIERS.items():
+        if retention is not None and since < now - retention:
+            continue
+        # Keep results to a few thousand rows
+        if span / max(seconds, 2.0) <= 5000:
+            return name
+    return list(TIERS)[-1]
+
+
+def parse_time(text, now=None):
+    """Parse an epoch, an ISO date/time or a relative age like 90s, 30m, 6h or 7d"""
+    if text is None:
+        return None
+    now = time.time() if now is None else now
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+    if text[-1:] in units:
+        try:
+            return now - float(text[:-1]) * units[text[-1]]
+        except ValueError:
+            pass
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    from datetime import datetime
+    return datetime.fromisoformat(text).timestamp()
+
+
+def export(records, fmt, out):
+    """Write records as csv, json or a text table"""
+    if fmt == 'csv':
+        import csv
+        writer = csv.writer(out)
+        writer.writerow(FIELDS)
+        for record in records:
+            writer.writerow(['' if record[f] is None else record[f] for f in FIELDS])
+    elif fmt == 'json':
+        import json
+        out.write('[')
+        for i, record in enumerate(records):
+            out.write(',\n' if i else '\n')
+            out.write(json.dumps(record))
+        out.write('\n]\n')
+    else:
+        from datetime import datetime
+        for record in records:
+            when = datetime.fromtimestamp(record['time']).strftime('%Y-%m-%d %H:%M:%S')
+            temp = f"{record['temp']:5.1f}°C" if record['temp'] is not None else "  --°C"
+            power = f"{record['power']:5.1f}W" if record['power'] is not None else "  -- W"
+            pwm = f"{record['pwm_cpu']:3.0f}" if record['pwm_cpu'] is not None else "---"
+            supply = {True: "  AC", False: "", None: ""}[record['ac']]
+            out.write(f"{when}  {temp}  {power}  PWM {pwm}  {record['policy']:<11} "
+                      f"GPU {record['gpu_status']}{supply}\n")
+
+
+def query(directory, since=None, until=None, tier='auto'):
+    """Return the records of one tier in [since, until)"""
+    if tier == 'auto':
+        tier = pick_tier(since, until)
+    reader = TelemetryReader(os.path.join(directory, f'{tier}.g14t'))
+    try:
+        return list(reader.records(since, until))
+    finally:
+        reader.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the G14 telemetry store")
+    parser.add_argument('--dir', default=TELEMETRY_DIR,
+                        help="telemetry directory (default %(default)s)")
+    parser.add_argument('--since', default='1h',
+                        help="start as epoch, ISO time or age like 30m, 6h, 7d (default %(default)s)")
+    parser.add_argument('--until', help="end, same formats as --since (default now)")
+    parser.add_argument('--tier', choices=['auto'] + list(TIERS), default='auto',
+                        help="resolution to read (default picks one for the range)")
+    parser.add_argument('--format', choices=('text', 'csv', 'json'), default='text',
+                        help="output format (default %(default)s)")
+    parser.add_argument('-o', '--output', help="write to a file instead of stdout")
+    args = parser.parse_args(argv)
+
+    try:
+        since = parse_time(args.since)
+        until = parse_time(args.until)
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        records = query(args.dir, since, until, args.tier)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read telemetry: {e}", file=sys.stderr)
+        return 1
+
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            export(records, args.format, f)
+    else:
+        export(records, args.format, sys.stdout)
+    return 0
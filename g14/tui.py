@@ -0,0 +1,273 @@
+"""Curses live monitor
+
+Replaces the generated g14-live-monitor.sh, which forked sensors, a dozen
+cats, bc, ps, systemctl and journalctl on every redraw. Readings come from
+the daemon's shared snapshot or the in-process Sampler, process CPU from
+ProcSampler, and the service log from a single long-running
+`journalctl -f` whose output is read as it arrives. Only rows whose text
+changed are redrawn.
+"""
+import curses
+import fcntl
+import heapq
+import os
+import select
+import signal
+import subprocess
+import sys
+import time
+from collections import deque
+
+from g14.history import History, sparkline
+from g14.procs import ProcSampler
+from g14.sampler import Sampler
+from g14.shm import SnapshotReader
+
+SERVICE = 'aggressive-fan-control.service'
+INTERVAL = 2.0
+JOURNAL_LINES = 8
+TOP_PROCESSES = 5
+# systemctl is-active is still a fork, so it is checked rarely
+STATUS_INTERVAL = 30.0
+
+
+class JournalFollower:
+    """Tails a unit's journal through one journalctl -f process"""
+
+    def __init__(self, unit=SERVICE, lines=JOURNAL_LINES):
+        self.lines = deque(maxlen=lines)
+        self.partial = b''
+        self.error = None
+        try:
+            self.process = subprocess.Popen(
+                ['journalctl', '-u', unit, '-f', '-n', str(lines), '-o', 'short', '--no-pager'],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL)
+        except OSError as e:
+            self.process = None
+            self.error = f"journalctl unavailable: {e.strerror}"
+            return
+        fd = self.process.stdout.fileno()
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+    def fileno(self):
+        return self.process.stdout.fileno()
+
+    @property
+    def alive(self):
+        return self.process is not None and self.error is None
+
+    def read(self):
+        """Consume whatever journalctl has written, return True if lines were added"""
+        try:
+            data = os.read(self.fileno(), 65536)
+        except BlockingIOError:
+            return False
+        if not data:
+            self.process.wait()
+            self.error = ("journal not readable, add yourself to the systemd-journal group"
+                          if self.process.returncode else "journalctl exited")
+            return True
+        *complete, self.partial = (self.partial + data).split(b'\n')
+        for line in complete:
+            self.lines.append(line.decode(errors='replace'))
+        return bool(complete)
+
+    def close(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+
+
+def service_status(unit=SERVICE):
+    try:
+        result = subprocess.run(['systemctl', 'is-active', unit],
+                                capture_output=True, text=True, timeout=2)
+    except (OSError, subprocess.TimeoutExpired):
+        return 'unknown'
+    return result.stdout.strip() or 'unknown'
+
+
+def _poke(fd):
+    try:
+        os.write(fd, b'\0')
+    except BlockingIOError:
+        # A wakeup is already pending
+        pass
+
+
+class LiveMonitor:
+    """Renders snapshots to a curses window, one row at a time"""
+
+    def __init__(self, screen, sampler=None, interval=INTERVAL, unit=SERVICE):
+        self.screen = screen
+        self.sampler = sampler or Sampler(shared=SnapshotReader())
+        self.paths = self.sampler.paths
+        self.procs = ProcSampler(os.path.join(self.paths.root, 'proc'))
+        self.history = History()
+        self.interval = interval
+        self.unit = unit
+        self.journal = JournalFollower(unit)
+        self.status = None
+        self.status_time = None
+        self.snapshot = None
+        self.top = []
+        self.rows = []
+        # Screen size of the last frame
+        self.size = None
+        self.frames = 0
+        self.rows_drawn = 0
+
+    def sample(self):
+        snapshot = self.sampler.sample()
+        if self.snapshot is None or snapshot.time != self.snapshot.time:
+            self.history.append(snapshot)
+        self.snapshot = snapshot
+        busiest = heapq.nlargest(TOP_PROCESSES, self.procs.sample(), key=lambda item: item[2])
+        self.top = [(pid, self.procs.name(pid, comm), percent) for pid, comm, percent in busiest]
+        now = time.monotonic()
+        if self.status_time is None or now - self.status_time >= STATUS_INTERVAL:
+            self.status = service_status(self.unit)
+            self.status_time = now
+
+    def trend(self, field, width, low=None, high=None):
+        values = [value for _, value in self.history.values(field, limit=width)]
+        return sparkline(values, low, high)
+
+    def render(self, width):
+        """Return the screen as a list of lines"""
+        s = self.snapshot
+        spark = max(10, width - 32)
+        lines = [
+            f"=== G14 LIVE MONITOR ===  {s.time.strftime('%H:%M:%S')}   (q to quit)",
+            f"Service: {self.unit} {self.status}",
+            "",
+        ]
+
+        temp = f"{s.temp:.1f}°C" if s.temp is not None else "N/A"
+        lines.append(f"Temperature: {temp:<12} {self.trend('temp', spark, 40, 95)}")
+        for label, value, field in (("CPU PWM", s.pwm_cpu, 'pwm_cpu'), ("GPU PWM", s.pwm_gpu, 'pwm_gpu')):
+            if value is not None:
+                text = f"{value}/255 ({value * 100 // 255}%)"
+            else:
+                text = "N/A"
+            lines.append(f"{label + ':':<13}{text:<18} {self.trend(field, spark - 6, 0, 255)}")
+        power = f"{s.power:.2f}W" if s.power is not None else "N/A"
+        lines.append(f"Power Draw:  {power:<12} {self.trend('power', spark, 0)}")
+        fan = f"{s.fan_rpm} RPM" if s.fan_rpm is not None else "N/A"
+        lines.append(f"CPU Fan:     {fan}")
+        lines.append(f"GPU Status:  {s.gpu_status}   GPU Control: {s.gpu_control}")
+        lines.append(f"Policy:      {s.policy}   Platform: {s.platform}")
+        boost = {True: 'on', False: 'off', None: 'N/A'}[s.boost]
+        lines.append(f"CPU Boost:   {boost}")
+        lines.append("")
+
+        lines.append("--- Top CPU Processes ---")
+        if self.top:
+            for pid, name, percent in self.top:
+                lines.append(f"{pid:>7} {percent:5.1f}%  {name}")
+        else:
+            lines.append("(measuring)")
+        lines.append("")
+
+        lines.append("--- Recent Service Logs ---")
+        lines.extend(self.journal.lines)
+        if self.journal.error:
+            lines.append(self.journal.error)
+        return lines
+
+    def draw(self):
+        """Rewrite only the rows whose text changed since the last frame"""
+        height, width = self.size = self.screen.getmaxyx()
+        lines = [line[:width - 1] for line in self.render(width)[:height]]
+        for y in range(max(len(lines), len(self.rows))):
+            line = lines[y] if y < len(lines) else ''
+            if y < len(self.rows) and self.rows[y] == line:
+                continue
+            self.screen.move(y, 0)
+            self.screen.clrtoeol()
+            self.screen.addstr(y, 0, line)
+            self.rows_drawn += 1
+        self.rows = lines
+        self.frames += 1
+        self.screen.refresh()
+
+    def run(self):
+        try:
+            curses.curs_set(0)
+        except curses.error:
+            pass
+        self.screen.nodelay(True)
+        # SIGWINCH pokes a pipe so a resize wakes the select below, curses'
+        # own KEY_RESIZE only shows up once stdin is readable
+        wake, poke = os.pipe()
+        os.set_blocking(wake, False)
+        os.set_blocking(poke, False)
+        previous = signal.signal(signal.SIGWINCH, lambda *args: _poke(poke))
+        try:
+            return self._loop(wake)
+        finally:
+            signal.signal(signal.SIGWINCH, signal.SIG_DFL if previous is None else previous)
+            os.close(wake)
+            os.close(poke)
+
+    def _loop(self, wake):
+        next_sample = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now >= next_sample:
+                self.sample()
+                self.draw()
+                next_sample = now + self.interval
+            readers = [sys.stdin, wake]
+            if self.journal.alive:
+                readers.append(self.journal)
+            ready, _, _ = select.select(readers, [], [], max(0.0, next_sample - time.monotonic()))
+            if wake in ready:
+                try:
+                    os.read(wake, 64)
+                except BlockingIOError:
+                    pass
+                self.resize()
+            if self.journal in ready and self.journal.read():
+                self.draw()
+            # nodelay, so this stops at -1 once the input is drained
+            key = self.screen.getch()
+            while key != -1:
+                if key in (ord('q'), ord('Q'), 27):
+                    return 0
+                if key == curses.KEY_RESIZE:
+                    self.resize()
+                key = self.screen.getch()
+
+    def resize(self):
+        """Take on the terminal's new size and redraw every row"""
+        try:
+            size = os.get_terminal_size(sys.__stdout__.fileno())
+        except OSError:
+            pass
+        else:
+            if (size.lines, size.columns) != self.screen.getmaxyx():
+                # Queues a KEY_RESIZE, which finds the size already drawn
+                curses.resizeterm(size.lines, size.columns)
+        if self.screen.getmaxyx() == self.size:
+            return
+        self.screen.clear()
+        self.rows = []
+        self.draw()
+
+    def close(self):
+        self.journal.close()
+        self.sampler.close()
+
+
+def main(interval=INTERVAL, unit=SERVICE):
+    def run(screen):
+        monitor = LiveMonitor(screen, interval=interval, unit=unit)
+        try:
+            return monitor.run()
+        finally:
+            monitor.close()
+    try:
+        return curses.wrapper(run)
+    except KeyboardInterrupt:
+        return 0
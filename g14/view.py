@@ -0,0 +1,113 @@
+"""Tray view model
+
+Every GTK set_label or set_tooltip_text queues a resize and relayout,
+even when the text is unchanged. StatusView turns a Snapshot into the
+tray's strings and calls each setter only when its text differs from the
+last one it set. The tooltip is all that is visible while the menu is
+closed, so the menu labels are only rendered while it is open, and once
+more just before it pops up.
+"""
+from g14.history import sparkline
+
+# Menu item keys, in menu order
+ITEMS = ('temp', 'pwm_cpu', 'pwm_gpu', 'power', 'gpu', 'policy')
+
+# Temperatures the traffic-light icon changes at
+ICON_STEPS = ((50, "🟢"), (65, "🟡"), (75, "🟠"))
+
+# Fixed scale of the tooltip's temperature trend, about 8°C per sparkline
+# level, so a degree of Tctl jitter doesn't change the tooltip text
+TREND_LOW = 40
+TREND_HIGH = 95
+
+
+def temp_icon(temp):
+    """Return an emoji for the temperature"""
+    if temp is None:
+        return "❓"
+    for limit, icon in ICON_STEPS:
+        if temp < limit:
+            return icon
+    return "🔴"
+
+
+def _pwm(label, pwm):
+    if pwm is None:
+        return f"{label} PWM: ---"
+    return f"{label} PWM: {pwm}/255 ({pwm * 100 // 255}%)"
+
+
+def render_tooltip(snapshot, trend):
+    """Tooltip text for a snapshot and the recent temperatures"""
+    temp = snapshot.temp
+    text = f"G14 Monitor\n{temp_icon(temp)} {'--' if temp is None else f'{temp:.0f}'}°C"
+    if len(trend) > 1:
+        text += f" {sparkline(trend, TREND_LOW, TREND_HIGH)}"
+    if snapshot.pwm_cpu is not None:
+        text += f"\nCPU PWM: {snapshot.pwm_cpu}/255"
+    return text
+
+
+def render_items(snapshot):
+    """Menu label of each item in ITEMS"""
+    temp = snapshot.temp
+    power = snapshot.power
+    gpu_icon = "⚡" if snapshot.gpu_status == "active" else "💤"
+    return {
+        'temp': "Temp: --°C" if temp is None else f"Temp: {temp:.1f}°C {temp_icon(temp)}",
+        'pwm_cpu': _pwm("CPU", snapshot.pwm_cpu),
+        'pwm_gpu': _pwm("GPU", snapshot.pwm_gpu),
+        'power': "Power: -- W" if power is None else f"Power: {power:.1f}W",
+        'gpu': f"GPU: {snapshot.gpu_status} {gpu_icon} (click to force sleep)",
+        'policy': f"Policy: {snapshot.policy} (click to cycle)",
+    }
+
+
+class CachedText:
+    """A text setter that is only called when the text changes"""
+    __slots__ = ('setter', 'text')
+
+    def __init__(self, setter):
+        self.setter = setter
+        self.text = None
+
+    def set(self, text):
+        """Call the setter if text is new, return True if it was called"""
+        if text == self.text:
+            return False
+        self.setter(text)
+        self.text = text
+        return True
+
+
+class StatusView:
+    """The tray's tooltip and status labels, pushed to GTK only on change"""
+
+    def __init__(self, tooltip, items):
+        self.tooltip = CachedText(tooltip)
+        self.items = {key: CachedText(items[key]) for key in ITEMS}
+        self.snapshot = None
+        self.trend = ()
+        self.updates = 0
+        self.unchanged = 0
+
+    def _set(self, text, value):
+        if text.set(value):
+            self.updates += 1
+        else:
+            self.unchanged += 1
+
+    def update(self, snapshot, trend, menu_open):
+        """Show a new snapshot, the menu labels only if the menu is open"""
+        self.snapshot = snapshot
+        self.trend = trend
+        self._set(self.tooltip, render_tooltip(snapshot, trend))
+        if menu_open:
+            self.render_menu()
+
+    def render_menu(self):
+        """Bring the menu labels up to date with the last snapshot"""
+        if self.snapshot is None:
+            return
+        for key, value in render_items(self.snapshot).items():
+            self._set(self.items[key], value)
@@ -0,0 +1,68 @@
+"""Background jobs for slow collectors
+
+Fan event logging and state captures fork ps and sensors, read dozens of
+sysfs files and write to disk. BackgroundJobs runs them on a small thread
+pool and hands the result back through a dispatch function (GLib.idle_add
+in the tray) so callbacks always run on the UI thread. Only one job per
+key is in flight at a time; triggers that arrive while it runs are folded
+into it.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = 2
+
+
+class BackgroundJobs:
+    """A thread pool that runs at most one job per key at a time"""
+
+    def __init__(self, dispatch, max_workers=MAX_WORKERS):
+        self.dispatch = dispatch
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='g14-worker')
+        self.lock = threading.Lock()
+        self.in_flight = set()
+        self.completed = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    def busy(self, key):
+        with self.lock:
+            return key in self.in_flight
+
+    def submit(self, key, fn, *args, callback=None):
+        """Run fn(*args) in the background, then callback(result, error) on the UI thread
+
+        Returns False without running anything if a job with the same key
+        is still in flight.
+        """
+        with self.lock:
+            if key in self.in_flight:
+                self.coalesced += 1
+                return False
+            self.in_flight.add(key)
+        self.executor.submit(self._run, key, fn, args, callback)
+        return True
+
+    def _run(self, key, fn, args, callback):
+        result = error = None
+        try:
+            result = fn(*args)
+        except Exception as e:
+            error = e
+        self.dispatch(self._finish, key, callback, result, error)
+
+    def _finish(self, key, callback, result, error):
+        with self.lock:
+            self.in_flight.discard(key)
+            if error is None:
+                self.completed += 1
+            else:
+                self.failed += 1
+        if callback is not None:
+            callback(result, error)
+        # One-shot when dispatched through GLib.idle_add
+        return False
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
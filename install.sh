@@ -16,9 +16,14 @@ sudo apt update
 sudo apt install -y python3-gi gir1.2-appindicator3-0.1 gir1.2-notify-0.7 lm-sensors
 
 echo "Installing scripts..."
-cp nuclear-fan-control-v2.sh ~/
+cp g14-fan-daemon.py ~/
 cp g14-monitor.py ~/
-chmod +x ~/nuclear-fan-control-v2.sh ~/g14-monitor.py
+cp g14-telemetry.py ~/
+cp g14-helper.py ~/
+cp g14-curvesim.py ~/
+cp g14-energy.py ~/
+cp -r g14 ~/
+chmod +x ~/g14-fan-daemon.py ~/g14-monitor.py ~/g14-telemetry.py ~/g14-helper.py ~/g14-curvesim.py ~/g14-energy.py
 
 echo "Blacklisting nouveau..."
 echo "blacklist nouveau" | sudo tee /etc/modprobe.d/blacklist-nouveau.conf
@@ -36,7 +41,7 @@ After=multi-user.target
 
 [Service]
 Type=simple
-ExecStart=/home/$USER/nuclear-fan-control-v2.sh
+ExecStart=/home/$USER/g14-fan-daemon.py
 Restart=always
 User=root
 
@@ -44,9 +49,27 @@ User=root
 WantedBy=multi-user.target
 SERVICEEOF
 
+echo "Creating tray write helper service..."
+sudo tee /etc/systemd/system/g14-helper.service << HELPEREOF
+[Unit]
+Description=ASUS G14 sysfs write helper for the tray monitor
+After=multi-user.target
+
+[Service]
+Type=simple
+ExecStart=/home/$USER/g14-helper.py --allow-user $USER
+Restart=always
+User=root
+
+[Install]
+WantedBy=multi-user.target
+HELPEREOF
+
 sudo systemctl daemon-reload
 sudo systemctl enable aggressive-fan-control.service
 sudo systemctl start aggressive-fan-control.service
+sudo systemctl enable g14-helper.service
+sudo systemctl start g14-helper.service
 
 echo "Setting up system tray monitor..."
 mkdir -p ~/.config/autostart
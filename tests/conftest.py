@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from g14 import fakesys  # noqa: E402
+from g14.paths import probe  # noqa: E402
+
+
+@pytest.fixture
+def root(tmp_path):
+    """A fresh fake sysfs tree"""
+    return fakesys.build(str(tmp_path / 'root'))
+
+
+@pytest.fixture
+def paths(root):
+    return probe(root)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read().strip()
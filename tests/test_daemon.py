@@ -0,0 +1,48 @@
+import pytest
+
+from g14 import fakesys
+from g14.daemon import FanDaemon
+from g14.metrics import Metrics
+from g14.sampler import Sampler
+
+from conftest import read
+
+
+@pytest.fixture(params=['snapshot', 'registry'])
+def daemon(request, paths):
+    # With metrics on every tick samples a snapshot, without it polls the registry
+    metrics = Metrics() if request.param == 'snapshot' else None
+    daemon = FanDaemon(sampler=Sampler(paths), metrics=metrics)
+    yield daemon
+    daemon.close()
+
+
+def test_unchanged_values_are_not_rewritten(root, paths, daemon):
+    fakesys.set_temp(root, 45)
+    for _ in range(3):
+        daemon.tick()
+    assert daemon.stats() == (0, 6, 0)
+    assert read(paths.throttle_policy) == '2'
+
+
+def test_outside_changes_are_restored(root, paths, daemon):
+    fakesys.set_temp(root, 45)
+    daemon.tick()
+    fakesys.set_value(root, 'throttle_policy', '1')
+    fakesys.set_value(root, 'platform_profile', 'performance')
+    fakesys.set_value(root, 'gpu_control', 'on')
+    # As an event or the sensors' cadence would
+    daemon.sampler.registry.expire()
+    daemon.tick()
+    assert read(paths.throttle_policy) == '2'
+    assert read(paths.platform_profile) == 'quiet'
+    assert read(paths.gpu_control) == 'auto'
+    assert daemon.stats()[0] == 3
+
+
+def test_policy_follows_temperature(root, paths, daemon):
+    fakesys.set_temp(root, 85)
+    for _ in range(3):
+        daemon.sampler.registry.expire()
+        daemon.tick()
+    assert read(paths.throttle_policy) != '2'
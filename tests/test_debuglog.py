@@ -0,0 +1,27 @@
+from g14.debuglog import DebugLog
+
+
+def test_flush_waits_for_the_writer(tmp_path):
+    path = tmp_path / 'debug.log'
+    log = DebugLog(str(path))
+    try:
+        for i in range(500):
+            log.write(f"record {i}\n")
+        assert log.flush()
+        assert path.read_text().count('\n') == 500
+        assert not log._dirty
+    finally:
+        log.close()
+
+
+def test_clear_then_header(tmp_path):
+    path = tmp_path / 'debug.log'
+    path.write_text("old\n")
+    log = DebugLog(str(path))
+    try:
+        log.clear("header\n")
+        log.write("new\n")
+        assert log.flush()
+        assert path.read_text() == "header\nnew\n"
+    finally:
+        log.close()
@@ -0,0 +1,96 @@
+import io
+import json
+import os
+
+import pytest
+
+from g14 import telemetry
+from g14.energy import EnergyMeter, meter_records, report, rows
+from g14.sampler import Sampler
+
+
+def test_meter_integrates_per_state():
+    meter = EnergyMeter()
+    state = ('battery', 'balanced', 'balanced', 'suspended')
+    meter.add(0.0, 10.0, state)
+    meter.add(2.0, 20.0, state)
+    meter.add(4.0, 8.0, ('battery', 'silent', 'quiet', 'suspended'))
+    assert meter.states[state] == [2.0, 30.0]
+    assert meter.states[('battery', 'silent', 'quiet', 'suspended')] == [2.0, 16.0]
+
+
+def test_meter_leaves_gaps_and_failed_readings_unmetered():
+    meter = EnergyMeter(max_gap=30.0)
+    state = ('battery', 'balanced', 'balanced', 'active')
+    meter.add(0.0, 10.0, state)
+    meter.add(60.0, 10.0, state)
+    meter.add(62.0, None, state)
+    assert meter.states == {}
+    assert meter.unmetered == 62.0
+
+
+def test_report_ranks_battery_time_only():
+    meter = EnergyMeter()
+    battery = ('battery', 'turbo', 'performance', 'active')
+    ac = ('ac', 'turbo', 'performance', 'active')
+    meter.add(0.0, 30.0, battery)
+    meter.add(10.0, 30.0, battery)
+    meter.add(20.0, 60.0, ac)
+    meter.add(30.0, 60.0, ac)
+
+    ranked = rows(meter, 'policy')
+    assert ranked == [{'policy': 'turbo', 'seconds': 10.0, 'share': 1.0, 'wh': 0.083, 'watts': 30.0}]
+    assert rows(meter, 'policy', supplies=('ac',))[0]['watts'] == 60.0
+
+    out = io.StringIO()
+    report(meter, 'state', 'watts', 'json', out)
+    data = json.loads(out.getvalue())
+    assert data['seconds'] == 10.0
+    assert data['excluded_seconds'] == {'ac': 20.0}
+
+    out = io.StringIO()
+    report(meter, 'state', 'watts', 'text', out)
+    assert "on AC left out" in out.getvalue()
+
+
+def test_snapshots_record_the_supply(tmp_path, paths):
+    sampler = Sampler(paths)
+    assert sampler.sample().ac is False
+    store = telemetry.TelemetryStore(str(tmp_path / 'telemetry'))
+    store.append(sampler.sample())
+    store.close()
+    records = list(telemetry.query(str(tmp_path / 'telemetry'), 0, None, 'raw'))
+    assert records[0]['ac'] is False
+    meter = meter_records(records + [dict(records[0], time=records[0]['time'] + 2)])
+    assert list(meter.states) == [('battery',) + tuple(
+        records[0][name] for name in ('policy', 'platform', 'gpu_status'))]
+
+
+def test_version_1_files_are_upgraded(tmp_path):
+    directory = tmp_path / 'telemetry'
+    directory.mkdir()
+    old = telemetry.RECORDS[1]
+    path = directory / 'raw.g14t'
+    with open(path, 'wb') as f:
+        f.write(telemetry.HEADER.pack(telemetry.MAGIC, 1, old.size, 0))
+        for t in (100.0, 102.0):
+            f.write(old.pack(t, 40.0, 10.0, 2000.0, 50.0, 60.0, 1, 2, 3, 0))
+
+    store = telemetry.TelemetryStore(str(directory))
+    store.close()
+    records = list(telemetry.query(str(directory), 0, None, 'raw'))
+    assert [r['time'] for r in records] == [100.0, 102.0]
+    assert [r['ac'] for r in records] == [None, None]
+    assert os.path.getsize(path) == telemetry.HEADER.size + 2 * telemetry.RECORD.size
+    meter = meter_records(records)
+    assert [state[0] for state in meter.states] == ['unknown']
+    assert rows(meter) == []
+
+
+@pytest.mark.parametrize('supply', ('all', 'battery'))
+def test_cli_supply_choice(tmp_path, capsys, supply):
+    from g14.energy import main
+    directory = tmp_path / 'telemetry'
+    telemetry.TelemetryStore(str(directory)).close()
+    assert main(['--dir', str(directory), '--since', '0', '--supply', supply]) == 0
+    assert "No power samples" in capsys.readouterr().out
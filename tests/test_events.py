@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+
+import pytest
+
+from g14 import fakesys
+from g14.controller import PolicyController
+from g14.daemon import FanDaemon
+from g14.events import EventSource, NOTIFYING, parse_uevent
+from g14.sampler import Sampler
+
+from conftest import read
+
+GPU_DEVPATH = '/devices/pci0000:00/0000:00:01.1/0000:01:00.0'
+
+
+@pytest.fixture
+def events(paths):
+    events = EventSource(paths)
+    yield events
+    events.close()
+
+
+def later(action, *args, delay=0.05):
+    timer = threading.Timer(delay, action, args)
+    timer.start()
+    return timer
+
+
+def timed_wait(events, timeout=2.0):
+    started = time.monotonic()
+    changed = events.wait(timeout)
+    return changed, time.monotonic() - started
+
+
+def test_notifying_attributes_and_uevents_are_watched(events):
+    assert events.notified == {'platform_profile', 'throttle_policy'}
+    # The runtime PM status never notifies, not even in the fake tree
+    assert 'gpu_runtime_status' in events.polled
+    assert events.uevents is not None
+
+
+@pytest.mark.parametrize('name, value', [
+    ('platform_profile', 'performance'),
+    ('throttle_policy', '1'),
+])
+def test_attribute_write_wakes_the_wait(root, events, name, value):
+    later(fakesys.set_value, root, name, value)
+    changed, waited = timed_wait(events)
+    assert changed == {name}
+    assert waited < 1.0
+
+
+def test_ac_plug_uevent(root, events):
+    later(fakesys.plug, root, True)
+    changed, waited = timed_wait(events)
+    assert changed == {'power_now', 'ac_online'}
+    assert waited < 1.0
+    assert events.uevent_count == 1
+
+
+def test_dgpu_uevent(root, events):
+    later(fakesys.uevent, root, 'change', GPU_DEVPATH, 'pci')
+    changed, _ = timed_wait(events)
+    assert changed == {'gpu_runtime_status', 'gpu_control'}
+
+
+def test_unrelated_uevents_are_ignored(root, events):
+    assert fakesys.uevent(root, 'add', '/devices/pci0000:00/0000:00:08.1/0000:05:00.3', 'pci') == 1
+    assert fakesys.uevent(root, 'change', '/devices/virtual/net/lo', 'net') == 1
+    assert events.wait(0.2) == set()
+    assert events.uevent_count == 0
+
+
+def test_runtime_pm_change_is_polled(root, events):
+    assert events.poll() == set()
+    fakesys.wake_gpu(root)
+    assert events.poll() == {'gpu_runtime_status'}
+    # Only once per change
+    assert events.poll() == set()
+    assert events.poll_changes == 1
+
+
+def test_wait_leaves_polled_attributes_to_the_caller(root, events):
+    fakesys.wake_gpu(root)
+    changed, waited = timed_wait(events, 0.3)
+    assert changed == set()
+    assert waited >= 0.25
+    assert events.poll() == {'gpu_runtime_status'}
+
+
+def test_wait_times_out_without_changes(events):
+    changed, waited = timed_wait(events, 0.2)
+    assert changed == set()
+    assert 0.15 <= waited < 1.0
+
+
+def test_each_listener_gets_uevents(root, paths, events):
+    other = EventSource(paths)
+    try:
+        assert fakesys.plug(root, False) == 2
+        assert events.wait(1.0) == {'power_now', 'ac_online'}
+        assert other.wait(1.0) == {'power_now', 'ac_online'}
+    finally:
+        other.close()
+
+
+def test_close_removes_the_stand_in_socket(events):
+    path = events.uevents.path
+    assert os.path.exists(path)
+    events.close()
+    assert not os.path.exists(path)
+
+
+def test_parse_uevent_skips_udev_messages():
+    assert parse_uevent(b'libudev\0\xfe\xed\xca\xfe') is None
+    env = parse_uevent(b'change@/devices/x\0ACTION=change\0SUBSYSTEM=power_supply\0')
+    assert env == {'ACTION': 'change', 'SUBSYSTEM': 'power_supply'}
+
+
+def test_daemon_restores_a_profile_changed_under_it(root, paths, events):
+    daemon = FanDaemon(sampler=Sampler(paths), events=events)
+    try:
+        fakesys.set_temp(root, 45)
+        daemon.tick()
+        later(fakesys.set_value, root, 'platform_profile', 'performance')
+        started = time.monotonic()
+        assert daemon.wait(started, 10.0) == {'platform_profile'}
+        assert time.monotonic() - started < 1.0
+        daemon.tick()
+        assert read(paths.platform_profile) == 'quiet'
+        assert daemon.event_ticks == 1
+    finally:
+        daemon.events = None
+        daemon.close()
+
+
+def test_daemon_ignores_notifications_of_its_own_writes(root, paths):
+    events = EventSource(paths, watch=NOTIFYING)
+    daemon = FanDaemon(sampler=Sampler(paths), policy=PolicyController(min_dwell=0), events=events)
+    try:
+        assert not events.polled
+        fakesys.set_temp(root, 45)
+        daemon.tick()
+        fakesys.set_temp(root, 85)
+        daemon.sampler.registry.invalidate('temp')
+        writes = daemon.stats()[0]
+        daemon.tick()
+        assert daemon.stats()[0] > writes
+        started = time.monotonic()
+        assert daemon.wait(started, 0.3) == set()
+        assert time.monotonic() - started >= 0.25
+        assert daemon.event_ticks == 0
+    finally:
+        daemon.close()
+        events.close()
@@ -0,0 +1,95 @@
+import os
+import threading
+
+import pytest
+
+from g14.fakesys import set_value
+from g14.helper import HelperClient, HelperError, HelperServer
+
+from conftest import read
+
+
+@pytest.fixture
+def server(tmp_path, paths):
+    server = HelperServer(str(tmp_path / 'helper.sock'), paths)
+    server.listen()
+    server.running = True
+
+    def serve():
+        while server.running:
+            server.poll(0.05)
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    yield server
+    server.running = False
+    thread.join()
+    server.close()
+
+
+@pytest.fixture
+def client(server):
+    client = HelperClient(server.path)
+    yield client
+    client.close()
+
+
+# Written values are no shorter than the fake tree's, a regular file keeps
+# the bytes past a shorter pwrite where sysfs would not
+
+def test_write_goes_through_and_is_read_back(root, paths, client):
+    assert client.write('throttle_policy', '1') == '1'
+    assert read(paths.throttle_policy) == '1'
+    set_value(root, 'platform_profile', 'cool')
+    assert client.write('platform_profile', 'quiet') == 'quiet'
+    assert read(paths.platform_profile) == 'quiet'
+    assert client.read('gpu_control') == read(paths.gpu_control)
+
+
+@pytest.mark.parametrize('line', [
+    'write throttle_policy 3',
+    'write gpu_control off',
+    'write gpu_control on',
+    'write platform_profile performance',
+    'write cpu_boost 1',
+    'write platform_profile ../../etc/passwd',
+    'write tctl 100000',
+    'write power_now 1',
+    'read tctl',
+    'read /etc/shadow',
+    'write throttle_policy',
+    'write throttle_policy 1 2',
+    'unlink throttle_policy',
+    '',
+])
+def test_requests_outside_the_whitelist_are_refused(paths, line):
+    server = HelperServer('/nonexistent', paths)
+    before = read(paths.throttle_policy)
+    assert server.handle(line).startswith('error ')
+    assert server.refused == 1
+    assert read(paths.throttle_policy) == before
+    assert not server.attrs
+
+
+def test_refused_value_over_the_socket(paths, client):
+    with pytest.raises(HelperError, match='refusing'):
+        client.write('throttle_policy', '7')
+    assert read(paths.throttle_policy) == '2'
+
+
+def test_connection_from_other_uid_is_refused(paths, server, client):
+    # Root is always allowed, so allow nobody to be refused as whoever we are
+    server.allowed_uids = set()
+    # The connection is closed before or while the request is sent
+    with pytest.raises((HelperError, OSError)):
+        client.write('throttle_policy', '1')
+    assert read(paths.throttle_policy) == '2'
+    assert server.requests == 0
+
+
+def test_socket_is_removed_on_close(tmp_path, paths):
+    server = HelperServer(str(tmp_path / 'helper.sock'), paths)
+    server.listen()
+    assert os.path.exists(server.path)
+    server.close()
+    assert not os.path.exists(server.path)
@@ -0,0 +1,100 @@
+import re
+import urllib.request
+
+import pytest
+
+from g14 import fakesys
+from g14.daemon import FanDaemon
+from g14.metrics import CONTENT_TYPE, Metrics, MetricsServer
+from g14.sampler import Sampler
+
+
+@pytest.fixture
+def metrics(root, paths):
+    metrics = Metrics()
+    daemon = FanDaemon(sampler=Sampler(paths), metrics=metrics)
+    fakesys.set_temp(root, 45)
+    for _ in range(3):
+        daemon.tick()
+    yield metrics
+    daemon.close()
+
+
+def samples(text):
+    """{'name{labels}': value} of every sample line"""
+    result = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            key, _, value = line.rpartition(' ')
+            result[key] = float(value)
+    return result
+
+
+def test_render_is_openmetrics(metrics):
+    text = metrics.render().decode()
+    assert text.endswith('# EOF\n')
+    assert text.count('# EOF') == 1
+    # Every sample belongs to a family declared before it
+    declared = set()
+    for line in text.splitlines():
+        match = re.match(r'# TYPE (\S+) (gauge|counter|stateset|histogram)$', line)
+        if match:
+            declared.add(match.group(1))
+        elif line and not line.startswith('#'):
+            name = re.match(r'[a-z_0-9]+', line).group(0)
+            assert any(name == family or name.startswith(family + '_') for family in declared), line
+
+
+def test_render_reflects_the_fake_tree(metrics):
+    values = samples(metrics.render().decode())
+    assert values['g14_tctl_celsius'] == 45.0
+    assert values['g14_power_watts'] == 12.5
+    assert values['g14_battery_capacity_percent'] == 80
+    assert values['g14_ccd_celsius{ccd="1"}'] == 42.0
+
+
+def test_statesets_have_exactly_one_state_set(metrics):
+    values = samples(metrics.render().decode())
+    for family in ('g14_throttle_policy', 'g14_gpu_runtime_status'):
+        states = {key: value for key, value in values.items() if key.startswith(family + '{')}
+        assert len(states) > 1
+        assert sum(states.values()) == 1
+    assert values['g14_throttle_policy{g14_throttle_policy="quiet"}'] == 1
+
+
+def test_counters(metrics):
+    values = samples(metrics.render().decode())
+    assert values['g14_ticks_total'] == 3
+    assert values['g14_sysfs_writes_total{result="written"}'] == 0
+    assert values['g14_sysfs_writes_total{result="skipped"}'] == 6
+    assert values['g14_sysfs_writes_total{result="error"}'] == 0
+
+
+def test_histogram_buckets_are_cumulative(metrics):
+    values = samples(metrics.render().decode())
+    name = 'g14_tick_duration_seconds'
+    buckets = [(key, value) for key, value in values.items() if key.startswith(name + '_bucket')]
+    counts = [value for _, value in buckets]
+    assert counts == sorted(counts)
+    assert buckets[-1][0] == name + '_bucket{le="+Inf"}'
+    assert counts[-1] == values[name + '_count'] == 3
+    assert values[name + '_sum'] > 0
+
+
+def test_render_is_cached_until_the_next_update(metrics):
+    first = metrics.render()
+    assert metrics.render() is first
+    metrics.update(metrics.snapshot, 4, 2.0, {}, (0, 0, 0))
+    assert metrics.render() is not first
+
+
+def test_server_on_loopback(metrics):
+    server = MetricsServer(metrics, 0)
+    server.start()
+    try:
+        host, port = server.address
+        with urllib.request.urlopen(f'http://{host}:{port}/metrics', timeout=5) as response:
+            assert response.headers['Content-Type'] == CONTENT_TYPE
+            assert response.read() == metrics.render()
+    finally:
+        server.close()
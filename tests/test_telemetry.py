@@ -0,0 +1,34 @@
+import time
+from datetime import datetime
+
+from g14 import telemetry
+from g14.sampler import Snapshot
+
+
+def snapshot(t, temp):
+    return Snapshot(datetime.fromtimestamp(t), temp, 3000, 80, 60, 12.5,
+                    'suspended', 'auto', 'silent', 'quiet', False, ac=False)
+
+
+def test_close_writes_the_buckets_still_filling(tmp_path):
+    directory = str(tmp_path)
+    now = time.time()
+    start = now - now % 60 - 120
+    store = telemetry.TelemetryStore(directory)
+    for i, temp in enumerate((40, 50, 60)):
+        store.append(snapshot(start + 2 * i, temp))
+    store.close()
+
+    minutes = list(telemetry.query(directory, 0, None, '1m'))
+    assert [r['time'] for r in minutes] == [start]
+    assert minutes[0]['temp'] == 50
+    assert minutes[0]['ac'] is False
+    assert len(list(telemetry.query(directory, 0, None, '1h'))) == 1
+
+    # The reopened bucket isn't written twice, the next one is
+    store = telemetry.TelemetryStore(directory)
+    store.append(snapshot(start + 10, 70))
+    store.append(snapshot(start + 60, 45))
+    store.close()
+    minutes = list(telemetry.query(directory, 0, None, '1m'))
+    assert [r['time'] for r in minutes] == [start, start + 60]
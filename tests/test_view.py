@@ -0,0 +1,30 @@
+import pytest
+
+from g14.sampler import Sampler
+from g14.view import ITEMS, StatusView, render_tooltip
+
+
+@pytest.fixture
+def snapshot(paths):
+    return Sampler(paths).sample()
+
+
+def test_tooltip_ignores_trend_jitter(snapshot):
+    steady = render_tooltip(snapshot, [60, 61, 60, 61, 60, 61])
+    assert render_tooltip(snapshot, [61, 60, 61, 60, 61, 60]) == steady
+    assert render_tooltip(snapshot, [60, 61, 60, 61, 60, 85]) != steady
+
+
+def test_view_only_sets_changed_text(snapshot):
+    tooltips = []
+    labels = {key: [] for key in ITEMS}
+    view = StatusView(tooltips.append, {key: labels[key].append for key in ITEMS})
+    view.update(snapshot, [60, 61], menu_open=False)
+    view.update(snapshot, [61, 60], menu_open=False)
+    assert len(tooltips) == 1
+    assert not any(labels.values())
+
+    view.update(snapshot, [60, 61], menu_open=True)
+    assert all(len(texts) == 1 for texts in labels.values())
+    view.render_menu()
+    assert all(len(texts) == 1 for texts in labels.values())